@@ -1,8 +1,13 @@
 # agent.py
 
-import io
-import contextlib
+import os
+import time
+import random
+import resource
+import threading
 import traceback
+import tracemalloc
+import numpy as np
 import pandas as pd
 import streamlit as st
 import matplotlib.pyplot as plt
@@ -12,64 +17,213 @@ import plotly.express as px
 # -------- OpenAI SDK --------
 from openai import OpenAI
 
+from llm_client import make_client
+import intent_model
+import telemetry
+from exec_capture import execution_scope
+from plot_helpers import plot_hist, plot_density, plot_line, plot_scatter
+from code_cache import CodeCache, make_key
+from semantic_cache import SemanticIndex
+from sketches import SketchView
+
 _client = None
+_code_cache = None
+_semantic_index = None
+
+# pandas >= 3 já usa copy-on-write sempre; no 2.x a opção precisa ser ligada
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+def get_code_cache() -> CodeCache:
+    """Cache de código gerado (memória + SQLite), criado sob demanda."""
+    global _code_cache
+    if _code_cache is None:
+        _code_cache = CodeCache()
+    return _code_cache
+
+def get_semantic_index() -> SemanticIndex:
+    """Índice de prompts parecidos por esquema (ver semantic_cache), criado sob demanda."""
+    global _semantic_index
+    if _semantic_index is None:
+        _semantic_index = SemanticIndex()
+    return _semantic_index
 
 # ================= Inicialização =================
 def initialize_openai_api(api_key: str):
-    """Inicializa o cliente da OpenAI com a chave fornecida."""
+    """Inicializa o cliente da OpenAI (pool persistente, ver llm_client) com a chave fornecida."""
+    use_openai_client(make_client(api_key))
+
+def use_openai_client(client: OpenAI):
+    """Passa a usar um cliente já criado (ex.: o cliente compartilhado do processo no app)."""
     global _client
-    _client = OpenAI(api_key=api_key)
+    _client = client
 
 # ================= Classificação de intenção =================
+INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get("EDA_INTENT_THRESHOLD", 0.9))
+INTENT_SHADOW_RATE = float(os.environ.get("EDA_INTENT_SHADOW_RATE", 0.0))  # fração de decisões locais conferidas no LLM
+
+_intent_stats = {"local": 0, "llm": 0, "compared": 0, "agree": 0}
+_intent_lock = threading.Lock()
+
+def intent_stats() -> dict:
+    """Contadores do classificador local: decisões locais, chamadas ao LLM e concordância."""
+    with _intent_lock:
+        out = dict(_intent_stats)
+    out["agreement"] = round(out["agree"] / out["compared"], 4) if out["compared"] else None
+    return out
+
+def _classify_intent_llm(user_prompt: str) -> str:
+    if _client is None:
+        raise RuntimeError("OpenAI client não inicializado.")
+
+    hint = (
+        "Classifique a intenção do usuário somente como 'analysis' ou 'chat'. "
+        "Use 'analysis' quando houver pedido para analisar dados, gerar gráfico ou código; "
+        "caso contrário, 'chat'. "
+        "Responda com apenas uma palavra: analysis ou chat."
+    )
+
+    out = _client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": hint},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.0,
+        max_tokens=4,
+    )
+    text = (out.choices[0].message.content or "").strip().lower()
+
+    if "analysis" in text and "chat" not in text:
+        return "analysis"
+    if "chat" in text and "analysis" not in text:
+        return "chat"
+
+    # fallback simples por palavras-chave
+    if any(
+        k in user_prompt.lower()
+        for k in [
+            "analis", "plot", "gráfico", "grafico", "describe", "correla",
+            "hist", "box", "scatter", "média", "media", "mediana", "moda",
+            "variância", "variancia", "desvio padrão", "std"
+        ]
+    ):
+        return "analysis"
+    return "chat"
+
+def local_intent(user_prompt: str):
+    """Só o classificador local: (rótulo, confiança, confiante?). Não registra nada no log."""
+    try:
+        label, confidence = intent_model.get_model().predict(user_prompt)
+    except Exception:
+        return None, 0.0, False
+    return label, confidence, confidence >= INTENT_CONFIDENCE_THRESHOLD
+
 def classify_intent(user_prompt: str) -> str:
     """
-    Usa IA para classificar intenção em "analysis" ou "chat".
-    Retorna exatamente "analysis" ou "chat"; em erro, retorna "chat" como fallback seguro.
+    Classifica intenção em "analysis" ou "chat".
+    Primeiro tenta o classificador local (intent_model); só consulta o LLM quando a
+    confiança fica abaixo de INTENT_CONFIDENCE_THRESHOLD. Cada decisão é registrada
+    no log de intenção (confiança, latência e concordância com o LLM).
+    Em erro, retorna "chat" como fallback seguro.
     """
-    try:
-        if _client is None:
-            raise RuntimeError("OpenAI client não inicializado.")
+    t0 = time.perf_counter()
+    with telemetry.span("intent.local") as sp:
+        try:
+            local_label, confidence = intent_model.get_model().predict(user_prompt)
+        except Exception:
+            local_label, confidence = None, 0.0
+        sp["confidence"] = round(confidence, 4)
+    local_ms = (time.perf_counter() - t0) * 1000
 
-        hint = (
-            "Classifique a intenção do usuário somente como 'analysis' ou 'chat'. "
-            "Use 'analysis' quando houver pedido para analisar dados, gerar gráfico ou código; "
-            "caso contrário, 'chat'. "
-            "Responda com apenas uma palavra: analysis ou chat."
-        )
+    record = {
+        "ts": time.time(),
+        "prompt": user_prompt,
+        "local_label": local_label,
+        "confidence": round(confidence, 4),
+        "local_ms": round(local_ms, 3),
+        "llm_label": None,
+        "llm_ms": None,
+    }
+    confident = local_label is not None and confidence >= INTENT_CONFIDENCE_THRESHOLD
+    shadow = confident and random.random() < INTENT_SHADOW_RATE
 
-        out = _client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": hint},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.0,
-            max_tokens=4,
-        )
-        text = (out.choices[0].message.content or "").strip().lower()
-
-        if "analysis" in text and "chat" not in text:
-            return "analysis"
-        if "chat" in text and "analysis" not in text:
-            return "chat"
-
-        # fallback simples por palavras-chave
-        if any(
-            k in user_prompt.lower()
-            for k in [
-                "analis", "plot", "gráfico", "grafico", "describe", "correla",
-                "hist", "box", "scatter", "média", "media", "mediana", "moda",
-                "variância", "variancia", "desvio padrão", "std"
-            ]
-        ):
-            return "analysis"
-        return "chat"
+    label = local_label if confident else "chat"
+    if not confident or shadow:
+        t1 = time.perf_counter()
+        with telemetry.span("intent.llm", shadow=shadow):
+            try:
+                llm_label = _classify_intent_llm(user_prompt)
+                record["llm_label"] = llm_label
+                if not confident:
+                    label = llm_label
+            except Exception:
+                pass
+        record["llm_ms"] = round((time.perf_counter() - t1) * 1000, 3)
 
-    except Exception:
-        return "chat"
+    with _intent_lock:
+        _intent_stats["local" if confident else "llm"] += 1
+        if record["llm_label"] is not None and local_label is not None:
+            _intent_stats["compared"] += 1
+            _intent_stats["agree"] += int(record["llm_label"] == local_label)
+    record["source"] = "local" if confident else "llm"
+    intent_model.append_log(record)
+    return label
+
+# ================= Streaming =================
+STREAM_OPTIONS = {"include_usage": True}  # o último chunk traz a contagem de tokens
+
+def _iter_deltas(stream, usage: dict | None = None):
+    """
+    Extrai o texto incremental de um stream de chat.completions (fecha a conexão ao final).
+    Se `usage` for passado, recebe prompt_tokens/completion_tokens quando o servidor os enviar.
+    """
+    try:
+        for chunk in stream:
+            chunk_usage = getattr(chunk, "usage", None)
+            if usage is not None and chunk_usage is not None:
+                usage["prompt_tokens"] = getattr(chunk_usage, "prompt_tokens", None)
+                usage["completion_tokens"] = getattr(chunk_usage, "completion_tokens", None)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+def _traced_deltas(stream, messages: list, sp: dict):
+    """
+    _iter_deltas com atributos de telemetria no span `sp`: tempo até o primeiro token,
+    bytes enviados/recebidos e tokens (do servidor ou estimados em ~4 caracteres/token).
+    """
+    t0 = time.perf_counter()
+    usage = {}
+    sent = sum(len(m["content"].encode("utf-8")) for m in messages)
+    received = 0
+    sp["bytes_out"] = sent
+    try:
+        for delta in _iter_deltas(stream, usage):
+            if not received:
+                sp["ttft_s"] = round(time.perf_counter() - t0, 6)
+            received += len(delta.encode("utf-8"))
+            yield delta
+    finally:
+        sp["bytes_in"] = received
+        if usage.get("completion_tokens") is not None:
+            sp["tokens_prompt"] = usage["prompt_tokens"]
+            sp["tokens_completion"] = usage["completion_tokens"]
+        else:
+            sp["tokens_prompt"] = sent // 4
+            sp["tokens_completion"] = received // 4
+            sp["tokens_estimated"] = True
 
 # ================= Resposta de chat =================
-def get_chat_response(user_prompt: str) -> str:
+def stream_chat_response(user_prompt: str):
+    """Gera a resposta de chat em pedaços de texto, à medida que os tokens chegam."""
+    emitted = False
     try:
         if _client is None:
             raise RuntimeError("OpenAI client não inicializado.")
@@ -79,98 +233,240 @@ def get_chat_response(user_prompt: str) -> str:
             "Se a pergunta não exigir análise de dados, seja breve."
         )
 
-        out = _client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": sys_msg},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.4,
-            max_tokens=400,
-        )
-        return (out.choices[0].message.content or "").strip()
+        messages = [
+            {"role": "system", "content": sys_msg},
+            {"role": "user", "content": user_prompt},
+        ]
+        with telemetry.span("llm.chat") as sp:
+            stream = _client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.4,
+                max_tokens=400,
+                stream=True,
+                stream_options=STREAM_OPTIONS,
+            )
+            for delta in _traced_deltas(stream, messages, sp):
+                emitted = True
+                yield delta
     except Exception as e:
-        return f"Não foi possível gerar uma resposta de chat: {e}"
+        if not emitted:
+            yield f"Não foi possível gerar uma resposta de chat: {e}"
+
+def get_chat_response(user_prompt: str) -> str:
+    return "".join(stream_chat_response(user_prompt)).strip()
 
 # ================= Geração de código de análise =================
-def get_analysis_code(user_prompt: str, sample_markdown: str) -> str:
+def clean_generated_code(code: str) -> str:
+    """Remoção defensiva de cercas de código e do rótulo 'python'."""
+    code = code.strip()
+    if code.startswith("```"):
+        code = code.strip("`")
+    if code.lstrip().lower().startswith("python"):
+        code = code.split("\n", 1)[-1]
+    return code
+
+FALLBACK_CODE = (
+    "print('Falha ao gerar código. Mostrando preview do df:')\n"
+    "print(df.head())\n"
+    "print('INSIGHT: Não foi possível gerar a análise solicitada; verifique sua conexão ou reformule o pedido.')\n"
+)
+
+ENGINE_HINTS = {
+    "duckdb": (
+        " O dataset completo NÃO está em memória: ele está no DuckDB como a tabela dados. "
+        "df contém apenas uma amostra aleatória, útil para inspecionar valores. "
+        "Para qualquer número ou gráfico sobre a base completa, use sql(\"SELECT ... FROM dados ...\"), "
+        "que retorna um pandas DataFrame; agregue no SQL (GROUP BY, COUNT, AVG, histogramas com "
+        "FLOOR/width_bucket) para que o resultado seja pequeno, e plote esse resultado."
+    ),
+}
+
+def _analysis_messages(user_prompt: str, sample_markdown: str, engine: str | None = None):
+    sys_analyst = (
+        "Você é um assistente especialista em EDA e visualização. "
+        "Você gera somente código Python que será executado em Streamlit. "
+        "O DataFrame alvo está disponível na variável df. "
+        "Responda apenas com código Python válido (sem cercas de código). "
+        "Quando chegar a uma conclusão, imprima uma linha iniciando com 'INSIGHT: ' "
+        "(ex.: print('INSIGHT: ...')). "
+        "Prefira plotly.express (st.plotly_chart(fig, use_container_width=True)) "
+        "ou matplotlib/seaborn (st.pyplot(plt.gcf())). "
+        "Nunca leia arquivos. Use apenas a variável df. "
+        "Trate NaN antes de astype(int). "
+        "Evite chained assignment; use df.loc[...]. "
+        "Em séries temporais, as colunas que o contexto lista como datetime já estão convertidas "
+        "(e o df já vem ordenado pela data principal): não chame pd.to_datetime nelas nem reordene. "
+        "Só converta com pd.to_datetime(errors='coerce') colunas de texto com datas fora dessa lista. "
+        "Se o contexto citar rollups, use rollups['D'] / rollups['M'] para séries diárias/mensais. "
+        "Para contar distintos, quantis e valores mais frequentes de colunas inteiras, prefira "
+        "sketch.nunique(col), sketch.quantile(col, q) e sketch.top(col, k) (aproximados e instantâneos) "
+        "a df[col].nunique()/quantile()/value_counts(); sketch.describe() resume todas as colunas. "
+        "Para desvio padrão/variância, não trate 'std'/'var' como nomes de colunas do df."
+        " - Use: num = df.select_dtypes('number'); resumo = num.agg(['std','var']).T  (ou construa DataFrame com {'std':..., 'var':...})"
+        " Para gráficos, prefira os helpers já disponíveis (agregam no servidor e não dependem do número de linhas): "
+        "plot_hist(df, col, bins=50), plot_density(df, x, y), plot_line(df, x, y), plot_scatter(df, x, y, color=None). "
+        "Todos retornam figuras Plotly. Não use px.scatter, px.histogram, px.line ou seaborn sobre o df inteiro."
+    )
+
+    user_msg = (
+        "Você irá gerar APENAS código Python (sem explicações, sem cercas ```).\n\n"
+        "Regras:\n"
+        "- O DataFrame já existe como df (pandas). NÃO leia arquivos.\n"
+        "- Se converter tipos, trate NaN previamente (ex.: fillna, dropna) antes de astype(int).\n"
+        "- Para Matplotlib/Seaborn: chame st.pyplot(plt.gcf()) após o plot.\n"
+        "- Para Plotly: use st.plotly_chart(fig, use_container_width=True).\n"
+        "- Para histograma, dispersão, densidade ou séries, use plot_hist / plot_scatter / plot_density / plot_line "
+        "(já disponíveis, sem import) e exiba com st.plotly_chart(fig, use_container_width=True).\n"
+        "- Evite chained assignment; use df.loc[...].\n"
+        "- Para desvio padrão/variância, NÃO trate 'std'/'var' como colunas do df; "
+        "  use df.select_dtypes('number') e agregue (ex.: num.agg(['std','var']).T) ou monte um DataFrame com {'std':..., 'var':...}.\n"
+        "- Mostre prints com resultados e métricas relevantes (print()).\n"
+        "- Ao final, imprima uma linha começando com 'INSIGHT:' resumindo a principal conclusão (máx. 140 caracteres).\n"
+        "- Você pode criar novos DataFrames auxiliares se necessário.\n\n"
+        f"Contexto (esquema e estatísticas do df):\n{sample_markdown}\n\n"
+        f"Tarefa do usuário:\n{user_prompt}"
+    )
+
+    if engine in ENGINE_HINTS:
+        sys_analyst += ENGINE_HINTS[engine]
+        user_msg = f"Motor de dados: {engine} (tabela dados, função sql()).\n\n{user_msg}"
+
+    return sys_analyst, user_msg
+
+ANALYSIS_PARAMS = {"model": "gpt-4o-mini", "temperature": 0.2, "max_tokens": 1200}
+
+def _analysis_keys(user_prompt: str, sample_markdown: str, schema=None, engine: str | None = None):
+    """(sys_analyst, user_msg, params, chave no CodeCache, chave do esquema no índice semântico)."""
+    sys_analyst, user_msg = _analysis_messages(user_prompt, sample_markdown, engine)
+    params = dict(ANALYSIS_PARAMS)
+    key_schema = schema if schema is not None else [("__context__", sample_markdown)]
+    key_params = {**params, "system": sys_analyst}
+    key = make_key(user_prompt, key_schema, key_params)
+    schema_key = make_key("", key_schema, key_params)
+    return sys_analyst, user_msg, params, key, schema_key
+
+def invalidate_analysis_code(user_prompt: str, sample_markdown: str, schema=None, engine: str | None = None):
     """
-    Retorna APENAS código Python que usa o DataFrame 'df' já existente.
-    Deve imprimir alguma saída textual e, quando possível, um 'INSIGHT: ...' ao final.
+    Descarta o código em cache para a pergunta (chamar quando a execução falha), junto
+    com as entradas do índice semântico que levariam a ele: sem isso, repetir ou
+    reformular a pergunta reaproveitaria o mesmo código quebrado até o TTL.
+    """
+    _, _, _, key, schema_key = _analysis_keys(user_prompt, sample_markdown, schema, engine)
+    cache = get_code_cache()
+    code = cache.get(key)
+    cache.delete(key)
+    if schema is None:
+        return
+    semantic = get_semantic_index()
+    semantic.forget(key)
+    # acerto semântico: o código veio de outra pergunta; a origem também é descartada
+    match = semantic.lookup(schema_key, user_prompt, [c for c, _ in schema])
+    if match is not None and code is not None and cache.get(match["code_key"]) == code:
+        cache.delete(match["code_key"])
+        semantic.forget(match["code_key"])
+
+def stream_analysis_code(user_prompt: str, sample_markdown: str, schema=None, engine: str | None = None,
+                         on_stream=None):
     """
+    Gera o código de análise em pedaços, à medida que os tokens chegam.
+    O texto concatenado deve passar por clean_generated_code antes de executar.
+    Em acerto de cache, o código inteiro vem em um único pedaço (sem chamada à API).
+    schema: lista opcional [(coluna, dtype)] usada na chave do cache de código;
+    sem ela, a chave usa o próprio contexto em Markdown. Com schema, perguntas
+    parecidas já respondidas sobre o mesmo esquema também reaproveitam o código
+    (cache semântico).
+    engine: None (pandas em memória) ou "duckdb" (consultas via sql() na tabela dados).
+    on_stream: callable opcional que recebe o stream da API assim que ele abre (quem
+    cancela pode fechá-lo de outra thread sem esperar pelo próximo pedaço).
+    """
+    emitted = False
     try:
         if _client is None:
             raise RuntimeError("OpenAI client não inicializado.")
 
-        sys_analyst = (
-            "Você é um assistente especialista em EDA e visualização. "
-            "Você gera somente código Python que será executado em Streamlit. "
-            "O DataFrame alvo está disponível na variável df. "
-            "Responda apenas com código Python válido (sem cercas de código). "
-            "Quando chegar a uma conclusão, imprima uma linha iniciando com 'INSIGHT: ' "
-            "(ex.: print('INSIGHT: ...')). "
-            "Prefira plotly.express (st.plotly_chart(fig, use_container_width=True)) "
-            "ou matplotlib/seaborn (st.pyplot(plt.gcf())). "
-            "Nunca leia arquivos. Use apenas a variável df. "
-            "Trate NaN antes de astype(int). "
-            "Evite chained assignment; use df.loc[...]. "
-            "Se fizer séries temporais, tente detectar colunas como "
-            "['date','data','dt','time','timestamp'] (case-insensitive) "
-            "e converter com pd.to_datetime(errors='coerce')."
-            "Para desvio padrão/variância, não trate 'std'/'var' como nomes de colunas do df."
-            " - Use: num = df.select_dtypes('number'); resumo = num.agg(['std','var']).T  (ou construa DataFrame com {'std':..., 'var':...})"
+        sys_analyst, user_msg, params, key, schema_key = _analysis_keys(
+            user_prompt, sample_markdown, schema, engine
         )
+        cache = get_code_cache()
+        with telemetry.span("codegen.cache") as sp:
+            cached = cache.get(key)
+            sp["hit"] = cached is not None
+        if cached is not None:
+            emitted = True
+            yield cached
+            return
 
-        user_msg = (
-            "Você irá gerar APENAS código Python (sem explicações, sem cercas ```).\n\n"
-            "Regras:\n"
-            "- O DataFrame já existe como df (pandas). NÃO leia arquivos.\n"
-            "- Se converter tipos, trate NaN previamente (ex.: fillna, dropna) antes de astype(int).\n"
-            "- Para Matplotlib/Seaborn: chame st.pyplot(plt.gcf()) após o plot.\n"
-            "- Para Plotly: use st.plotly_chart(fig, use_container_width=True).\n"
-            "- Evite chained assignment; use df.loc[...].\n"
-            "- Para desvio padrão/variância, NÃO trate 'std'/'var' como colunas do df; "
-            "  use df.select_dtypes('number') e agregue (ex.: num.agg(['std','var']).T) ou monte um DataFrame com {'std':..., 'var':...}.\n"
-            "- Mostre prints com resultados e métricas relevantes (print()).\n"
-            "- Ao final, imprima uma linha começando com 'INSIGHT:' resumindo a principal conclusão (máx. 140 caracteres).\n"
-            "- Você pode criar novos DataFrames auxiliares se necessário.\n\n"
-            f"Contexto (amostra df em Markdown):\n{sample_markdown}\n\n"
-            f"Tarefa do usuário:\n{user_prompt}"
-        )
+        # pergunta parecida já respondida sobre o mesmo esquema
+        semantic = get_semantic_index() if schema is not None else None
+        columns = [c for c, _ in schema] if schema is not None else []
+        if semantic is not None:
+            with telemetry.span("codegen.semantic") as sp:
+                match = semantic.lookup(schema_key, user_prompt, columns)
+                cached = cache.get(match["code_key"]) if match is not None else None
+                sp["hit"] = cached is not None
+                semantic.record(match if cached is not None else None)
+                if cached is not None:
+                    sp["similarity"] = match["similarity"]
+                    sp["saved_s"] = match["gen_seconds"]
+            if cached is not None:
+                cache.put(key, cached)
+                emitted = True
+                yield cached
+                return
 
-        out = _client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": sys_analyst},
-                {"role": "user", "content": user_msg},
-            ],
-            temperature=0.2,
-            max_tokens=1200,
-        )
-        code = (out.choices[0].message.content or "").strip()
+        messages = [
+            {"role": "system", "content": sys_analyst},
+            {"role": "user", "content": user_msg},
+        ]
+        parts = []
+        t0 = time.perf_counter()
+        with telemetry.span("llm.codegen") as sp:
+            stream = _client.chat.completions.create(
+                messages=messages,
+                stream=True,
+                stream_options=STREAM_OPTIONS,
+                **params,
+            )
+            if on_stream is not None:
+                on_stream(stream)
+            for delta in _traced_deltas(stream, messages, sp):
+                parts.append(delta)
+                emitted = True
+                yield delta
 
-        # Remoção defensiva de cercas
-        if code.startswith("```"):
-            code = code.strip("`")
-        if code.lstrip().lower().startswith("python"):
-            code = code.split("\n", 1)[-1]
-
-        return code
+        code = clean_generated_code("".join(parts))
+        if code:
+            cache.put(key, code)
+            if semantic is not None:
+                semantic.add(schema_key, user_prompt, key, time.perf_counter() - t0, columns)
     except Exception:
-        return (
-            "print('Falha ao gerar código. Mostrando preview do df:')\n"
-            "print(df.head())\n"
-            "print('INSIGHT: Não foi possível gerar a análise solicitada; verifique sua conexão ou reformule o pedido.')\n"
-        )
+        # falha no meio do stream: o código parcial já foi entregue e falhará na execução
+        if not emitted:
+            yield FALLBACK_CODE
+
+def get_analysis_code(user_prompt: str, sample_markdown: str, schema=None, engine: str | None = None) -> str:
+    """
+    Retorna APENAS código Python que usa o DataFrame 'df' já existente.
+    Deve imprimir alguma saída textual e, quando possível, um 'INSIGHT: ...' ao final.
+    """
+    return clean_generated_code("".join(stream_analysis_code(user_prompt, sample_markdown, schema, engine)))
 
 # ================= Execução do código =================
-def execute_code(code: str, df: pd.DataFrame):
+# pico de memória do exec em processo via tracemalloc (tem custo; desligado por padrão)
+TRACE_EXEC_MEMORY = os.environ.get("EDA_TRACE_EXEC_MEMORY", "0") == "1"
+
+def make_exec_globals(st_module=st, sql=None, rollups=None, sketch=None) -> dict:
     """
-    Executa o código gerado em um namespace controlado com acesso a:
-    df, st, pd, plt, sns, px.
-    Retorna (stdout, error_text). Gráficos são exibidos via Streamlit no próprio código.
+    Namespace global controlado para o código gerado: builtins restritos e
+    pd, st, plt, sns, px e os helpers agregados plot_hist, plot_density,
+    plot_line e plot_scatter. st_module permite trocar o Streamlit por um gravador
+    (usado pelos workers de execução isolada); sql, quando dado, expõe o motor
+    out-of-core (ver engine.DuckDBEngine.sql); rollups são os agregados por período
+    da data principal (ver timeseries.build_rollups), sempre definidos ({} sem data);
+    sketch é a sketches.SketchView de estatísticas aproximadas do dataset.
     """
-    safe_globals = {
+    exec_globals = {
         "__builtins__": {
             "__import__": __import__,  # essencial para importações
             "abs": abs,
@@ -203,20 +499,117 @@ def execute_code(code: str, df: pd.DataFrame):
             "all": all,
         },
         "pd": pd,
-        "st": st,
+        "st": st_module,
         "plt": plt,
         "sns": sns,
         "px": px,
+        "plot_hist": plot_hist,
+        "plot_density": plot_density,
+        "plot_line": plot_line,
+        "plot_scatter": plot_scatter,
+        "rollups": rollups or {},
     }
+    if sql is not None:
+        exec_globals["sql"] = sql
+    if sketch is not None:
+        exec_globals["sketch"] = sketch
+    return exec_globals
+
+def _arrow_addresses(chunked) -> list:
+    return [buf.address for chunk in chunked.chunks for buf in chunk.buffers() if buf is not None]
+
+def _shares_data(a: pd.Series, b: pd.Series) -> bool:
+    """True se as duas séries ainda apontam para o mesmo buffer (coluna não copiada)."""
+    xa, xb = a.array, b.array
+    if xa is xb:
+        return True
+    pa_a, pa_b = getattr(xa, "_pa_array", None), getattr(xb, "_pa_array", None)
+    if pa_a is not None and pa_b is not None:
+        return _arrow_addresses(pa_a) == _arrow_addresses(pa_b)
+    for attr in ("_ndarray", "_codes", "_data"):
+        na, nb = getattr(xa, attr, None), getattr(xb, attr, None)
+        if isinstance(na, np.ndarray) and isinstance(nb, np.ndarray):
+            return bool(np.shares_memory(na, nb))
+    return False
+
+def snapshot(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Visão copy-on-write do DataFrame: nenhuma coluna é copiada até o código gerado
+    escrever nela, e escritas (df.loc[...] = ..., inplace=True) não afetam o original.
+    """
+    return df.copy(deep=False)
+
+def stratified_sample(df: pd.DataFrame, n: int, by: str | None = None, seed: int = 0) -> pd.DataFrame:
+    """
+    Amostra de ~n linhas preservando a proporção de cada valor de `by` (quando dado),
+    na ordem original das linhas. Devolve df inteiro se ele já couber em n.
+    """
+    if len(df) <= n:
+        return df
+    if by is None or by not in df.columns:
+        sample = df.sample(n=n, random_state=seed)
+    else:
+        sample = df.groupby(by, observed=True, dropna=False, group_keys=False).sample(
+            frac=n / len(df), random_state=seed
+        )
+    return sample.sort_index()
+
+def count_materialized(original: pd.DataFrame, result) -> int:
+    """Quantas colunas do df original deixaram de compartilhar dados com o df após a execução."""
+    if not isinstance(result, pd.DataFrame):
+        return 0
+    n = 0
+    for col in original.columns:
+        if col not in result.columns:
+            continue
+        try:
+            if not _shares_data(original[col], result[col]):
+                n += 1
+        except Exception:
+            n += 1
+    return n
 
-    safe_locals = {"df": df}
-    stdout_buffer = io.StringIO()
+def execute_code(code: str, df: pd.DataFrame, stats: dict | None = None, sql=None, st_module=st,
+                 rollups=None, sketch=None, exact_stats: bool = False):
+    """
+    Executa o código gerado em um namespace controlado com acesso a:
+    df, st, pd, plt, sns, px.
+    O código recebe uma visão copy-on-write de df (ver snapshot), então mutações não
+    alteram o dataset da sessão. Se `stats` for passado, recebe
+    materialized_columns (colunas efetivamente copiadas) e total_columns.
+    sql: função de consulta do motor out-of-core, exposta ao código quando dada.
+    st_module: substituto de `st` (ex.: workers._Recorder, para guardar as saídas).
+    rollups: agregados diário/mensal do dataset completo, expostos como `rollups`.
+    sketch: DatasetSketch do dataset, exposto como `sketch` (SketchView; sem sketch ou com
+    exact_stats=True, as mesmas chamadas calculam o valor exato sobre o df).
+    Retorna (stdout, error_text). Gráficos são exibidos via st_module no próprio código.
+    """
+    safe_globals = make_exec_globals(st_module=st_module, sql=sql, rollups=rollups,
+                                     sketch=SketchView(sketch, df, exact=exact_stats))
+    safe_locals = {"df": snapshot(df)}
     error_text = ""
 
-    try:
-        with contextlib.redirect_stdout(stdout_buffer):
-            exec(code, safe_globals, safe_locals)
-    except Exception:
-        error_text = traceback.format_exc()
+    with telemetry.span("exec", mode="inprocess") as sp:
+        # tracemalloc é global ao processo: só mede quem o ligou (execuções concorrentes ficam sem pico)
+        own_trace = TRACE_EXEC_MEMORY and not tracemalloc.is_tracing()
+        if own_trace:
+            tracemalloc.start()
+        # stdout e figuras do pyplot isolados por execução: sessões simultâneas não se misturam
+        with execution_scope() as (stdout_buffer, figures):
+            try:
+                exec(code, safe_globals, safe_locals)
+            except Exception:
+                error_text = traceback.format_exc()
+            finally:
+                if own_trace:
+                    sp["peak_mem_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+                    tracemalloc.stop()
+                sp["maxrss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+                sp["figures"] = figures.created
+                sp["ok"] = not error_text
+
+    if stats is not None:
+        stats["materialized_columns"] = count_materialized(df, safe_locals.get("df"))
+        stats["total_columns"] = df.shape[1]
 
     return stdout_buffer.getvalue(), error_text
@@ -3,15 +3,34 @@
 import os
 import io
 import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import streamlit as st
 from agent import (
-    initialize_openai_api,
-    classify_intent,
-    get_analysis_code,
-    get_chat_response,
+    use_openai_client,
+    stream_chat_response,
+    clean_generated_code,
     execute_code,
+    stratified_sample,
+    get_code_cache,
+    invalidate_analysis_code,
+    get_semantic_index,
+    intent_stats,
 )
+from ingest import read_csv_optimized, memory_bytes
+from engine import DuckDBEngine, prepare_parquet, available as duckdb_available
+from pipeline import SpeculativeAnalysis
+from workers import WorkerPool, render_outputs, _Recorder, EXEC_WORKERS
+from result_store import ResultStore, exec_key, extract_insights
+from code_rewrite import optimize_code
+import dataset_cache
+from profiling import build_profile, pick_strata_column
+from timeseries import build_rollups
+from sketches import DatasetSketch, SketchView
+from prompt_context import build_prompt_context, estimate_tokens, PROMPT_TOKEN_BUDGET
+import telemetry
+from llm_client import make_client
 
 # ========================= Configuração de página =========================
 st.set_page_config(
@@ -196,6 +215,10 @@ pre, code, .stCodeBlock {
 # ========================= Estado da sessão =========================
 st.session_state.setdefault('df', None)
 st.session_state.setdefault('file_meta', None)  # (name, size)
+st.session_state.setdefault('upload_key', None)  # (name, size, file_id) do último upload visto
+st.session_state.setdefault('file_hash', None)  # hash de conteúdo do dataset carregado
+st.session_state.setdefault('engine_path', None)  # Parquet consultado pelo DuckDB (modo out-of-core)
+st.session_state.setdefault('load_info', None)  # engine, chunks, memória antes/depois
 st.session_state.setdefault('sample_rendered', False)
 st.session_state.setdefault('chat_history', [])
 st.session_state.setdefault('insights', [])
@@ -210,8 +233,61 @@ with st.sidebar:
     st.markdown('#### Aparência')
     show_schema = st.toggle('Mostrar aba **Esquema**', value=True)
     show_code_expander = st.toggle('Mostrar expander de código', value=True)
+    optimize_generated = st.toggle('Vetorizar código gerado', value=True,
+                                   help='Reescreve iterrows, apply(axis=1) e laços linha a linha em operações vetorizadas.')
+    isolated_exec = st.toggle('Executar código em processo isolado', value=True,
+                              help='Roda a análise em um worker separado, com limite de tempo e memória.')
+    engine_mode = st.toggle('Motor out-of-core (DuckDB)', value=False, disabled=not duckdb_available(),
+                            help='Não carrega o CSV inteiro no pandas: consulta via SQL e só traz resultados pequenos.')
+    progressive_exec = st.toggle('Execução progressiva (amostra primeiro)', value=True,
+                                 help='Em bases grandes, roda antes numa amostra estratificada e mostra um resultado preliminar.')
+    progressive_rows = st.select_slider('Linhas da amostra progressiva',
+                                        options=[10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000],
+                                        value=100_000, disabled=not progressive_exec)
+    exact_stats = st.toggle('Estatísticas exatas', value=False,
+                            help='Distintos, quantis e mais frequentes calculados sobre todas as linhas, '
+                                 'em vez dos sketches aproximados (mais lento em bases grandes).')
     sample_rows = st.slider('Linhas da amostra', 5, 50, 10, 5)
+    context_budget = st.select_slider('Orçamento de tokens do contexto',
+                                      options=sorted({500, 1000, 1500, 3000, 6000, PROMPT_TOKEN_BUDGET}),
+                                      value=PROMPT_TOKEN_BUDGET,
+                                      help='Tamanho máximo do resumo de esquema/estatísticas enviado ao modelo.')
+    semantic_index = get_semantic_index()
+    semantic_index.threshold = st.slider(
+        'Similaridade mínima (perguntas parecidas)', 0.5, 1.0, min(1.0, semantic_index.threshold), 0.05,
+        help='Reaproveita o código de uma pergunta parecida sobre o mesmo esquema acima deste limiar; '
+             'abaixo dele, o código é gerado pelo modelo.')
     st.markdown('---')
+    cache_stats = get_code_cache().stats()
+    st.caption(
+        f"🗃️ Cache de código: {cache_stats['hits_memory'] + cache_stats['hits_disk']} acertos · "
+        f"{cache_stats['misses']} falhas · taxa {cache_stats['hit_rate']:.0%}"
+    )
+    sem_stats = semantic_index.stats()
+    st.caption(
+        f"🧠 Perguntas parecidas: {sem_stats['hits']} reaproveitadas · taxa {sem_stats['hit_rate']:.0%} · "
+        f"~{sem_stats['saved_s']:.1f}s de geração economizados"
+    )
+    i_stats = intent_stats()
+    st.caption(
+        f"🧭 Intenção: {i_stats['local']} locais · {i_stats['llm']} via LLM"
+        + (f" · concordância {i_stats['agreement']:.0%}" if i_stats['agreement'] is not None else '')
+    )
+    show_perf = st.toggle('Painel de desempenho', value=False,
+                          help='Latência por etapa (p50/p95/p99), tokens, bytes e memória das requisições anteriores.')
+    if show_perf:
+        perf_rows = telemetry.summary()
+        if perf_rows:
+            st.dataframe(pd.DataFrame(perf_rows), use_container_width=True, hide_index=True)
+            last_traces = telemetry.recent_traces()
+            if last_traces:
+                last = last_traces[-1]
+                st.caption(f"Última requisição ({last.get('intent', '—')}): {last['seconds']:.2f}s")
+                st.dataframe(pd.DataFrame(last['spans']), use_container_width=True, hide_index=True)
+            st.download_button('Métricas (Prometheus)', telemetry.prometheus_text(),
+                               file_name='metrics.prom', mime='text/plain')
+        else:
+            st.caption('Sem medições ainda.')
     st.caption('💡 Dica: peça coisas como _"histograma de Amount"_ ou _"correlação entre X e Y"_.')
 
 # ========================= Chave de API =========================
@@ -219,10 +295,20 @@ api_key = st.secrets.get("OPENAI_API_KEY")
 if not api_key:
     st.error('A chave de API da OpenAI não foi encontrada. Defina `OPENAI_API_KEY`.')
     st.stop()
-else:
-    initialize_openai_api(api_key)
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(key: str):
+    """Um cliente (e um pool de conexões keep-alive) por processo, reaproveitado entre reruns e sessões."""
+    return make_client(key)
+
+use_openai_client(get_openai_client(api_key))
 
 # ========================= Funções auxiliares =========================
+CODE_REFRESH_S = 0.05  # intervalo mínimo entre redesenhos do código em streaming
+
+# endpoint /metrics (Prometheus) quando EDA_METRICS_PORT estiver definido; idempotente
+telemetry.start_metrics_server()
+
 def human_size(nbytes: int | None) -> str:
     if not nbytes and nbytes != 0:
         return '—'
@@ -246,6 +332,166 @@ def get_meta(f):
             size = None
     return (f.name, size)
 
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_shared_dataset(digest: str):
+    """Um único DataFrame por hash de conteúdo, compartilhado entre as sessões do processo."""
+    return dataset_cache.load(digest)
+
+@st.cache_resource(show_spinner=False)
+def get_worker_pool() -> WorkerPool:
+    """Pool de workers de execução, único por processo do servidor."""
+    return WorkerPool()
+
+@st.cache_resource(show_spinner=False)
+def get_exec_executor() -> ThreadPoolExecutor:
+    """Threads que aguardam as execuções (amostra e base completa rodam em paralelo)."""
+    return ThreadPoolExecutor(max_workers=max(16, 2 * EXEC_WORKERS), thread_name_prefix='eda-exec')
+
+@st.cache_resource(show_spinner=False)
+def get_result_store() -> ResultStore:
+    """Saídas das análises para reprodução no histórico, limitadas em bytes (comum às sessões)."""
+    return ResultStore()
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_engine(path: str) -> DuckDBEngine:
+    """Conexão DuckDB sobre o Parquet do dataset, compartilhada entre sessões."""
+    return DuckDBEngine(path)
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_profile(digest: str, _df: pd.DataFrame, total_rows: int | None = None, _sketch=None) -> dict:
+    """
+    Perfil de colunas memoizado pelo hash de conteúdo (calculado uma vez por dataset).
+    No modo out-of-core, _df é a amostra e total_rows vem do DuckDB. Com _sketch,
+    distintos e quartis são aproximados (ver sketches.py).
+    """
+    with telemetry.span('app.profile', rows=len(_df), cols=_df.shape[1], approx=_sketch is not None):
+        profile = build_profile(_df, sketch=_sketch)
+    if total_rows is not None:
+        profile['n_rows'] = total_rows
+    return profile
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_exact_profile(digest: str, _df: pd.DataFrame) -> dict:
+    """Perfil sem sketches (distintos e quartis exatos), para o toggle de estatísticas exatas."""
+    with telemetry.span('app.profile', rows=len(_df), cols=_df.shape[1], approx=False):
+        return build_profile(_df)
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_sketch(digest: str, _df: pd.DataFrame) -> DatasetSketch:
+    """
+    Sketches do dataset (distintos, quantis, mais frequentes): os gravados na leitura do
+    CSV ou, para datasets vindos do cache sem eles, construídos em chunks do df.
+    """
+    sketch = dataset_cache.load_sketch(digest)
+    if sketch is None:
+        with telemetry.span('app.sketch', rows=len(_df)):
+            sketch = DatasetSketch.from_frame(_df)
+        dataset_cache.store_sketch(digest, sketch)
+    return sketch
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_rollups(digest: str, _df: pd.DataFrame) -> dict:
+    """
+    Agregados diário/mensal da data principal (timeseries.build_rollups), calculados uma
+    vez por dataset e gravados no cache para os workers. Vazio se não houver data.
+    """
+    rollups = dataset_cache.load_rollups(digest)
+    if rollups is None:
+        with telemetry.span('app.rollups', rows=len(_df)):
+            rollups = build_rollups(_df)
+        dataset_cache.store_rollups(digest, rollups)
+    return rollups
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_prompt_context(digest: str, budget: int, _profile: dict, _rollups: dict) -> str:
+    """Resumo de esquema e estatísticas para o prompt, calculado uma vez por (dataset, orçamento)."""
+    with telemetry.span('app.prompt_context', budget=budget) as sp:
+        text = build_prompt_context(_profile, budget, _rollups)
+        sp['tokens'] = estimate_tokens(text)
+    return text
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_sample(digest: str, n: int, _df: pd.DataFrame, strata: str | None):
+    """Amostra estratificada memoizada por (dataset, tamanho); também gravada no cache para os workers."""
+    sample = stratified_sample(_df, n, by=strata).reset_index(drop=True)
+    sample_digest = f'{digest}-sample{n}'
+    if dataset_cache.has(sample_digest) or dataset_cache.store(sample_digest, sample):
+        return sample, dataset_cache.path_for(sample_digest)
+    return sample, None
+
+def memo_key(code: str, dataset_key: str) -> str:
+    """Chave do resultado memoizado; código que usa `sketch` tem resultados distintos no modo exato."""
+    if exact_stats and 'sketch' in code:
+        dataset_key = f'{dataset_key}-exact'
+    return exec_key(code, dataset_key)
+
+def submit_run(code: str, data: pd.DataFrame, data_path: str | None, stats: dict, dataset_key: str):
+    """
+    Inicia a execução em uma thread (sem chamadas a `st`) e retorna (future, chave do resultado).
+    Executa no pool de workers quando possível; senão, no próprio processo.
+    O resultado é memoizado por (código normalizado, dataset): um acerto pula a execução.
+    O `sketch` do dataset completo só é passado na base completa (na amostra, as mesmas
+    chamadas respondem de forma exata sobre ela).
+    """
+    store = get_result_store()
+    key = memo_key(code, dataset_key)
+    full = dataset_key == st.session_state.file_hash
+    engine_path = st.session_state.engine_path
+    use_pool = isolated_exec and data_path and os.path.exists(data_path)
+    pool = get_worker_pool() if use_pool else None
+    rollups_path = dataset_cache.rollups_path_for(st.session_state.file_hash) if rollups else None
+    sketch_path = dataset_cache.sketch_path_for(st.session_state.file_hash) if full and sketch else None
+    sql = get_engine(engine_path).sql if engine_path and not use_pool else None
+    run_sketch, run_rollups, run_exact = (sketch if full else None), rollups, exact_stats
+
+    def work():
+        with telemetry.span('exec.memo') as sp:
+            memo = store.get(key)
+            sp['hit'] = memo is not None
+        if memo is not None:
+            stats['memo_hit'] = True
+            return memo['stdout'], '', memo['ops'], True
+        if pool is not None:
+            out, err, outputs = pool.run(
+                code, data_path, stats=stats, engine_path=engine_path, rollups_path=rollups_path,
+                sketch_path=sketch_path, exact_stats=run_exact,
+            )
+        else:
+            outputs = []
+            out, err = execute_code(code, data, stats=stats, sql=sql, st_module=_Recorder(outputs),
+                                    rollups=run_rollups, sketch=run_sketch, exact_stats=run_exact)
+        return out, err, outputs, False
+
+    return get_exec_executor().submit(telemetry.run_in_context(work)), key
+
+def finish_run(future, key: str):
+    """Aguarda a execução de submit_run, reproduz as saídas aqui e retorna (stdout, erro, ops, result_id)."""
+    with st.spinner('Executando análise...'):
+        out, err, outputs, memo_hit = future.result()
+    with telemetry.span('app.render', outputs=len(outputs)):
+        render_outputs(outputs)
+    if err:
+        return out, err, outputs, None
+    result_id = key if memo_hit else get_result_store().put(out, outputs, key=key)
+    return out, err, outputs, result_id
+
+def run_code(code: str, data: pd.DataFrame, data_path: str | None, stats: dict, dataset_key: str):
+    """
+    Executa e espera (ver submit_run). As saídas são sempre gravadas (ops) e reproduzidas
+    aqui; retorna (stdout, erro, ops, result_id).
+    """
+    return finish_run(*submit_run(code, data, data_path, stats, dataset_key))
+
+def render_stored_result(result_id: str):
+    """Reproduz stdout e gráficos de uma análise anterior a partir do ResultStore."""
+    stored = get_result_store().get(result_id)
+    if stored is None:
+        st.caption('Resultado não está mais em cache; peça a análise novamente para revê-lo.')
+        return
+    render_outputs(stored['ops'])
+    if stored['stdout'].strip():
+        st.code(stored['stdout'])
+
 # ========================= Hero / Header =========================
 st.markdown("""
 <div class="hero">
@@ -266,18 +512,58 @@ st.write('')
 new_meta = get_meta(uploaded_file)
 
 if uploaded_file is not None:
-    if st.session_state.file_meta != new_meta:
+    # o hash só é recalculado quando o objeto de upload muda
+    upload_key = (*new_meta, getattr(uploaded_file, 'file_id', None), engine_mode)
+    if st.session_state.upload_key != upload_key:
         try:
-            uploaded_file.seek(0)
-            df = pd.read_csv(uploaded_file)
-            st.session_state.df = df
+            with telemetry.span('app.hash', bytes=new_meta[1]):
+                digest = dataset_cache.content_hash(uploaded_file)
+            # no modo out-of-core o df da sessão é só uma amostra; chave própria no cache
+            dataset_key = f'{digest}-duckdb' if engine_mode else digest
+            if st.session_state.file_hash != dataset_key:
+                engine_path = None
+                with telemetry.span('app.upload', bytes=new_meta[1], duckdb=engine_mode) as upload_span:
+                    if engine_mode:
+                        with st.spinner('Convertendo CSV para Parquet (DuckDB)...'):
+                            engine_path = prepare_parquet(uploaded_file, digest)
+                        eng = get_engine(engine_path)
+                        if dataset_cache.has(dataset_key):
+                            df, load_info = load_shared_dataset(dataset_key)
+                        else:
+                            df = eng.preview()
+                            load_info = {'engine': 'duckdb', 'mem_after': memory_bytes(df), 'total_rows': eng.count()}
+                            if dataset_cache.store(dataset_key, df, load_info) and dataset_cache.has(dataset_key):
+                                df, _ = load_shared_dataset(dataset_key)
+                    elif dataset_cache.has(dataset_key):
+                        df, load_info = load_shared_dataset(dataset_key)
+                    else:
+                        uploaded_file.seek(0)
+                        bar = st.progress(0.0, text='Lendo CSV...')
+                        # sketches (distintos/quantis/frequentes) construídos na mesma passada da leitura
+                        sketch = DatasetSketch()
+                        df, load_info = read_csv_optimized(
+                            uploaded_file,
+                            progress=lambda frac: bar.progress(frac, text=f'Lendo CSV... {frac:.0%}'),
+                            sketch=sketch,
+                        )
+                        bar.empty()
+                        dataset_cache.store_sketch(dataset_key, sketch)
+                        if dataset_cache.store(dataset_key, df, load_info) and dataset_cache.has(dataset_key):
+                            df, _ = load_shared_dataset(dataset_key)
+                    upload_span['engine'] = load_info.get('engine')
+                    upload_span['rows'] = len(df)
+                st.session_state.df = df
+                st.session_state.file_hash = dataset_key
+                st.session_state.engine_path = engine_path
+                st.session_state.load_info = load_info
+                st.session_state.sample_rendered = False
+                st.session_state.chat_history = [
+                    {'role': 'assistant', 'content': '📁 Arquivo recebido! Pronto para analisar. Faça uma pergunta ou peça um gráfico.'}
+                ]
+                st.session_state.insights = []
+                st.toast('CSV carregado com sucesso!', icon='✅')
             st.session_state.file_meta = new_meta
-            st.session_state.sample_rendered = False
-            st.session_state.chat_history = [
-                {'role': 'assistant', 'content': '📁 Arquivo recebido! Pronto para analisar. Faça uma pergunta ou peça um gráfico.'}
-            ]
-            st.session_state.insights = []
-            st.toast('CSV carregado com sucesso!', icon='✅')
+            st.session_state.upload_key = upload_key
         except Exception as e:
             st.error(f'Falha ao ler CSV: {e}')
             st.stop()
@@ -286,9 +572,13 @@ else:
     st.stop()
 
 df = st.session_state.df
+# no modo out-of-core o df é só uma prévia: agregados e sketches dela não representariam a base
+sketch = None if st.session_state.engine_path else get_sketch(st.session_state.file_hash, df)
+profile = get_profile(st.session_state.file_hash, df, (st.session_state.load_info or {}).get('total_rows'), sketch)
+rollups = {} if st.session_state.engine_path else get_rollups(st.session_state.file_hash, df)
 
 # ========================= Cards de métricas =========================
-c1, c2, c3, c4 = st.columns(4)
+c1, c2, c3, c4, c5 = st.columns(5)
 with c1:
     st.markdown('<div class="card metric"><div class="label">Arquivo</div>'
                 f'<div class="value">{st.session_state.file_meta[0]}</div></div>', unsafe_allow_html=True)
@@ -297,10 +587,20 @@ with c2:
                 f'<div class="value">{human_size(st.session_state.file_meta[1])}</div></div>', unsafe_allow_html=True)
 with c3:
     st.markdown('<div class="card metric"><div class="label">Linhas</div>'
-                f'<div class="value">{len(df):,}</div></div>', unsafe_allow_html=True)
+                f'<div class="value">{profile["n_rows"]:,}</div></div>', unsafe_allow_html=True)
 with c4:
     st.markdown('<div class="card metric"><div class="label">Colunas</div>'
-                f'<div class="value">{df.shape[1]}</div></div>', unsafe_allow_html=True)
+                f'<div class="value">{profile["n_cols"]}</div></div>', unsafe_allow_html=True)
+with c5:
+    load_info = st.session_state.load_info or {}
+    mem_after = load_info.get('mem_after')
+    mem_before = load_info.get('mem_before')
+    if mem_before and mem_after:
+        mem_text = f'{human_size(mem_before)} → {human_size(mem_after)}'
+    else:
+        mem_text = human_size(mem_after)
+    st.markdown('<div class="card metric"><div class="label">Memória</div>'
+                f'<div class="value">{mem_text}</div></div>', unsafe_allow_html=True)
 
 st.write('')
 
@@ -322,18 +622,34 @@ if show_schema:
         st.markdown('#### Esquema e Qualidade')
         colL, colR = st.columns([1.2, 1])
         with colL:
-            dtypes_df = pd.DataFrame({
-                'coluna': df.columns,
-                'dtype': [str(t) for t in df.dtypes.values],
-                'n_nulos': df.isna().sum().values,
-                'pct_nulos': (df.isna().mean().round(4) * 100).values
-            })
-            st.dataframe(dtypes_df, use_container_width=True, hide_index=True)
+            schema_profile = get_exact_profile(st.session_state.file_hash, df) if exact_stats and sketch else profile
+            dtypes_df = schema_profile['columns']
+            shown = dtypes_df.copy()
+            for c in ('min', 'max'):
+                shown[c] = shown[c].map(lambda v: '' if pd.isna(v) else str(v))
+            st.dataframe(shown, use_container_width=True, hide_index=True)
+            if schema_profile.get('approx'):
+                st.caption('≈ Distintos e quartis aproximados (sketches). Ative **Estatísticas exatas** '
+                           'na barra lateral para calculá-los sobre todas as linhas.')
+            view = SketchView(sketch, df, exact=exact_stats)
+            top_col = st.selectbox('Valores mais frequentes de', list(df.columns))
+            with telemetry.span('app.top_values', exact=view.exact or sketch is None):
+                top_values = view.top(top_col, 10)
+            st.dataframe(top_values.rename('contagem').rename_axis(top_col).reset_index(),
+                         use_container_width=True, hide_index=True)
         with colR:
+            counts = profile['counts']
             st.markdown('**Resumo**')
-            st.write(f'- Colunas numéricas: **{df.select_dtypes("number").shape[1]}**')
-            st.write(f'- Colunas categóricas: **{df.select_dtypes("object").shape[1]}**')
-            st.write(f'- Colunas de data: **{df.select_dtypes("datetime").shape[1]}** (verificar conversão)')
+            st.write(f'- Colunas numéricas: **{counts["numeric"]}**')
+            st.write(f'- Colunas categóricas: **{counts["categorical"]}**')
+            st.write(f'- Colunas de data: **{counts["datetime"]}** (convertidas na leitura)')
+            if profile.get('sorted_by') is not None:
+                st.write(f'- Ordenado por: **{profile["sorted_by"]}**')
+            if rollups:
+                st.write(f"- Agregados prontos: **{', '.join(rollups)}** "
+                         f"({', '.join(f'{len(r):,}' for r in rollups.values())} períodos)")
+            if sketch is not None:
+                st.write('- Sketches: **distintos, quantis e mais frequentes** prontos para as análises')
             top_nulls = dtypes_df.sort_values('pct_nulos', ascending=False).head(5)[['coluna','pct_nulos']]
             st.write('**Top 5 % nulos:**')
             st.dataframe(top_nulls, use_container_width=True, hide_index=True)
@@ -358,6 +674,8 @@ for msg in st.session_state.chat_history:
     avatar = 'assistant' if role == 'assistant' else 'user'
     with st.chat_message(role, avatar=None):
         st.markdown(msg['content'])
+        if msg.get('result_id'):
+            render_stored_result(msg['result_id'])
 
 # Entrada
 user_input = st.chat_input('Pergunte algo (ex.: "histograma de Amount", "tendência temporal de X", "quais conclusões?").')
@@ -368,84 +686,154 @@ def push_assistant(text: str):
         st.markdown(text)
 
 if user_input:
-    # Mostra pergunta
-    st.session_state.chat_history.append({'role': 'user', 'content': user_input})
-    with st.chat_message('user'):
-        st.markdown(user_input)
-
-    # Comandos rápidos de conclusões
-    normalized = user_input.strip().lower()
-    if normalized in {
-        'conclusoes', 'conclusões', 'resumo', 'insights',
-        'quais conclusoes', 'quais conclusões até agora?',
-        'quais conclusões até agora', 'quais conclusões?'
-    }:
-        if st.session_state.insights:
-            bullets = '\n'.join([f'- {i}' for i in st.session_state.insights])
-            push_assistant(f'Aqui estão as conclusões registradas até agora:\n\n{bullets}')
-        else:
-            push_assistant('Ainda não há conclusões registradas. Solicite alguma análise ou gráfico para começarmos.')
-        st.stop()
-
-    # Classificação de intenção
-    intent = classify_intent(user_input)
-    if intent not in {'analysis', 'chat'}:
-        push_assistant('Não entendi a intenção. Reformule pedindo uma análise dos dados ou continue a conversa.')
-        st.stop()
-
-    # Roteamento
-    if intent == 'chat':
-        reply = get_chat_response(user_input)
-        push_assistant(reply)
-        st.stop()
-
-    # === intent == analysis ===
-    sample_text = df.head(20).to_markdown(index=False)
-    code = get_analysis_code(user_input, sample_text)
-
-    # Corrige linhas "INSIGHT:" sem print()
-    fixed_lines = []
-    for line in code.splitlines():
-        if line.strip().startswith('INSIGHT:'):
-            insight_txt = line.strip().replace('"', "'")
-            fixed_lines.append(f'print("{insight_txt}")')
-        else:
-            fixed_lines.append(line)
-    code = '\n'.join(fixed_lines)
-
-    if show_code_expander:
-        with st.expander('🧩 Código gerado pela IA', expanded=False):
-            st.code(code, language='python')
-
-    stdout_text, error_text = execute_code(code, df)
-
-    if error_text:
-        push_assistant(f'Ocorreu um erro na execução:\n\n```\n{error_text}\n```')
-        st.stop()
-
-    if stdout_text.strip():
-        with st.chat_message('assistant'):
-            st.markdown('**Resultado da análise:**')
-            st.code(stdout_text)
-
-        st.session_state.chat_history.append({
-            'role': 'assistant',
-            'content': '✅ Análise executada e gráficos/renderizações (se houver) exibidos acima.'
-        })
-
-        # Extrai e registra INSIGHTs
-        new_insights = []
-        for line in stdout_text.splitlines():
-            line_stripped = line.strip()
-            if line_stripped.upper().startswith('INSIGHT:') or 'INSIGHT:' in line_stripped.upper():
-                if ':' in line_stripped:
-                    insight = line_stripped.split(':', 1)[1].strip()
-                    if insight:
-                        new_insights.append(insight)
-
-        if new_insights:
-            st.session_state.insights.extend(new_insights)
-            st.toast(f'{len(new_insights)} conclusão(ões) registrada(s) 📌', icon='✍️')
-            push_assistant('Memória atualizada com novas conclusões.')
+    with telemetry.trace('request', prompt_chars=len(user_input)) as request_trace:
+        # Mostra pergunta
+        st.session_state.chat_history.append({'role': 'user', 'content': user_input})
+        with st.chat_message('user'):
+            st.markdown(user_input)
+
+        # Comandos rápidos de conclusões
+        normalized = user_input.strip().lower()
+        if normalized in {
+            'conclusoes', 'conclusões', 'resumo', 'insights',
+            'quais conclusoes', 'quais conclusões até agora?',
+            'quais conclusões até agora', 'quais conclusões?'
+        }:
+            if st.session_state.insights:
+                bullets = '\n'.join([f'- {i}' for i in st.session_state.insights])
+                push_assistant(f'Aqui estão as conclusões registradas até agora:\n\n{bullets}')
+            else:
+                push_assistant('Ainda não há conclusões registradas. Solicite alguma análise ou gráfico para começarmos.')
+            st.stop()
+
+        # Classificação de intenção, com geração de código especulativa em paralelo
+        context_text = get_prompt_context(st.session_state.file_hash, context_budget, profile, rollups)
+        schema = [(c, str(t)) for c, t in zip(profile['columns']['coluna'], profile['columns']['dtype'])]
+
+        analysis = SpeculativeAnalysis(
+            user_input, lambda: (context_text, schema), engine='duckdb' if st.session_state.engine_path else None
+        )
+        intent = analysis.intent()
+        request_trace.attrs['intent'] = intent
+        if intent not in {'analysis', 'chat'}:
+            analysis.cancel()
+            push_assistant('Não entendi a intenção. Reformule pedindo uma análise dos dados ou continue a conversa.')
+            st.stop()
+
+        # Roteamento
+        if intent == 'chat':
+            analysis.cancel()
+            with st.chat_message('assistant'):
+                reply = st.write_stream(stream_chat_response(user_input))
+            st.session_state.chat_history.append({'role': 'assistant', 'content': str(reply).strip()})
+            st.stop()
+
+        # === intent == analysis ===
+        # Código chega em streaming; o placeholder é atualizado no máximo a cada CODE_REFRESH_S
+        code_box = code_expander = None
+        if show_code_expander:
+            code_expander = st.expander('🧩 Código gerado pela IA', expanded=False)
+            code_box = code_expander.empty()
+        raw_code, last_refresh = '', 0.0
+        with st.spinner('Gerando código...'), telemetry.span('app.codegen_wait'):
+            for delta in analysis.code_deltas():
+                raw_code += delta
+                if code_box is not None and time.monotonic() - last_refresh >= CODE_REFRESH_S:
+                    code_box.code(raw_code, language='python')
+                    last_refresh = time.monotonic()
+        code = clean_generated_code(raw_code)
+
+        # Corrige linhas "INSIGHT:" sem print()
+        fixed_lines = []
+        for line in code.splitlines():
+            if line.strip().startswith('INSIGHT:'):
+                insight_txt = line.strip().replace('"', "'")
+                fixed_lines.append(f'print("{insight_txt}")')
+            else:
+                fixed_lines.append(line)
+        code = '\n'.join(fixed_lines)
+
+        # Reescrita de idiomas lentos (iterrows, apply(axis=1)...) antes de executar
+        rewrite_report = None
+        if optimize_generated:
+            with telemetry.span('app.rewrite') as sp:
+                code, rewrite_report = optimize_code(code, n_rows=profile['n_rows'], dtypes=df.dtypes)
+                sp['rewrites'] = len(rewrite_report['rewrites'])
+                sp['warnings'] = len(rewrite_report['warnings'])
+
+        if code_box is not None:
+            code_box.code(code, language='python')
+        if code_expander is not None and rewrite_report and (rewrite_report['diff'] or rewrite_report['warnings']):
+            with code_expander:
+                if rewrite_report['diff']:
+                    st.markdown(f"**Otimizações aplicadas ({len(rewrite_report['rewrites'])}):**")
+                    st.code(rewrite_report['diff'], language='diff')
+                for w in rewrite_report['warnings']:
+                    cost = f" (~{w['custo_s']:.1f}s estimados)" if w['custo_s'] else ''
+                    st.caption(f"⚠️ Linha {w['linha']}: {w['descricao']}{cost}")
+
+        run_stats = {}
+        dataset_path = dataset_cache.path_for(st.session_state.file_hash)
+        result_slot = st.empty()
+
+        # Modo progressivo: a base completa roda em paralelo com uma amostra estratificada, cujo
+        # resultado preliminar aparece primeiro. Erro só na amostra não cancela a base completa.
+        # Se o resultado da base completa já está memoizado, a amostra é desnecessária.
+        full_memoized = get_result_store().has(memo_key(code, st.session_state.file_hash))
+        if (progressive_exec and not full_memoized and not st.session_state.engine_path
+                and len(df) > progressive_rows):
+            sample_df, sample_path = get_sample(
+                st.session_state.file_hash, progressive_rows, df, pick_strata_column(profile)
+            )
+            # a amostra é submetida primeiro para pegar um worker antes da base completa
+            sample_run = submit_run(
+                code, sample_df, sample_path, {}, f'{st.session_state.file_hash}-sample{progressive_rows}'
+            )
+            full_run = submit_run(code, df, dataset_path, run_stats, st.session_state.file_hash)
+            with result_slot.container():
+                st.caption(f'⏳ Resultado preliminar em amostra estratificada de {len(sample_df):,} linhas; '
+                           'processando a base completa...')
+                sample_out, sample_err, _, _ = finish_run(*sample_run)
+                if sample_err:
+                    st.caption('⚠️ A análise falhou na amostra; aguardando a base completa.')
+                elif sample_out.strip():
+                    st.code(sample_out)
         else:
-            push_assistant('Análise executada com sucesso.')
+            full_run = submit_run(code, df, dataset_path, run_stats, st.session_state.file_hash)
+
+        # Base completa: substitui o resultado preliminar no mesmo espaço
+        with result_slot.container():
+            stdout_text, error_text, outputs, result_id = finish_run(*full_run)
+        if run_stats.get('memo_hit'):
+            st.caption('♻️ Mesmo código sobre os mesmos dados: resultado reaproveitado, sem nova execução.')
+        elif run_stats.get('total_columns'):
+            st.caption(f"🧮 Colunas materializadas pela análise: {run_stats['materialized_columns']} "
+                       f"de {run_stats['total_columns']}")
+
+        if error_text:
+            # o código que falhou não pode ficar no cache para a mesma pergunta (nem para as parecidas)
+            invalidate_analysis_code(user_input, context_text, schema, analysis.engine)
+            push_assistant(f'Ocorreu um erro na execução:\n\n```\n{error_text}\n```')
+            st.stop()
+
+        if stdout_text.strip():
+            with st.chat_message('assistant'):
+                st.markdown('**Resultado da análise:**')
+                st.code(stdout_text)
+
+        # o histórico guarda só o id: reruns reproduzem as saídas sem nova execução
+        if result_id and (stdout_text.strip() or outputs):
+            st.session_state.chat_history.append({
+                'role': 'assistant',
+                'content': '**Resultado da análise:**',
+                'result_id': result_id,
+            })
+
+        if stdout_text.strip():
+            new_insights = extract_insights(stdout_text)
+            if new_insights:
+                st.session_state.insights.extend(new_insights)
+                st.toast(f'{len(new_insights)} conclusão(ões) registrada(s) 📌', icon='✍️')
+                push_assistant('Memória atualizada com novas conclusões.')
+            else:
+                push_assistant('Análise executada com sucesso.')
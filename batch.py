@@ -0,0 +1,418 @@
+# batch.py
+"""
+Análise em lote, sem Streamlit: carrega o CSV uma vez, gera o código de cada
+pergunta em paralelo (pool limitado + limite de requisições por minuto), executa
+nos workers isolados e escreve um relatório HTML e/ou Markdown com gráficos e
+conclusões.
+
+Cada pergunta concluída é gravada em <out>/results.jsonl assim que termina; ao
+rodar de novo com o mesmo CSV, as perguntas já concluídas com sucesso são
+reaproveitadas e só as que faltam (ou falharam) são refeitas.
+
+Uso:
+    OPENAI_API_KEY=... python batch.py extrato.csv perguntas.txt --out relatorio/ --concurrency 4 --rpm 60
+
+Perguntas: arquivo .txt (uma por linha; linhas vazias e iniciadas por # são ignoradas)
+ou .json (lista de strings).
+"""
+
+import os
+import sys
+import json
+import html
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+import telemetry
+import dataset_cache
+from agent import (
+    initialize_openai_api,
+    get_analysis_code,
+    invalidate_analysis_code,
+    get_semantic_index,
+    execute_code,
+    clean_generated_code,
+    FALLBACK_CODE,
+)
+from code_cache import normalize_prompt
+from code_rewrite import optimize_code
+from ingest import read_csv_optimized
+from profiling import build_profile
+from prompt_context import build_prompt_context, PROMPT_TOKEN_BUDGET
+from result_store import extract_insights
+from timeseries import build_rollups
+from sketches import DatasetSketch
+from workers import WorkerPool, _Recorder, EXEC_WORKERS
+
+BATCH_RPM = float(os.environ.get('EDA_BATCH_RPM', 60))
+RESULTS_FILE = 'results.jsonl'
+FIGURES_DIR = 'figures'
+MAX_TABLE_ROWS = 50
+# parâmetros de layout das chamadas st.* que não fazem parte do conteúdo
+LAYOUT_KWARGS = ('use_container_width', 'hide_index', 'column_config', 'key', 'height', 'width',
+                 'help', 'unsafe_allow_html', 'language', 'anchor', 'divider')
+
+# ================= Limite de taxa =================
+class RateLimiter:
+    """No máximo `per_minute` liberações por minuto, espaçadas igualmente; seguro entre threads."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute and per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+# ================= Entradas =================
+def load_questions(path: str) -> list:
+    with open(path, encoding='utf-8') as fh:
+        if path.endswith('.json'):
+            return [str(q).strip() for q in json.load(fh) if str(q).strip()]
+        return [line.strip() for line in fh if line.strip() and not line.lstrip().startswith('#')]
+
+def load_dataset(csv_path: str):
+    """(df, digest, caminho Feather ou None): usa o cache de datasets quando possível."""
+    with open(csv_path, 'rb') as fh:
+        digest = dataset_cache.content_hash(fh)
+        if dataset_cache.has(digest):
+            df, info = dataset_cache.load(digest)
+        else:
+            sketch = DatasetSketch()
+            df, info = read_csv_optimized(fh, sketch=sketch)
+            dataset_cache.store(digest, df, info)
+            dataset_cache.store_sketch(digest, sketch)
+    return df, digest, dataset_cache.path_for(digest)
+
+def load_rollups(df: pd.DataFrame, digest: str) -> dict:
+    """Agregados por período da data principal, do cache ou calculados (e gravados) agora."""
+    rollups = dataset_cache.load_rollups(digest)
+    if rollups is None:
+        rollups = build_rollups(df)
+        dataset_cache.store_rollups(digest, rollups)
+    return rollups
+
+def load_sketch(df: pd.DataFrame, digest: str) -> DatasetSketch:
+    """Sketches do dataset (distintos, quantis, frequentes), do cache ou construídos (e gravados) agora."""
+    sketch = dataset_cache.load_sketch(digest)
+    if sketch is None:
+        sketch = DatasetSketch.from_frame(df)
+        dataset_cache.store_sketch(digest, sketch)
+    return sketch
+
+def question_id(digest: str, question: str) -> str:
+    """Id estável por (dataset, pergunta normalizada): é o que permite retomar."""
+    return hashlib.sha1(f'{digest}\n{normalize_prompt(question)}'.encode('utf-8')).hexdigest()[:16]
+
+def load_done(out_dir: str, failed: set | None = None) -> dict:
+    """
+    Registros já concluídos com sucesso em execuções anteriores (o último de cada id vence).
+    `failed`, se dado, recebe os ids cujo último registro foi um erro.
+    """
+    done = {}
+    failed = set() if failed is None else failed
+    path = os.path.join(out_dir, RESULTS_FILE)
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # linha truncada por uma interrupção
+            if rec.get('status') == 'ok':
+                done[rec['id']] = rec
+                failed.discard(rec['id'])
+            else:
+                done.pop(rec.get('id'), None)
+                failed.add(rec.get('id'))
+    return done
+
+# ================= Saídas =================
+def _table_block(obj) -> dict:
+    head = obj.head(MAX_TABLE_ROWS) if isinstance(obj, pd.DataFrame) else obj.head(MAX_TABLE_ROWS).to_frame()
+    return {'kind': 'table', 'md': head.to_markdown(), 'html': head.to_html(border=0)}
+
+def save_outputs(ops: list, out_dir: str, qid: str) -> list:
+    """Converte os ops gravados em blocos do relatório; figuras vão para arquivos em figures/."""
+    fig_dir = os.path.join(out_dir, FIGURES_DIR)
+    os.makedirs(fig_dir, exist_ok=True)
+    blocks = []
+    for i, op in enumerate(ops):
+        if op['kind'] == 'plotly':
+            name = f'{FIGURES_DIR}/{qid}_{i}.json'
+            with open(os.path.join(out_dir, name), 'w', encoding='utf-8') as fh:
+                fh.write(op['json'])
+            blocks.append({'kind': 'plotly', 'file': name})
+        elif op['kind'] == 'image':
+            name = f'{FIGURES_DIR}/{qid}_{i}.png'
+            with open(os.path.join(out_dir, name), 'wb') as fh:
+                fh.write(op['png'])
+            blocks.append({'kind': 'image', 'file': name})
+        elif op['kind'] == 'call':
+            for arg in op['args']:
+                if isinstance(arg, (pd.DataFrame, pd.Series)):
+                    blocks.append(_table_block(arg))
+                elif isinstance(arg, str) and arg.strip():
+                    blocks.append({'kind': 'text', 'text': arg})
+            # st.metric(label=..., value=..., delta=...), st.dataframe(data=df)...
+            fields = []
+            for key, value in op.get('kwargs', {}).items():
+                if isinstance(value, (pd.DataFrame, pd.Series)):
+                    blocks.append(_table_block(value))
+                elif key not in LAYOUT_KWARGS and value is not None:
+                    fields.append(f'{key}: {value}')
+            if fields:
+                blocks.append({'kind': 'text', 'text': ' | '.join(fields)})
+    return blocks
+
+# ================= Execução =================
+class BatchRunner:
+    def __init__(self, df: pd.DataFrame, digest: str, data_path: str | None, out_dir: str,
+                 context: str, schema: list, limiter: RateLimiter, pool: WorkerPool | None,
+                 retries: int = 2, rollups: dict | None = None, sketch: DatasetSketch | None = None,
+                 exact_stats: bool = False):
+        self.df = df
+        self.digest = digest
+        self.data_path = data_path
+        self.out_dir = out_dir
+        self.context = context
+        self.schema = schema
+        self.limiter = limiter
+        self.pool = pool
+        self.retries = retries
+        self.rollups = rollups or {}
+        self.sketch = sketch
+        self.exact_stats = exact_stats
+        self._write_lock = threading.Lock()
+
+    def _codegen(self, question: str) -> str:
+        fallback = clean_generated_code(FALLBACK_CODE)
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            code = get_analysis_code(question, self.context, schema=self.schema)
+            if code != fallback:
+                return code
+            if attempt < self.retries:
+                time.sleep(min(30, 2 ** attempt))
+        raise RuntimeError('falha ao gerar código (API indisponível ou limite de taxa).')
+
+    def _execute(self, code: str):
+        if self.pool is not None and self.data_path:
+            rollups_path = dataset_cache.rollups_path_for(self.digest) if self.rollups else None
+            sketch_path = dataset_cache.sketch_path_for(self.digest) if self.sketch is not None else None
+            return self.pool.run(code, self.data_path, rollups_path=rollups_path, sketch_path=sketch_path,
+                                 exact_stats=self.exact_stats)
+        # stdout e figuras são isolados por execução (exec_capture): threads executam em paralelo
+        ops = []
+        out, err = execute_code(code, self.df, st_module=_Recorder(ops), rollups=self.rollups,
+                                sketch=self.sketch, exact_stats=self.exact_stats)
+        return out, err, ops
+
+    def run_question(self, index: int, question: str) -> dict:
+        qid = question_id(self.digest, question)
+        rec = {'id': qid, 'index': index, 'question': question, 'dataset': self.digest}
+        t0 = time.perf_counter()
+        with telemetry.trace('batch', question_index=index):
+            try:
+                code = self._codegen(question)
+                code, report = optimize_code(code, n_rows=len(self.df), dtypes=self.df.dtypes)
+                rec['code'] = code
+                rec['rewrites'] = len(report['rewrites'])
+                stdout, error, ops = self._execute(code)
+                rec['stdout'] = stdout
+                rec['insights'] = extract_insights(stdout)
+                rec['outputs'] = save_outputs(ops, self.out_dir, qid)
+                rec['error'] = error
+                rec['status'] = 'error' if error else 'ok'
+                if error:
+                    # a próxima retomada gera código novo em vez de repetir o que falhou
+                    invalidate_analysis_code(question, self.context, schema=self.schema)
+            except Exception as e:
+                rec['error'] = f'{type(e).__name__}: {e}'
+                rec['status'] = 'error'
+        rec['seconds'] = round(time.perf_counter() - t0, 3)
+        with self._write_lock:
+            with open(os.path.join(self.out_dir, RESULTS_FILE), 'a', encoding='utf-8') as fh:
+                fh.write(json.dumps(rec, ensure_ascii=False, default=str) + '\n')
+        return rec
+
+# ================= Relatório =================
+def write_markdown(path: str, title: str, meta: dict, records: list):
+    import plotly.io as pio
+
+    out_dir = os.path.dirname(path)
+    lines = [f'# {title}', '', f"Dataset `{meta['csv']}` · {meta['rows']:,} linhas · {meta['cols']} colunas · "
+             f"{meta['ok']}/{meta['total']} perguntas concluídas", '']
+    insights = [(r['index'], i) for r in records for i in r.get('insights') or []]
+    if insights:
+        lines += ['## Conclusões', ''] + [f'- {text} _(pergunta {idx + 1})_' for idx, text in insights] + ['']
+    for r in records:
+        lines += [f"## {r['index'] + 1}. {r['question']}", '']
+        if r.get('status') != 'ok':
+            last = ((r.get('error') or '').strip().splitlines() or ['erro'])[-1]
+            lines += [f'> ⚠️ Falhou: {last[:500]}', '']
+        if r.get('stdout', '').strip():
+            lines += ['```', r['stdout'].rstrip(), '```', '']
+        for b in r.get('outputs') or []:
+            if b['kind'] == 'plotly':
+                page = b['file'][:-5] + '.html'
+                with open(os.path.join(out_dir, b['file']), encoding='utf-8') as fh:
+                    pio.from_json(fh.read()).write_html(os.path.join(out_dir, page), include_plotlyjs='cdn')
+                lines += [f'[Gráfico interativo]({page})', '']
+            elif b['kind'] == 'image':
+                lines += [f"![figura]({b['file']})", '']
+            elif b['kind'] == 'table':
+                lines += [b['md'], '']
+            else:
+                lines += [b['text'], '']
+        if r.get('code'):
+            lines += ['<details><summary>Código</summary>', '', '```python', r['code'].rstrip(), '```',
+                      '', '</details>', '']
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write('\n'.join(lines))
+
+def write_html(path: str, title: str, meta: dict, records: list):
+    import plotly.io as pio
+
+    out_dir = os.path.dirname(path)
+    esc = html.escape
+    parts = [
+        '<!doctype html><html><head><meta charset="utf-8">',
+        f'<title>{esc(title)}</title>',
+        '<script src="https://cdn.plot.ly/plotly-2.35.2.min.js"></script>',
+        '<style>body{font-family:system-ui,sans-serif;max-width:1100px;margin:2rem auto;padding:0 1rem}'
+        'pre{background:#f4f5f7;padding:.8rem;overflow:auto}.err{color:#b00020}'
+        'table{border-collapse:collapse}td,th{padding:2px 8px;border-bottom:1px solid #ddd}</style>',
+        '</head><body>',
+        f'<h1>{esc(title)}</h1>',
+        f"<p>Dataset <code>{esc(meta['csv'])}</code> · {meta['rows']:,} linhas · {meta['cols']} colunas · "
+        f"{meta['ok']}/{meta['total']} perguntas concluídas</p>",
+    ]
+    insights = [(r['index'], i) for r in records for i in r.get('insights') or []]
+    if insights:
+        parts.append('<h2>Conclusões</h2><ul>')
+        parts += [f'<li>{esc(text)} <small>(pergunta {idx + 1})</small></li>' for idx, text in insights]
+        parts.append('</ul>')
+    for r in records:
+        parts.append(f"<h2>{r['index'] + 1}. {esc(r['question'])}</h2>")
+        if r.get('status') != 'ok':
+            parts.append(f"<pre class=\"err\">{esc((r.get('error') or 'erro').strip()[-2000:])}</pre>")
+        if r.get('stdout', '').strip():
+            parts.append(f"<pre>{esc(r['stdout'].rstrip())}</pre>")
+        for b in r.get('outputs') or []:
+            if b['kind'] == 'plotly':
+                with open(os.path.join(out_dir, b['file']), encoding='utf-8') as fh:
+                    parts.append(pio.from_json(fh.read()).to_html(full_html=False, include_plotlyjs=False))
+            elif b['kind'] == 'image':
+                parts.append(f"<img src=\"{esc(b['file'])}\" style=\"max-width:100%\">")
+            elif b['kind'] == 'table':
+                parts.append(b['html'])
+            else:
+                parts.append(f"<p>{esc(b['text'])}</p>")
+        if r.get('code'):
+            parts.append(f"<details><summary>Código</summary><pre>{esc(r['code'])}</pre></details>")
+    parts.append('</body></html>')
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write('\n'.join(parts))
+
+# ================= CLI =================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Análise em lote de um CSV com uma lista de perguntas.')
+    parser.add_argument('csv')
+    parser.add_argument('questions', help='.txt (uma pergunta por linha) ou .json (lista)')
+    parser.add_argument('--out', default='relatorio')
+    parser.add_argument('--title', default='Relatório de análise')
+    parser.add_argument('--concurrency', type=int, default=4, help='gerações de código simultâneas')
+    parser.add_argument('--rpm', type=float, default=BATCH_RPM, help='máximo de chamadas ao LLM por minuto (0 = sem limite)')
+    parser.add_argument('--workers', type=int, default=EXEC_WORKERS, help='processos de execução')
+    parser.add_argument('--no-isolated', action='store_true', help='executa nas threads do próprio processo, sem worker isolado (em paralelo, até --concurrency)')
+    parser.add_argument('--retries', type=int, default=2, help='novas tentativas de geração por pergunta')
+    parser.add_argument('--budget', type=int, default=PROMPT_TOKEN_BUDGET, help='orçamento de tokens do contexto')
+    parser.add_argument('--exact', action='store_true', help='estatísticas exatas em vez dos sketches aproximados')
+    parser.add_argument('--format', choices=['html', 'md', 'both'], default='both')
+    parser.add_argument('--no-resume', action='store_true', help='refaz todas as perguntas')
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        print('Defina OPENAI_API_KEY.', file=sys.stderr)
+        return 2
+    initialize_openai_api(api_key)
+
+    os.makedirs(args.out, exist_ok=True)
+    if args.no_resume:
+        if os.path.exists(os.path.join(args.out, RESULTS_FILE)):
+            os.remove(os.path.join(args.out, RESULTS_FILE))
+        shutil.rmtree(os.path.join(args.out, FIGURES_DIR), ignore_errors=True)
+
+    questions = load_questions(args.questions)
+    print(f'Carregando {args.csv}...', file=sys.stderr)
+    df, digest, data_path = load_dataset(args.csv)
+    sketch = load_sketch(df, digest)
+    profile = build_profile(df, sketch=None if args.exact else sketch)
+    rollups = load_rollups(df, digest)
+    context = build_prompt_context(profile, args.budget, rollups)
+    schema = [(c, str(t)) for c, t in zip(profile['columns']['coluna'], profile['columns']['dtype'])]
+
+    failed = set()
+    done = load_done(args.out, failed)
+    records = {}
+    pending = []
+    for i, q in enumerate(questions):
+        qid = question_id(digest, q)
+        rec = done.get(qid)
+        if rec is not None:
+            records[i] = {**rec, 'index': i}
+            continue
+        if qid in failed:
+            # código de uma execução anterior que falhou (ex.: gravado antes da invalidação)
+            invalidate_analysis_code(q, context, schema=schema)
+        pending.append((i, q))
+    print(f'{len(questions)} perguntas: {len(records)} reaproveitadas, {len(pending)} a executar.', file=sys.stderr)
+
+    pool = None if args.no_isolated or not data_path else WorkerPool(size=max(1, args.workers))
+    runner = BatchRunner(df, digest, data_path, args.out, context, schema,
+                         RateLimiter(args.rpm), pool, retries=args.retries, rollups=rollups,
+                         sketch=sketch, exact_stats=args.exact)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix='eda-batch') as ex:
+            futures = {ex.submit(runner.run_question, i, q): i for i, q in pending}
+            for n, fut in enumerate(as_completed(futures), 1):
+                rec = fut.result()
+                records[rec['index']] = rec
+                print(f"[{n}/{len(pending)}] {rec['status']:<5} {rec['seconds']:>7.1f}s  {rec['question'][:70]}",
+                      file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    ordered = [records[i] for i in sorted(records)]
+    meta = {'csv': os.path.basename(args.csv), 'rows': profile['n_rows'], 'cols': profile['n_cols'],
+            'ok': sum(r.get('status') == 'ok' for r in ordered), 'total': len(ordered)}
+    if args.format in ('md', 'both'):
+        write_markdown(os.path.join(args.out, 'report.md'), args.title, meta, ordered)
+    if args.format in ('html', 'both'):
+        write_html(os.path.join(args.out, 'report.html'), args.title, meta, ordered)
+    sem = get_semantic_index().stats()
+    if sem['hits'] or sem['misses']:
+        print(f"Perguntas parecidas: {sem['hits']} reaproveitadas (taxa {sem['hit_rate']:.0%}, "
+              f"~{sem['saved_s']:.1f}s de geração economizados).", file=sys.stderr)
+    print(f"Relatório em {args.out} ({meta['ok']}/{meta['total']} ok).", file=sys.stderr)
+    return 0 if meta['ok'] == meta['total'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+# benchmark.py
+"""
+Benchmark offline de ponta a ponta, sem chamadas à OpenAI.
+
+Um cliente falso substitui o OpenAI e reproduz respostas gravadas para
+classify_intent, get_chat_response e get_analysis_code (com streaming e
+latência simulada). CSVs sintéticos são gerados em disco e cada etapa é
+cronometrada separadamente: upload, perfil, montagem do prompt, classificação,
+chat, geração de código, execução (agent.execute_code, o mesmo caminho do app
+em processo) e renderização (render_outputs, como no app).
+
+Caches e logs do agent ficam em um diretório temporário removido ao final; o
+agent só é importado depois que main() aponta as variáveis EDA_* para ele.
+
+Uso:
+    python benchmark.py --rows 1000000 5000000 --shape narrow wide --out bench.json
+    python benchmark.py --compare antes.json depois.json
+
+Arquivo de respostas (--responses), JSON com as chaves opcionais:
+    {"classify": "analysis", "chat": "texto...", "analysis": "código python..."}
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from ingest import read_csv_optimized
+from profiling import build_profile
+from sketches import DatasetSketch
+from prompt_context import build_prompt_context
+from workers import _Recorder, render_outputs
+
+DEFAULT_RESPONSES = {
+    'classify': 'analysis',
+    'chat': 'Olá! Sou o OpenAI Data Agent. Posso analisar seu CSV, gerar gráficos e resumir conclusões.',
+    'analysis': (
+        "num = df.select_dtypes('number')\n"
+        "print(num.describe().T)\n"
+        "col = num.columns[0]\n"
+        "fig = plot_hist(df, col, bins=50)\n"
+        "st.plotly_chart(fig, use_container_width=True)\n"
+        "print(f'INSIGHT: média de {col} = {num[col].mean():.2f}')\n"
+    ),
+}
+
+SHAPES = {
+    # (numéricas, categóricas de baixa cardinalidade, texto de alta cardinalidade)
+    'narrow': (6, 2, 0),
+    'wide': (120, 30, 0),
+    'highcard': (4, 2, 3),
+}
+
+# ================= Cliente OpenAI falso =================
+class FakeCompletions:
+    """Reproduz respostas gravadas; escolhe a resposta pelo tipo de chamada (max_tokens / prompt)."""
+
+    def __init__(self, responses: dict, ttft_ms: float = 0.0, token_ms: float = 0.0):
+        self.responses = responses
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.calls = []
+
+    def _kind(self, kwargs) -> str:
+        if kwargs.get('max_tokens', 0) <= 8:
+            return 'classify'
+        system = kwargs['messages'][0]['content']
+        return 'analysis' if 'EDA' in system else 'chat'
+
+    def create(self, **kwargs):
+        kind = self._kind(kwargs)
+        text = self.responses[kind]
+        self.calls.append(kind)
+        time.sleep(self.ttft_ms / 1000)
+        if not kwargs.get('stream'):
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+        return self._stream(text)
+
+    def _stream(self, text: str):
+        # ~4 caracteres por token, como estimativa grosseira
+        for i in range(0, len(text), 4):
+            if self.token_ms:
+                time.sleep(self.token_ms / 1000)
+            delta = SimpleNamespace(content=text[i:i + 4])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+class FakeOpenAI:
+    def __init__(self, responses: dict, ttft_ms: float = 0.0, token_ms: float = 0.0):
+        self.chat = SimpleNamespace(completions=FakeCompletions(responses, ttft_ms, token_ms))
+
+# ================= Dados sintéticos =================
+def make_csv(path: str, rows: int, shape: str, seed: int = 0, chunk_rows: int = 500_000) -> int:
+    """Gera um CSV sintético em chunks; retorna o tamanho em bytes."""
+    n_num, n_cat, n_text = SHAPES[shape]
+    rng = np.random.default_rng(seed)
+    cats = [f'cat_{i}' for i in range(12)]
+    written = 0
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            data = {'date': pd.Timestamp('2020-01-01') + pd.to_timedelta(
+                np.arange(written, written + n) * 60, unit='s')}
+            for i in range(n_num):
+                data[f'num_{i}'] = rng.normal(100, 25, n).round(3) if i % 2 else rng.integers(0, 10_000, n)
+            for i in range(n_cat):
+                data[f'cat_{i}'] = rng.choice(cats, n)
+            for i in range(n_text):
+                data[f'id_{i}'] = np.char.add('id_', rng.integers(0, rows, n).astype(str))
+            pd.DataFrame(data).to_csv(fh, index=False, header=written == 0)
+            written += n
+    return os.path.getsize(path)
+
+# ================= Etapas =================
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+def run_once(csv_path: str, prompt: str) -> dict:
+    import agent  # depois de main() isolar os caches (ver _isolate)
+
+    stages = {}
+    sketch = DatasetSketch()
+    with open(csv_path, 'rb') as fh:
+        (df, load_info), stages['upload'] = _timed(read_csv_optimized, fh, sketch=sketch)
+
+    profile, stages['profile'] = _timed(build_profile, df, sketch=sketch)
+
+    def build_prompt():
+        sample = build_prompt_context(profile)
+        schema = [(c, str(t)) for c, t in zip(profile['columns']['coluna'], profile['columns']['dtype'])]
+        return sample, schema
+    (sample, schema), stages['prompt'] = _timed(build_prompt)
+
+    # classificação pelo caminho do LLM (o classificador local é medido à parte)
+    _, stages['classify_llm'] = _timed(agent._classify_intent_llm, prompt)
+    _, stages['classify'] = _timed(agent.classify_intent, prompt)
+    _, stages['chat'] = _timed(agent.get_chat_response, 'olá')
+
+    agent.get_code_cache().clear()
+    agent.get_semantic_index().clear()
+    code, stages['codegen'] = _timed(agent.get_analysis_code, prompt, sample, schema)
+    _, stages['codegen_cached'] = _timed(agent.get_analysis_code, prompt, sample, schema)
+
+    ops = []
+    (stdout, error), stages['execute'] = _timed(
+        agent.execute_code, code, df, st_module=_Recorder(ops), sketch=sketch
+    )
+    _, stages['render'] = _timed(render_outputs, ops)
+    payload = json.dumps(ops, default=lambda o: f'<{len(o)} bytes>')
+    return {
+        'stages': stages,
+        'rows': len(df),
+        'cols': df.shape[1],
+        'mem_before': load_info.get('mem_before'),
+        'mem_after': load_info.get('mem_after'),
+        'payload_bytes': len(payload),
+        'error': error,
+        'insight': next((l for l in stdout.splitlines() if 'INSIGHT:' in l), None),
+    }
+
+def _median_stages(runs: list) -> dict:
+    keys = runs[0]['stages'].keys()
+    return {k: round(statistics.median(r['stages'][k] for r in runs), 6) for k in keys}
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+# ================= Comparação =================
+def compare(old_path: str, new_path: str) -> int:
+    with open(old_path, encoding='utf-8') as fh:
+        old = json.load(fh)
+    with open(new_path, encoding='utf-8') as fh:
+        new = json.load(fh)
+    old_by_key = {(r['shape'], r['rows_requested']): r for r in old['results']}
+    print(f"{'dataset':<22}{'etapa':<16}{'antes (s)':>12}{'depois (s)':>12}{'Δ%':>9}")
+    for r in new['results']:
+        key = (r['shape'], r['rows_requested'])
+        base = old_by_key.get(key)
+        if base is None:
+            continue
+        for stage, t in r['stages'].items():
+            t_old = base['stages'].get(stage)
+            if t_old is None:
+                continue
+            delta = (t - t_old) / t_old * 100 if t_old else 0.0
+            print(f'{key[0] + "/" + str(key[1]):<22}{stage:<16}{t_old:>12.4f}{t:>12.4f}{delta:>8.1f}%')
+    return 0
+
+# ================= CLI =================
+def _isolate(tmp: str):
+    """Caches e logs do agent em tmp (antes do primeiro import do agent; variáveis já definidas valem)."""
+    os.environ.setdefault('EDA_CODE_CACHE_PATH', os.path.join(tmp, 'code_cache.sqlite'))
+    os.environ.setdefault('EDA_INTENT_LOG_PATH', os.path.join(tmp, 'intent_log.jsonl'))
+    os.environ.setdefault('EDA_CACHE_DIR', os.path.join(tmp, 'datasets'))
+
+def run_all(args, responses: dict, data_dir: str) -> list:
+    import agent
+
+    agent._client = FakeOpenAI(responses, args.ttft_ms, args.token_ms)
+    random.seed(0)
+
+    results = []
+    os.makedirs(data_dir, exist_ok=True)
+    for shape in args.shape:
+        for rows in args.rows:
+            path = os.path.join(data_dir, f'synthetic_{shape}_{rows}.csv')
+            if not os.path.exists(path):
+                print(f'Gerando {path}...', file=sys.stderr)
+                make_csv(path, rows, shape)
+            runs = [run_once(path, args.prompt) for _ in range(args.repeat)]
+            result = {
+                'shape': shape,
+                'rows_requested': rows,
+                'file_bytes': os.path.getsize(path),
+                **{k: v for k, v in runs[-1].items() if k != 'stages'},
+                'stages': _median_stages(runs),
+            }
+            results.append(result)
+            print(json.dumps({'shape': shape, 'rows': rows, 'stages': result['stages']}), file=sys.stderr)
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark offline do agente de EDA.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000])
+    parser.add_argument('--shape', choices=sorted(SHAPES), nargs='+', default=['narrow'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--prompt', default='histograma de num_0')
+    parser.add_argument('--responses', help='JSON com respostas gravadas (classify/chat/analysis)')
+    parser.add_argument('--ttft-ms', type=float, default=0.0, help='latência simulada até o 1º token')
+    parser.add_argument('--token-ms', type=float, default=0.0, help='latência simulada por token')
+    parser.add_argument('--data-dir', help='onde gerar (e reaproveitar) os CSVs; padrão: diretório temporário')
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('ANTES', 'DEPOIS'))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare)
+
+    responses = dict(DEFAULT_RESPONSES)
+    if args.responses:
+        with open(args.responses, encoding='utf-8') as fh:
+            responses.update(json.load(fh))
+    with tempfile.TemporaryDirectory(prefix='eda-bench-') as tmp:
+        _isolate(tmp)
+        results = run_all(args, responses, args.data_dir or os.path.join(tmp, 'data'))
+
+    report = {
+        'git_rev': _git_rev(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'config': {k: v for k, v in vars(args).items() if k not in {'compare'}},
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2, default=str)
+    print(f'Resultados gravados em {args.out}', file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
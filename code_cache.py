@@ -0,0 +1,178 @@
+# code_cache.py
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from contextlib import closing
+from collections import OrderedDict
+
+CACHE_PATH = os.environ.get('EDA_CODE_CACHE_PATH', os.path.join('.cache', 'code_cache.sqlite'))
+CACHE_TTL = float(os.environ.get('EDA_CODE_CACHE_TTL', 7 * 24 * 3600))       # segundos
+CACHE_MAX_BYTES = int(os.environ.get('EDA_CODE_CACHE_MAX_BYTES', 50 * 1024 ** 2))
+MEMORY_MAX_ENTRIES = 256
+
+# ================= Chave =================
+def normalize_prompt(prompt: str) -> str:
+    """Normaliza o prompt: NFKC, casefold, espaços colapsados e pontuação final removida."""
+    text = unicodedata.normalize('NFKC', prompt).casefold()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' .!?;:')
+
+def make_key(prompt: str, schema, params: dict) -> str:
+    """Hash de (prompt normalizado, schema [(coluna, dtype)], parâmetros do modelo)."""
+    payload = json.dumps(
+        {
+            'prompt': normalize_prompt(prompt),
+            'schema': [[str(c), str(t)] for c, t in schema],
+            'params': params,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# ================= Cache em dois níveis =================
+class CodeCache:
+    """
+    Cache de código gerado: LRU em memória na frente de um SQLite em disco.
+    Entradas expiram após `ttl` segundos; o disco é podado por tamanho total (LRU).
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl: float = CACHE_TTL,
+                 max_bytes: int = CACHE_MAX_BYTES, memory_entries: int = MEMORY_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._mem = OrderedDict()  # key -> (code, created)
+        self._lock = threading.Lock()
+        self._stats = {'hits_memory': 0, 'hits_disk': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._disk_ok = self._init_db()
+
+    # -------- SQLite --------
+    def _connect(self):
+        # `with con:` só faz commit/rollback; quem usa envolve em closing() para fechar a conexão
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _init_db(self) -> bool:
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with closing(self._connect()) as con, con:
+                con.execute(
+                    'CREATE TABLE IF NOT EXISTS code_cache ('
+                    ' key TEXT PRIMARY KEY, code TEXT NOT NULL,'
+                    ' created REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)'
+                )
+            return True
+        except Exception:
+            return False
+
+    def _evict_disk(self, con):
+        total = con.execute('SELECT COALESCE(SUM(size), 0) FROM code_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = con.execute('SELECT key, size FROM code_cache ORDER BY accessed').fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            con.execute('DELETE FROM code_cache WHERE key = ?', (key,))
+            total -= size
+            self._stats['evictions'] += 1
+
+    # -------- API --------
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                code, created = hit
+                if now - created <= self.ttl:
+                    self._mem.move_to_end(key)
+                    self._stats['hits_memory'] += 1
+                    return code
+                del self._mem[key]
+
+        if self._disk_ok:
+            try:
+                with closing(self._connect()) as con, con:
+                    row = con.execute(
+                        'SELECT code, created FROM code_cache WHERE key = ?', (key,)
+                    ).fetchone()
+                    if row is not None and now - row[1] > self.ttl:
+                        con.execute('DELETE FROM code_cache WHERE key = ?', (key,))
+                        row = None
+                    if row is not None:
+                        con.execute('UPDATE code_cache SET accessed = ? WHERE key = ?', (now, key))
+            except Exception:
+                row = None
+            if row is not None:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                    self._stats['hits_disk'] += 1
+                return row[0]
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key: str, code: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, code, now)
+            self._stats['stores'] += 1
+        if not self._disk_ok:
+            return
+        try:
+            with closing(self._connect()) as con, con:
+                con.execute(
+                    'INSERT OR REPLACE INTO code_cache (key, code, created, accessed, size) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, code, now, now, len(code.encode('utf-8'))),
+                )
+                self._evict_disk(con)
+        except Exception:
+            pass
+
+    def delete(self, key: str):
+        """Remove a entrada (ex.: o código falhou na execução e não deve ser reaproveitado)."""
+        with self._lock:
+            self._mem.pop(key, None)
+        if not self._disk_ok:
+            return
+        try:
+            with closing(self._connect()) as con, con:
+                con.execute('DELETE FROM code_cache WHERE key = ?', (key,))
+        except Exception:
+            pass
+
+    def _remember(self, key: str, code: str, created: float):
+        self._mem[key] = (code, created)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.memory_entries:
+            self._mem.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        hits = out['hits_memory'] + out['hits_disk']
+        lookups = hits + out['misses']
+        out['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        out['memory_entries'] = len(self._mem)
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+        if self._disk_ok:
+            try:
+                with closing(self._connect()) as con, con:
+                    con.execute('DELETE FROM code_cache')
+            except Exception:
+                pass
@@ -0,0 +1,546 @@
+# code_rewrite.py
+"""
+Passo entre a geração e a execução do código: analisa o código com `ast`,
+reescreve idiomas lentos de pandas em formas vetorizadas quando a troca é segura
+e sinaliza os demais com um custo estimado.
+
+Reescritas (só com expressões simples: colunas da linha, constantes, + - * / // % **,
+comparações e abs(); sem variáveis externas nem chamadas; só quando os tipos das colunas
+são conhecidos, ver _cast):
+- X.apply(lambda r: expr, axis=1)            -> expr com r['c'] trocado por X['c']
+- X['c'].apply(lambda v: expr)               -> expr com v trocado por X['c']
+- for _, r in X.iterrows(): lst.append(expr)  -> lst.extend((expr vetorizada).tolist())
+  (idem para itertuples() e para `for v in X['c']`), e as list comprehensions equivalentes;
+  em `for v in X['c']` X precisa ser comprovadamente o DataFrame (`df` ou um nome
+  atribuído só a partir de df[...], df.loc[...], df.copy()...), pois X['c'] pode ser uma lista
+- pd.to_datetime(...) repetido com os mesmos argumentos em comandos de nível superior
+  -> convertido uma única vez numa variável auxiliar, se X não for alterado no meio;
+  ocorrências atribuídas diretamente a um nome ficam como estão (o objeto seria compartilhado),
+  e nada é feito se X tiver apelidos (d2 = df, f(df)...), que poderiam alterá-lo por outro nome
+
+As edições são aplicadas sobre o texto original (comentários e formatação são mantidos).
+"""
+
+import ast
+import difflib
+import numpy as np
+import pandas as pd
+
+# custo aproximado por linha do DataFrame, em segundos (ordem de grandeza)
+ROW_COST_S = {
+    'iterrows': 5e-5,
+    'apply_axis1': 2e-5,
+    'loop_index': 1e-5,
+    'itertuples': 2e-6,
+    'to_datetime': 1e-6,
+    'series_apply': 5e-7,
+    'loop_series': 3e-7,
+}
+
+_FRAME_ROOT = 'df'
+# métodos do DataFrame que devolvem outro DataFrame com as mesmas colunas
+_FRAME_METHODS = ('copy', 'query', 'dropna', 'head', 'tail', 'sample', 'sort_values',
+                  'sort_index', 'reset_index', 'drop_duplicates', 'fillna')
+# métodos que alteram o objeto no lugar
+_MUTATING_METHODS = ('insert', 'pop', 'update', 'popitem', 'clear', 'setdefault',
+                     'append', 'extend', 'remove', 'sort')
+_BINOPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_CMPOPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+AUX_PREFIX = '_dt_cache_'
+
+# ================= Utilitários =================
+def _is_pure(node) -> bool:
+    """Expressão sem chamadas (nome, atributo ou subscrito constante): pode ser repetida sem efeitos."""
+    if isinstance(node, ast.Name):
+        return True
+    if isinstance(node, ast.Attribute):
+        return _is_pure(node.value)
+    if isinstance(node, ast.Subscript):
+        sl = node.slice
+        ok = isinstance(sl, ast.Constant) or (
+            isinstance(sl, ast.List) and all(isinstance(e, ast.Constant) for e in sl.elts))
+        return ok and _is_pure(node.value)
+    return False
+
+def _base_name(node):
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+def _column_ref(node, param: str):
+    """Nome da coluna se node for param['c'] ou param.c; senão None."""
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == param:
+        if isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+            return node.slice.value
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == param:
+        # atributos próprios da Series (r.shape, r.values...) não são colunas
+        if node.attr != 'Index' and not hasattr(pd.Series, node.attr):
+            return node.attr
+    return None
+
+def _astype(node, dtype):
+    target = ast.Name(id='object', ctx=ast.Load()) if dtype is object else ast.Constant(dtype)
+    return ast.Call(func=ast.Attribute(value=node, attr='astype', ctx=ast.Load()), args=[target], keywords=[])
+
+def _cast(node, dtype):
+    """
+    (nó, tipo) com a coluna convertida para o tipo que a versão linha a linha enxerga, ou None.
+    Linha a linha o Python recebe int/float/str nativos: inteiros pequenos (int8 do ingest)
+    viram int64 para não estourar, floats viram float64 e o resto (category, texto, bool,
+    datas...) vira object, cujas operações são as do próprio Python elemento a elemento.
+    """
+    if dtype is None:
+        return None
+    if isinstance(dtype, np.dtype) and dtype.kind == 'f':
+        return (node if dtype == np.float64 else _astype(node, 'float64')), 'f'
+    if isinstance(dtype, np.dtype) and dtype.kind in 'iu' and dtype != np.uint64:
+        return (node if dtype == np.int64 else _astype(node, 'int64')), 'i'
+    return _astype(node, object), 'O'
+
+def _vectorize(expr, param: str, base, mode: str, dtype_of):
+    """
+    Versão vetorizada de expr ou None.
+    mode='row': param é uma linha (param['c'] / param.c viram base['c']);
+    mode='value': param é um valor da série base (param vira base).
+    dtype_of(coluna) dá o tipo da coluna em df (None se desconhecido: nada é reescrito).
+    """
+    kinds = []
+    has_pow = False
+
+    def column(node, col):
+        cast = _cast(node, dtype_of(col))
+        if cast is None:
+            return None
+        kinds.append(cast[1])
+        return cast[0]
+
+    def conv(node):
+        nonlocal has_pow
+        if mode == 'row':
+            col = _column_ref(node, param)
+            if col is not None:
+                return column(ast.Subscript(value=base, slice=ast.Constant(col), ctx=ast.Load()), col)
+        elif isinstance(node, ast.Name) and node.id == param:
+            return column(base, base.slice.value)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+            # inteiros fora do int64 estourariam na versão vetorizada
+            return node if not isinstance(node.value, int) or abs(node.value) < 2 ** 62 else None
+        if isinstance(node, ast.BinOp) and isinstance(node.op, _BINOPS):
+            has_pow = has_pow or isinstance(node.op, ast.Pow)
+            left, right = conv(node.left), conv(node.right)
+            return None if left is None or right is None else ast.BinOp(left=left, op=node.op, right=right)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = conv(node.operand)
+            return None if operand is None else ast.UnaryOp(op=node.op, operand=operand)
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], _CMPOPS):
+            left, right = conv(node.left), conv(node.comparators[0])
+            return None if left is None or right is None else ast.Compare(
+                left=left, ops=node.ops, comparators=[right])
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'abs'
+                and len(node.args) == 1 and not node.keywords):
+            arg = conv(node.args[0])
+            return None if arg is None else ast.Call(func=node.func, args=[arg], keywords=[])
+        return None
+
+    out = conv(expr)
+    # int64 ** expoente negativo (ou grande) falha/estoura onde o Python devolveria float/int longo
+    if out is None or not kinds or (has_pow and 'i' in kinds):
+        return None
+    if 'O' in kinds:
+        # operações em object devolvem object; apply inferiria o tipo do resultado
+        out = ast.Call(func=ast.Attribute(value=out, attr='infer_objects', ctx=ast.Load()), args=[], keywords=[])
+    return out
+
+def _src(node) -> str:
+    return ast.unparse(ast.fix_missing_locations(node))
+
+def _wrap(node) -> str:
+    """Texto da expressão vetorizada, entre parênteses quando necessário."""
+    text = _src(node)
+    return text if isinstance(node, (ast.Subscript, ast.Name, ast.Call)) else f'({text})'
+
+def _names_loaded(tree, name: str) -> int:
+    return sum(1 for n in ast.walk(tree) if isinstance(n, ast.Name) and n.id == name)
+
+def _simple_lambda(node):
+    if (isinstance(node, ast.Lambda) and len(node.args.args) == 1 and not node.args.vararg
+            and not node.args.kwarg and not node.args.kwonlyargs and not node.args.defaults):
+        return node.args.args[0].arg
+    return None
+
+def _axis_one(call: ast.Call) -> bool:
+    for kw in call.keywords:
+        if kw.arg == 'axis' and isinstance(kw.value, ast.Constant) and kw.value.value in (1, 'columns'):
+            return True
+    return False
+
+def _is_frame_expr(node, frames: set) -> bool:
+    """True se node é comprovadamente um DataFrame derivado de df (nome, filtro, .loc de linhas...)."""
+    if isinstance(node, ast.Name):
+        return node.id in frames
+    if isinstance(node, ast.Subscript):
+        base, sl = node.value, node.slice
+        if isinstance(base, ast.Attribute) and base.attr == 'loc':
+            # df.loc[linhas] ou df.loc[linhas, [colunas]]; df.loc[linhas, 'c'] é uma Series
+            if isinstance(sl, ast.Tuple):
+                return len(sl.elts) == 2 and isinstance(sl.elts[1], ast.List) and _is_frame_expr(base.value, frames)
+            return _is_frame_expr(base.value, frames)
+        # df['c'] é uma Series; df[['a', 'b']] e df[máscara] são DataFrames
+        if isinstance(sl, ast.Constant):
+            return False
+        return _is_frame_expr(base, frames)
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr in _FRAME_METHODS
+            and not any(kw.arg == 'inplace' for kw in node.keywords)):
+        return _is_frame_expr(node.func.value, frames)
+    return False
+
+def _frame_names(tree) -> set:
+    """Nomes que só recebem DataFrames derivados de df (df incluído, se não for reatribuído a outra coisa)."""
+    bindings = {}
+    direct = {}
+    for n in ast.walk(tree):
+        if isinstance(n, ast.Assign):
+            for t in n.targets:
+                if isinstance(t, ast.Name):
+                    direct[id(t)] = n.value
+    for n in ast.walk(tree):
+        # qualquer outra forma de ligar um nome (for, with, desempacotamento, parâmetros...) não é rastreada
+        if isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Load):
+            bindings.setdefault(n.id, []).append(direct.get(id(n)))
+        elif isinstance(n, ast.arg):
+            bindings.setdefault(n.arg, []).append(None)
+        elif isinstance(n, ast.alias):
+            bindings.setdefault(n.asname or n.name.split('.')[0], []).append(None)
+        elif isinstance(n, (ast.Global, ast.Nonlocal)):
+            for name in n.names:
+                bindings.setdefault(name, []).append(None)
+        elif isinstance(n, ast.ExceptHandler) and n.name:
+            bindings.setdefault(n.name, []).append(None)
+    frames = {_FRAME_ROOT} | set(bindings)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(frames):
+            values = bindings.get(name, [])
+            if name != _FRAME_ROOT and not values:
+                continue
+            if any(v is None or not _is_frame_expr(v, frames) for v in values):
+                frames.discard(name)
+                changed = True
+    return frames
+
+def _stored_columns(tree, frames: set):
+    """
+    Colunas que o código grava nos DataFrames (df['c'] = ..., df.loc[m, 'c'] = ...): o tipo
+    delas pode mudar antes do apply. None se não der para saber quais (df[cols] = ..., inplace=True...).
+    """
+    cols = set()
+    for n in ast.walk(tree):
+        if isinstance(n, ast.Subscript) and isinstance(n.ctx, (ast.Store, ast.Del)):
+            if _base_name(n) not in frames:
+                continue
+            sl = n.slice
+            if isinstance(sl, ast.Tuple) and len(sl.elts) == 2:
+                sl = sl.elts[1]
+            if not isinstance(sl, ast.Constant):
+                return None
+            cols.add(sl.value)
+        elif isinstance(n, ast.Attribute) and isinstance(n.ctx, ast.Store) and _base_name(n) in frames:
+            cols.add(n.attr)
+    # inplace=True, df.pop(...), df.update(...)
+    if any(_mutates(n, name) for n in ast.walk(tree) if isinstance(n, ast.Call) for name in frames):
+        return None
+    return cols
+
+def _row_source(it, frames: set):
+    """(modo, base, tipo) para iteráveis linha a linha: X.iterrows(), X.itertuples(), X['c']."""
+    if isinstance(it, ast.Call) and isinstance(it.func, ast.Attribute) and not it.args and not it.keywords:
+        if it.func.attr in ('iterrows', 'itertuples') and _is_pure(it.func.value):
+            return 'row', it.func.value, it.func.attr
+    if isinstance(it, ast.Subscript) and _is_pure(it) and isinstance(it.slice, ast.Constant):
+        # X['c'] só é uma Series se X for o DataFrame; cfg['lista'] seria uma lista comum
+        mode = 'value' if _is_frame_expr(it.value, frames) else None
+        return mode, it, 'loop_series'
+    return None
+
+def _loop_param(target, kind: str):
+    if kind == 'iterrows':
+        if (isinstance(target, ast.Tuple) and len(target.elts) == 2
+                and all(isinstance(e, ast.Name) for e in target.elts)):
+            return target.elts[1].id, target.elts[0].id
+        return None, None
+    return (target.id, None) if isinstance(target, ast.Name) else (None, None)
+
+# ================= Passo 1: apply / laços / comprehensions =================
+class _Rewriter(ast.NodeVisitor):
+    def __init__(self, tree, dtypes=None):
+        self.tree = tree
+        self.frames = _frame_names(tree)
+        self.dtypes = dtypes
+        self.stored = _stored_columns(tree, self.frames)
+        self.edits = []     # (nó, texto novo)
+        self.rewrites = []
+        self.warnings = []
+
+    def _rewrite(self, node, text: str, pattern: str, desc: str):
+        self.edits.append((node, text))
+        self.rewrites.append({'linha': node.lineno, 'padrao': pattern, 'descricao': desc})
+
+    def _warn(self, node, pattern: str, desc: str):
+        self.warnings.append({'linha': node.lineno, 'padrao': pattern, 'descricao': desc})
+
+    def _dtype_of(self, frame):
+        """Função coluna -> tipo para o DataFrame frame (tipo None se não for derivado de df ou se for alterado)."""
+        known = self.dtypes is not None and self.stored is not None and _is_frame_expr(frame, self.frames)
+
+        def dtype_of(col):
+            if not known or col in self.stored:
+                return None
+            return self.dtypes.get(col)
+        return dtype_of
+
+    def _frame_dtypes(self, base, mode: str):
+        return self._dtype_of(base if mode == 'row' else base.value)
+
+    # X.apply(lambda r: ..., axis=1)  |  X['c'].apply(lambda v: ...)
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Attribute) and func.attr == 'apply' and len(node.args) == 1:
+            param = _simple_lambda(node.args[0])
+            base = func.value
+            if _axis_one(node):
+                if param and len(node.keywords) == 1 and _is_pure(base):
+                    vec = _vectorize(node.args[0].body, param, base, 'row', self._dtype_of(base))
+                    if vec is not None:
+                        self._rewrite(node, _wrap(vec), 'apply_axis1', 'apply(axis=1) vetorizado')
+                        return
+                self._warn(node, 'apply_axis1', 'apply(axis=1) chama Python a cada linha')
+            elif param and not node.keywords and isinstance(base, ast.Subscript) and _is_pure(base):
+                vec = _vectorize(node.args[0].body, param, base, 'value', self._dtype_of(base.value))
+                if vec is not None:
+                    self._rewrite(node, _wrap(vec), 'series_apply', 'Series.apply vetorizado')
+                    return
+                self._warn(node, 'series_apply', 'Series.apply chama Python a cada valor')
+        if isinstance(func, ast.Attribute) and func.attr in ('iterrows', 'itertuples'):
+            self._warn(node, func.attr, f'{func.attr}() itera linha a linha em Python')
+        self.generic_visit(node)
+
+    # for _, r in X.iterrows(): lst.append(expr)
+    def visit_For(self, node):
+        src = _row_source(node.iter, self.frames)
+        if src and src[0] and len(node.body) == 1 and not node.orelse:
+            mode, base, kind = src
+            param, index = _loop_param(node.target, kind)
+            stmt = node.body[0]
+            if (param and isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call)
+                    and isinstance(stmt.value.func, ast.Attribute) and stmt.value.func.attr == 'append'
+                    and isinstance(stmt.value.func.value, ast.Name) and len(stmt.value.args) == 1
+                    and not stmt.value.keywords):
+                loop_vars = [v for v in (param, index) if v]
+                # as variáveis do laço não podem ser usadas fora dele (deixariam de existir)
+                outside = all(_names_loaded(self.tree, v) == _names_loaded(node, v) for v in loop_vars)
+                no_index = index is None or _names_loaded(stmt, index) == 0
+                vec = _vectorize(stmt.value.args[0], param, base, mode, self._frame_dtypes(base, mode)) if outside and no_index else None
+                if vec is not None:
+                    target = stmt.value.func.value.id
+                    self._rewrite(node, f'{target}.extend({_wrap(vec)}.tolist())', kind,
+                                  'laço que monta lista linha a linha vetorizado')
+                    return
+        if src and src[0]:
+            self._warn(node, src[2], 'laço Python sobre as linhas do DataFrame')
+            for child in node.body + node.orelse:
+                self.visit(child)
+            return
+        if (isinstance(node.iter, ast.Call) and isinstance(node.iter.func, ast.Name)
+              and node.iter.func.id == 'range' and any(
+                  isinstance(n, ast.Attribute) and n.attr in ('loc', 'iloc', 'at', 'iat') for n in ast.walk(node))):
+            self._warn(node, 'loop_index', 'laço por índice com .loc/.iloc a cada iteração')
+        self.generic_visit(node)
+
+    # [expr for _, r in X.iterrows()]
+    def visit_ListComp(self, node):
+        if len(node.generators) == 1 and not node.generators[0].ifs and not node.generators[0].is_async:
+            gen = node.generators[0]
+            src = _row_source(gen.iter, self.frames)
+            if src and src[0]:
+                mode, base, kind = src
+                param, index = _loop_param(gen.target, kind)
+                if param and (index is None or _names_loaded(node.elt, index) == 0):
+                    vec = _vectorize(node.elt, param, base, mode, self._frame_dtypes(base, mode))
+                    if vec is not None:
+                        self._rewrite(node, f'{_wrap(vec)}.tolist()', kind, 'list comprehension vetorizada')
+                        return
+        self.generic_visit(node)
+
+# ================= Passo 2: pd.to_datetime repetido =================
+def _to_datetime_calls(node):
+    return [n for n in ast.walk(node) if isinstance(n, ast.Call) and isinstance(n.func, ast.Attribute)
+            and n.func.attr == 'to_datetime' and isinstance(n.func.value, ast.Name) and n.func.value.id == 'pd']
+
+def _mutates(stmt, name: str) -> bool:
+    """
+    True se o comando pode alterar `name` (atribuição, atribuição em item/atributo, for/with/:=,
+    inplace=True, métodos como insert/pop/update).
+    """
+    for n in ast.walk(stmt):
+        if isinstance(n, ast.Name) and n.id == name and not isinstance(n.ctx, ast.Load):
+            return True
+        targets = []
+        if isinstance(n, ast.Assign):
+            targets = n.targets
+        elif isinstance(n, (ast.AugAssign, ast.AnnAssign)):
+            targets = [n.target]
+        elif isinstance(n, ast.Delete):
+            targets = n.targets
+        for t in targets:
+            for sub in ast.walk(t):
+                if isinstance(sub, ast.Name) and sub.id == name:
+                    return True
+        if isinstance(n, ast.Call):
+            if (isinstance(n.func, ast.Attribute) and n.func.attr in _MUTATING_METHODS
+                    and _base_name(n.func) == name):
+                return True
+            for kw in n.keywords:
+                if kw.arg == 'inplace' and not (isinstance(kw.value, ast.Constant) and kw.value.value is False):
+                    if _base_name(n.func) == name:
+                        return True
+    return False
+
+def _aliased(tree, name: str) -> bool:
+    """
+    True se `name` pode ser alterado por outro nome: aparece sozinho (d2 = df, f(df), [df]),
+    uma parte dele é ligada a um nome (s = df['d'], v = df.values) ou uma função o altera.
+    """
+    parents = {}
+    for p in ast.walk(tree):
+        for c in ast.iter_child_nodes(p):
+            parents[id(c)] = p
+    for n in ast.walk(tree):
+        if isinstance(n, ast.Name) and n.id == name and isinstance(n.ctx, ast.Load):
+            p = parents.get(id(n))
+            if not (isinstance(p, (ast.Subscript, ast.Attribute)) and p.value is n):
+                return True
+        elif isinstance(n, (ast.Assign, ast.AnnAssign, ast.NamedExpr)) and n.value is not None:
+            if _base_name(n.value) == name:
+                return True
+        elif isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            if _mutates(n, name):
+                return True
+    return False
+
+def _bound_directly(stmt, call) -> bool:
+    """True se o resultado de call é atribuído tal qual a um nome (a = pd.to_datetime(...))."""
+    return isinstance(stmt, (ast.Assign, ast.AnnAssign, ast.AugAssign)) and stmt.value is call
+
+def _hoist_to_datetime(tree):
+    """
+    Edições e achados para conversões pd.to_datetime repetidas em comandos simples de nível superior.
+    Ocorrências atribuídas diretamente a um nome não entram no grupo: o nome receberia o mesmo
+    objeto das demais e uma alteração nele (a.iloc[0] = ...) apareceria nos outros usos.
+    """
+    simple = (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Expr)
+    groups = {}
+    for idx, stmt in enumerate(tree.body):
+        calls = _to_datetime_calls(stmt)
+        for call in calls:
+            if _bound_directly(stmt, call):
+                continue
+            key = ast.dump(call)
+            groups.setdefault(key, []).append((idx, call, isinstance(stmt, simple)))
+    edits, rewrites, warnings = [], [], []
+    aux = 0
+    for key, occ in groups.items():
+        if len(occ) < 2:
+            continue
+        call = occ[0][1]
+        args = list(call.args) + [kw.value for kw in call.keywords]
+        pure = all(_is_pure(a) or isinstance(a, ast.Constant) for a in args)
+        names = {_base_name(a) for a in args if _base_name(a)}
+        first, last = occ[0][0], occ[-1][0]
+        safe = pure and all(s for _, _, s in occ) and not any(
+            _mutates(tree.body[i], name) for i in range(first, last) for name in names) and not any(
+            _aliased(tree, name) for name in names)
+        if not safe:
+            warnings.append({'linha': call.lineno, 'padrao': 'to_datetime',
+                             'descricao': f'pd.to_datetime repetido {len(occ)}x sobre os mesmos dados'})
+            continue
+        var = f'{AUX_PREFIX}{aux}'
+        aux += 1
+        edits.append((tree.body[first], None, f'{var} = {_src(call)}\n'))
+        for _, node, _ in occ:
+            edits.append((node, var, None))
+        rewrites.append({'linha': call.lineno, 'padrao': 'to_datetime',
+                         'descricao': f'pd.to_datetime repetido {len(occ)}x convertido uma única vez'})
+    return edits, rewrites, warnings
+
+# ================= Aplicação das edições =================
+def _offsets(code: str):
+    """Converte (linha, coluna em bytes UTF-8) do ast em índice no texto."""
+    lines = code.splitlines(keepends=True)
+    starts = [0]
+    for line in lines:
+        starts.append(starts[-1] + len(line))
+
+    def at(lineno: int, col: int) -> int:
+        line = lines[lineno - 1] if lineno - 1 < len(lines) else ''
+        return starts[lineno - 1] + len(line.encode('utf-8')[:col].decode('utf-8', errors='ignore'))
+    return at
+
+def _apply(code: str, edits: list) -> str:
+    """edits: (início, fim, texto) em índices do texto; aplicadas do fim para o começo."""
+    for start, end, text in sorted(edits, key=lambda e: (e[0], e[1]), reverse=True):
+        code = code[:start] + text + code[end:]
+    return code
+
+def _cost(pattern: str, n_rows: int | None, repeats: int = 1):
+    if not n_rows or pattern not in ROW_COST_S:
+        return None
+    return round(ROW_COST_S[pattern] * n_rows * repeats, 3)
+
+# ================= API =================
+def optimize_code(code: str, n_rows: int | None = None, dtypes=None):
+    """
+    Reescreve idiomas lentos e sinaliza os restantes.
+    dtypes: tipos das colunas de df (df.dtypes); sem eles apply/laços só são sinalizados.
+    Retorna (código, relatório); relatório tem rewrites, warnings (com custo_s estimado
+    para n_rows linhas) e diff (unified diff do código original para o novo, '' se igual).
+    Se o código não compilar ou a reescrita falhar, devolve o código original.
+    """
+    report = {'rewrites': [], 'warnings': [], 'diff': ''}
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code, report
+    try:
+        rw = _Rewriter(tree, dict(dtypes.items()) if dtypes is not None else None)
+        rw.visit(tree)
+        at = _offsets(code)
+        new_code = _apply(code, [(at(n.lineno, n.col_offset), at(n.end_lineno, n.end_col_offset), text)
+                                 for n, text in rw.edits])
+
+        tree2 = ast.parse(new_code)
+        edits2, rewrites2, warnings2 = _hoist_to_datetime(tree2)
+        at2 = _offsets(new_code)
+        applied = []
+        for node, var, insert in edits2:
+            if insert is not None:
+                pos = at2(node.lineno, 0)
+                applied.append((pos, pos, insert))
+            else:
+                applied.append((at2(node.lineno, node.col_offset), at2(node.end_lineno, node.end_col_offset), var))
+        new_code = _apply(new_code, applied)
+        ast.parse(new_code)
+    except Exception:
+        return code, report
+
+    report['rewrites'] = rw.rewrites + rewrites2
+    report['warnings'] = rw.warnings + warnings2
+    for item in report['rewrites'] + report['warnings']:
+        item['custo_s'] = _cost(item['padrao'], n_rows)
+    if new_code != code:
+        report['diff'] = ''.join(difflib.unified_diff(
+            code.splitlines(keepends=True), new_code.splitlines(keepends=True),
+            fromfile='gerado', tofile='otimizado',
+        ))
+    return new_code, report
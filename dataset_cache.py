@@ -0,0 +1,250 @@
+# dataset_cache.py
+
+import os
+import json
+import uuid
+import hashlib
+import weakref
+import threading
+import pandas as pd
+
+from sketches import DatasetSketch
+from timeseries import rollups_to_frame, rollups_from_frame
+
+# -------- pyarrow (opcional) --------
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+CACHE_DIR = os.environ.get('EDA_CACHE_DIR', os.path.join('.cache', 'datasets'))
+CACHE_MAX_BYTES = int(os.environ.get('EDA_CACHE_MAX_BYTES', 10 * 1024 ** 3))
+HASH_BLOCK = 8 * 1024 * 1024
+DATA_EXTENSIONS = ('.feather', '.parquet')
+
+# ================= Hash de conteúdo =================
+def content_hash(f) -> str:
+    """Hash (blake2b) do conteúdo do arquivo, lido em blocos. Restaura a posição."""
+    h = hashlib.blake2b(digest_size=20)
+    pos = f.tell()
+    f.seek(0)
+    while True:
+        block = f.read(HASH_BLOCK)
+        if not block:
+            break
+        h.update(block)
+    f.seek(pos)
+    return h.hexdigest()
+
+# ================= Cache em disco (Feather) =================
+def temp_path(path: str) -> str:
+    """Arquivo temporário único ao lado de path (sessões do mesmo processo gravam o mesmo digest ao mesmo tempo)."""
+    return f'{path}.{uuid.uuid4().hex}.tmp'
+
+def _data_path(digest: str) -> str:
+    return os.path.join(CACHE_DIR, f'{digest}.feather')
+
+def _meta_path(digest: str) -> str:
+    return os.path.join(CACHE_DIR, f'{digest}.json')
+
+def available() -> bool:
+    return feather is not None
+
+def has(digest: str) -> bool:
+    return available() and os.path.exists(_data_path(digest))
+
+def path_for(digest: str | None) -> str | None:
+    """Caminho absoluto do arquivo Feather em cache (lido pelos workers), ou None."""
+    if not digest or not has(digest):
+        return None
+    return os.path.abspath(_data_path(digest))
+
+def load(digest: str):
+    """
+    Carrega o dataset do cache via memory-map (split_blocks evita cópias nas
+    colunas numéricas sem nulos). Retorna (df, info); FileNotFoundError se ausente.
+    """
+    if not available():
+        raise FileNotFoundError('pyarrow indisponível; cache de datasets desativado.')
+    path = _data_path(digest)
+    table = feather.read_table(path, memory_map=True)
+    df = table.to_pandas(split_blocks=True)
+    os.utime(path)  # marca acesso para a política LRU
+
+    info = {}
+    try:
+        with open(_meta_path(digest), encoding='utf-8') as fh:
+            info = json.load(fh)
+    except Exception:
+        pass
+    info['engine'] = 'cache'
+    return df, info
+
+def store(digest: str, df: pd.DataFrame, info: dict | None = None) -> bool:
+    """Grava o dataset em Feather (sem compressão, para memory-map). Retorna True se gravou."""
+    if not available():
+        return False
+    path = _data_path(digest)
+    tmp = temp_path(path)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        feather.write_feather(df.reset_index(drop=True), tmp, compression='uncompressed')
+        os.replace(tmp, path)
+        with open(_meta_path(digest), 'w', encoding='utf-8') as fh:
+            json.dump(info or {}, fh)
+    except Exception:
+        _remove(tmp)
+        return False
+    evict(keep=digest)
+    return True
+
+# ================= Rollups de datas =================
+def _rollups_path(digest: str) -> str:
+    return os.path.join(CACHE_DIR, f'{digest}.rollups.feather')
+
+def rollups_path_for(digest: str | None) -> str | None:
+    """Caminho absoluto dos rollups gravados (lidos pelos workers), ou None."""
+    if not digest or not available() or not os.path.exists(_rollups_path(digest)):
+        return None
+    return os.path.abspath(_rollups_path(digest))
+
+def read_rollups(path: str) -> dict:
+    """Rollups ({freq: DataFrame}) de um arquivo gravado por store_rollups."""
+    return rollups_from_frame(feather.read_table(path).to_pandas())
+
+def load_rollups(digest: str):
+    """Rollups do dataset (ver timeseries.build_rollups), ou None se não estiverem no cache."""
+    path = rollups_path_for(digest)
+    if path is None:
+        return None
+    try:
+        return read_rollups(path)
+    except Exception:
+        return None
+
+def store_rollups(digest: str, rollups: dict) -> bool:
+    """Grava os rollups num único Feather (formato longo). Retorna True se gravou."""
+    if not available() or not rollups:
+        return False
+    path = _rollups_path(digest)
+    tmp = temp_path(path)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        feather.write_feather(rollups_to_frame(rollups), tmp, compression='uncompressed')
+        os.replace(tmp, path)
+    except Exception:
+        _remove(tmp)
+        return False
+    return True
+
+# ================= Sketches (estatísticas aproximadas) =================
+def _sketch_path(digest: str) -> str:
+    return os.path.join(CACHE_DIR, f'{digest}.sketch.pkl')
+
+def sketch_path_for(digest: str | None) -> str | None:
+    """Caminho absoluto do sketch gravado (lido pelos workers), ou None."""
+    if not digest or not os.path.exists(_sketch_path(digest)):
+        return None
+    return os.path.abspath(_sketch_path(digest))
+
+def read_sketch(path: str) -> DatasetSketch:
+    with open(path, 'rb') as fh:
+        return DatasetSketch.from_bytes(fh.read())
+
+def load_sketch(digest: str):
+    """DatasetSketch do dataset (ver sketches.py), ou None se não estiver no cache."""
+    path = sketch_path_for(digest)
+    if path is None:
+        return None
+    try:
+        return read_sketch(path)
+    except Exception:
+        return None
+
+def store_sketch(digest: str, sketch: DatasetSketch) -> bool:
+    """Grava o sketch serializado. Retorna True se gravou."""
+    if sketch is None or not sketch.columns:
+        return False
+    path = _sketch_path(digest)
+    tmp = temp_path(path)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp, 'wb') as fh:
+            fh.write(sketch.to_bytes())
+        os.replace(tmp, path)
+    except Exception:
+        _remove(tmp)
+        return False
+    return True
+
+# arquivos abertos por objetos vivos (ex.: o Parquet de um engine.DuckDBEngine)
+_holders = weakref.WeakKeyDictionary()
+_holders_lock = threading.Lock()
+
+def hold(path: str, owner):
+    """Protege `path` de evict() enquanto `owner` existir (ou até release(owner))."""
+    with _holders_lock:
+        _holders[owner] = os.path.abspath(path)
+
+def release(owner):
+    with _holders_lock:
+        _holders.pop(owner, None)
+
+def _held() -> set:
+    with _holders_lock:
+        return set(_holders.values())
+
+def _group_of(name: str) -> str:
+    """Digest dono do arquivo: dados, meta, rollups, sketch e amostras ({digest}-sampleN) andam juntos."""
+    return name.split('.', 1)[0].split('-sample', 1)[0]
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def evict(max_bytes: int = CACHE_MAX_BYTES, keep: str | None = None) -> int:
+    """
+    Remove os datasets (.feather e .parquet do motor out-of-core) acessados há mais
+    tempo até o total caber em max_bytes. Cada digest sai inteiro, com meta, rollups,
+    sketch e amostras; grupos com algum arquivo em uso (ver hold) ficam, assim como
+    o digest `keep` (o que acabou de ser gravado, mesmo que sozinho passe do limite).
+    Retorna o número de digests removidos.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    held = _held()
+    groups = {}  # digest -> arquivos, bytes, acesso mais recente a um dataset, tem dataset, em uso
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith('.tmp'):
+            continue  # conversão em andamento
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            st_ = os.stat(path)
+        except OSError:
+            continue
+        digest = _group_of(name)
+        g = groups.setdefault(digest, {'digest': digest, 'files': [], 'size': 0, 'mtime': 0.0,
+                                       'data': False, 'held': False})
+        g['files'].append(path)
+        g['size'] += st_.st_size
+        g['held'] = g['held'] or os.path.abspath(path) in held
+        stem, ext = os.path.splitext(name)
+        if ext in DATA_EXTENSIONS and '.' not in stem:  # {digest}.rollups.feather não é dataset
+            g['data'] = True
+            g['mtime'] = max(g['mtime'], st_.st_mtime)
+
+    groups = [g for g in groups.values() if g['data']]
+    total = sum(g['size'] for g in groups)
+    removed = 0
+    for g in sorted(groups, key=lambda g: g['mtime']):
+        if total <= max_bytes:
+            break
+        if g['held'] or g['digest'] == keep:
+            continue
+        for p in g['files']:
+            _remove(p)
+        total -= g['size']
+        removed += 1
+    return removed
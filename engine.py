@@ -0,0 +1,132 @@
+# engine.py
+"""
+Motor out-of-core opcional (DuckDB). O CSV enviado é convertido uma única vez
+para Parquet no diretório de cache e exposto como a tabela `dados`; o código
+gerado consulta via sql("...") e só resultados pequenos viram pandas.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import threading
+import pandas as pd
+
+# -------- DuckDB (opcional) --------
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+import dataset_cache
+from dataset_cache import CACHE_DIR
+
+TABLE_NAME = 'dados'
+MAX_RESULT_ROWS = int(os.environ.get('EDA_ENGINE_MAX_RESULT_ROWS', 1_000_000))
+PREVIEW_ROWS = 100_000
+# consultas que podem ser envolvidas em SELECT * FROM (...) LIMIT; DESCRIBE, SUMMARIZE, SHOW... rodam como estão
+_QUERY_START = re.compile(r'^(\s|--[^\n]*\n|/\*.*?\*/|\()*(select|with|from)\b', re.IGNORECASE | re.DOTALL)
+
+def available() -> bool:
+    return duckdb is not None
+
+def _literal(path: str) -> str:
+    return "'" + path.replace("'", "''") + "'"
+
+# ================= Preparação =================
+def parquet_path(digest: str) -> str:
+    return os.path.abspath(os.path.join(CACHE_DIR, f'{digest}.parquet'))
+
+def prepare_parquet(f, digest: str) -> str:
+    """
+    Converte o upload para Parquet (uma vez por hash de conteúdo) sem carregá-lo
+    no pandas: o arquivo é copiado em blocos para disco e lido pelo DuckDB em streaming.
+    """
+    path = parquet_path(digest)
+    if os.path.exists(path):
+        os.utime(path)  # marca acesso para a política LRU do dataset_cache
+        return path
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, csv_tmp = tempfile.mkstemp(suffix='.csv', dir=CACHE_DIR)
+    tmp = dataset_cache.temp_path(path)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            f.seek(0)
+            shutil.copyfileobj(f, out, length=8 * 1024 * 1024)
+        con = duckdb.connect()
+        try:
+            con.execute(
+                f'COPY (SELECT * FROM read_csv_auto({_literal(csv_tmp)})) TO {_literal(tmp)} '
+                '(FORMAT PARQUET, COMPRESSION ZSTD)'
+            )
+        finally:
+            con.close()
+        os.replace(tmp, path)
+        dataset_cache.evict(keep=digest)
+    finally:
+        for p in (csv_tmp, tmp):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+    return path
+
+# ================= Motor =================
+class DuckDBEngine:
+    """Conexão DuckDB com a tabela `dados` (view sobre o Parquet); segura entre threads via cursores."""
+
+    def __init__(self, path: str):
+        if duckdb is None:
+            raise RuntimeError('duckdb não está instalado.')
+        self.path = path
+        self._con = duckdb.connect()
+        self._con.execute(f'CREATE VIEW {TABLE_NAME} AS SELECT * FROM read_parquet({_literal(path)})')
+        self._lock = threading.Lock()
+        # a view relê o Parquet a cada consulta: o arquivo não pode sair do cache enquanto o motor existir
+        dataset_cache.hold(path, self)
+
+    def _cursor(self):
+        with self._lock:
+            return self._con.cursor()
+
+    def sql(self, query: str, max_rows: int = MAX_RESULT_ROWS) -> pd.DataFrame:
+        """
+        Executa a consulta e materializa o resultado em pandas.
+        Resultados acima de max_rows são truncados (agregue antes de trazer os dados);
+        só SELECT/WITH levam LIMIT no DuckDB, os demais comandos são truncados depois.
+        """
+        # ';' final (seguido ou não de comentários) é removido; a quebra de linha antes do ')'
+        # impede que um comentário '--' no fim da consulta engula o restante
+        query = re.sub(r';\s*(--[^\n]*\s*)*$', '', query.strip())
+        cur = self._cursor()
+        try:
+            if _QUERY_START.match(query):
+                result = cur.execute(f'SELECT * FROM ({query}\n) AS _q LIMIT {int(max_rows) + 1}').df()
+            else:
+                cur.execute(query)
+                result = cur.df() if cur.description else pd.DataFrame()
+        finally:
+            cur.close()
+        if len(result) > max_rows:
+            print(f'AVISO: resultado truncado em {max_rows:,} linhas; agregue no SQL antes de materializar.')
+            result = result.iloc[:max_rows]
+        return result
+
+    def count(self) -> int:
+        cur = self._cursor()
+        try:
+            return int(cur.execute(f'SELECT COUNT(*) FROM {TABLE_NAME}').fetchone()[0])
+        finally:
+            cur.close()
+
+    def preview(self, n: int = PREVIEW_ROWS) -> pd.DataFrame:
+        """Amostra aleatória (reservoir) usada nas abas, no perfil e como `df` no código gerado."""
+        cur = self._cursor()
+        try:
+            return cur.execute(f'SELECT * FROM {TABLE_NAME} USING SAMPLE {int(n)} ROWS').df()
+        finally:
+            cur.close()
+
+    def close(self):
+        self._con.close()
+        dataset_cache.release(self)
@@ -0,0 +1,187 @@
+# exec_capture.py
+"""
+Captura de saída e ciclo de vida das figuras por execução, seguras com várias
+sessões executando ao mesmo tempo no mesmo processo.
+
+contextlib.redirect_stdout troca o sys.stdout do processo inteiro: duas execuções
+simultâneas misturam (ou perdem) o que cada uma imprime. Aqui sys.stdout é trocado
+uma única vez por um roteador que escreve no buffer da execução corrente (uma
+ContextVar), ou no stdout original fora de qualquer captura.
+
+O estado do pyplot (figura ativa, plt.close('all')) também é global. Dentro de um
+figure_scope, as figuras criadas pelo pyplot ficam registradas no escopo; gcf/gca
+enxergam só as figuras do próprio escopo, close('all') fecha só as dele, e na saída
+todas são fechadas e liberadas.
+"""
+
+import io
+import sys
+import threading
+import contextlib
+import contextvars
+
+_stdout_target = contextvars.ContextVar('exec_stdout', default=None)
+_figure_scope = contextvars.ContextVar('exec_figures', default=None)
+_install_lock = threading.Lock()
+
+# ================= stdout =================
+class _StdoutRouter(io.TextIOBase):
+    """sys.stdout que escreve no buffer da execução corrente ou, sem captura, no stream original."""
+
+    def __init__(self, fallback):
+        self._fallback = fallback
+
+    def _target(self):
+        return _stdout_target.get() or self._fallback
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def writelines(self, lines):
+        self._target().writelines(lines)
+
+    def flush(self):
+        self._target().flush()
+
+    def isatty(self):
+        return self._target().isatty()
+
+    @property
+    def encoding(self):
+        return getattr(self._fallback, 'encoding', 'utf-8')
+
+    def fileno(self):
+        return self._fallback.fileno()
+
+    def __getattr__(self, name):
+        return getattr(self._fallback, name)
+
+def _install_router():
+    if isinstance(sys.stdout, _StdoutRouter):
+        return
+    with _install_lock:
+        if not isinstance(sys.stdout, _StdoutRouter):
+            sys.stdout = _StdoutRouter(sys.stdout)
+
+@contextlib.contextmanager
+def capture_stdout(buffer=None):
+    """Redireciona print/sys.stdout só do contexto corrente para `buffer` (StringIO novo por padrão)."""
+    _install_router()
+    buffer = buffer if buffer is not None else io.StringIO()
+    token = _stdout_target.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _stdout_target.reset(token)
+
+# ================= Figuras =================
+class FigureScope:
+    """Figuras do pyplot criadas por uma execução; a última tocada é a ativa."""
+
+    def __init__(self):
+        self._managers = []
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _add(self, manager):
+        with self._lock:
+            self._managers.append(manager)
+            self.created += 1
+
+    def _touch(self, manager):
+        with self._lock:
+            if any(m is manager for m in self._managers):
+                self._managers = [m for m in self._managers if m is not manager] + [manager]
+
+    def _discard(self, manager):
+        with self._lock:
+            self._managers = [m for m in self._managers if m is not manager]
+
+    def active(self):
+        """Último gerenciador tocado pelo escopo ainda não fechado, ou None."""
+        with self._lock:
+            return self._managers[-1] if self._managers else None
+
+    def close_all(self, gcf) -> int:
+        """Fecha e libera as figuras do escopo; devolve quantas estavam abertas."""
+        with self._lock:
+            managers, self._managers = self._managers, []
+        for manager in managers:
+            fig = manager.canvas.figure
+            gcf.destroy(manager)
+            fig.clear()
+        return len(managers)
+
+_pyplot_hooked = False
+
+def _hook_pyplot():
+    """Faz o registro de figuras do pyplot (Gcf) respeitar o figure_scope corrente."""
+    global _pyplot_hooked
+    if _pyplot_hooked:
+        return
+    with _install_lock:
+        if _pyplot_hooked:
+            return
+        from matplotlib._pylab_helpers import Gcf
+
+        get_active = Gcf.get_active.__func__
+        set_new_active = Gcf._set_new_active_manager.__func__
+        set_active = Gcf.set_active.__func__
+        destroy = Gcf.destroy.__func__
+        destroy_all = Gcf.destroy_all.__func__
+
+        def _get_active(cls):
+            scope = _figure_scope.get()
+            return get_active(cls) if scope is None else scope.active()
+
+        def _set_new_active_manager(cls, manager):
+            set_new_active(cls, manager)
+            scope = _figure_scope.get()
+            if scope is not None:
+                scope._add(manager)
+
+        def _set_active(cls, manager):
+            set_active(cls, manager)
+            scope = _figure_scope.get()
+            if scope is not None:
+                scope._touch(manager)
+
+        def _destroy(cls, num):
+            scope = _figure_scope.get()
+            if scope is not None:
+                scope._discard(num if hasattr(num, 'canvas') else cls.figs.get(num))
+            destroy(cls, num)
+
+        def _destroy_all(cls):
+            scope = _figure_scope.get()
+            if scope is None:
+                destroy_all(cls)
+            else:
+                scope.close_all(cls)
+
+        Gcf.get_active = classmethod(_get_active)
+        Gcf._set_new_active_manager = classmethod(_set_new_active_manager)
+        Gcf.set_active = classmethod(_set_active)
+        Gcf.destroy = classmethod(_destroy)
+        Gcf.destroy_all = classmethod(_destroy_all)
+        _pyplot_hooked = True
+
+@contextlib.contextmanager
+def figure_scope():
+    """Isola as figuras do pyplot criadas no contexto corrente e fecha todas na saída."""
+    _hook_pyplot()
+    from matplotlib._pylab_helpers import Gcf
+
+    scope = FigureScope()
+    token = _figure_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _figure_scope.reset(token)
+        scope.close_all(Gcf)
+
+@contextlib.contextmanager
+def execution_scope(buffer=None):
+    """capture_stdout + figure_scope; devolve (buffer, escopo de figuras)."""
+    with capture_stdout(buffer) as out, figure_scope() as figures:
+        yield out, figures
@@ -0,0 +1,186 @@
+# ingest.py
+
+import pandas as pd
+
+from sketches import DatasetSketch
+from timeseries import prepare_datetimes
+
+# -------- pyarrow (opcional) --------
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+CHUNK_ROWS = 250_000            # linhas por chunk no engine C do pandas
+BLOCK_BYTES = 32 * 1024 * 1024  # tamanho do bloco no leitor em streaming do pyarrow
+CATEGORY_MAX_RATIO = 0.5        # nunique/linhas abaixo disso vira category
+CATEGORY_MAX_UNIQUE = 100_000   # teto absoluto de categorias distintas
+# mesmos marcadores de ausência que o pd.read_csv reconhece por padrão
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# ================= Utilitários =================
+def memory_bytes(df: pd.DataFrame) -> int:
+    """Memória ocupada pelo DataFrame (deep=True), em bytes."""
+    return int(df.memory_usage(deep=True).sum())
+
+def _file_size(f) -> int | None:
+    try:
+        return int(f.size)
+    except Exception:
+        pass
+    try:
+        pos = f.tell()
+        f.seek(0, 2)
+        end = f.tell()
+        f.seek(pos)
+        return int(end)
+    except Exception:
+        return None
+
+# ================= Otimização de dtypes =================
+def _downcast_numeric(s: pd.Series) -> pd.Series:
+    """
+    Reduz a largura de colunas numéricas sem perda de valores. Inteiros param em int32:
+    int8/int16 estourariam em silêncio na aritmética do código gerado (df['a'] * 3).
+    """
+    if pd.api.types.is_bool_dtype(s):
+        return s
+    if pd.api.types.is_integer_dtype(s):
+        out = pd.to_numeric(s, downcast='integer')
+        return out.astype('int32') if out.dtype.itemsize < 4 else out
+    if pd.api.types.is_float_dtype(s):
+        f32 = s.astype('float32')
+        # só aceita float32 se o round-trip for exato (ex.: inteiros com NaN)
+        if ((f32.astype('float64') == s) | s.isna()).all():
+            return f32
+    return s
+
+def _compact_strings(s: pd.Series) -> pd.Series:
+    """Converte colunas object de texto para string[pyarrow] quando disponível."""
+    if pa is None or not pd.api.types.is_object_dtype(s):
+        return s
+    try:
+        return s.astype('string[pyarrow]')
+    except Exception:
+        return s
+
+def optimize_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Otimização por chunk: downcast numérico e strings compactas."""
+    for col in chunk.columns:
+        s = chunk[col]
+        if pd.api.types.is_numeric_dtype(s):
+            chunk[col] = _downcast_numeric(s)
+        else:
+            chunk[col] = _compact_strings(s)
+    return chunk
+
+def categorize(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte colunas de texto com baixa cardinalidade para category."""
+    n = len(df)
+    if n == 0:
+        return df
+    limit = min(CATEGORY_MAX_UNIQUE, int(n * CATEGORY_MAX_RATIO))
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            continue
+        if not (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)):
+            continue
+        if s.nunique(dropna=True) <= limit:
+            df[col] = s.astype('category')
+    return df
+
+# ================= Leitura em chunks =================
+def _iter_pyarrow(f):
+    reader = pa_csv.open_csv(
+        f,
+        read_options=pa_csv.ReadOptions(block_size=BLOCK_BYTES),
+        # vazios e NA/null também viram nulos em colunas de texto, como no pd.read_csv
+        convert_options=pa_csv.ConvertOptions(strings_can_be_null=True, null_values=NA_VALUES),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+def _iter_pandas(f, chunksize: int):
+    yield from pd.read_csv(f, chunksize=chunksize, low_memory=False)
+
+def read_csv_optimized(f, chunksize: int = CHUNK_ROWS, progress=None, parse_dates: bool = True, sketch=None):
+    """
+    Lê um CSV em chunks (engine pyarrow em streaming quando disponível),
+    otimizando dtypes de cada chunk e convertendo texto de baixa cardinalidade
+    para category no final.
+
+    progress: callable opcional progress(fração em [0, 1]).
+    parse_dates: converte colunas de texto com datas e ordena pela data principal
+    (ver timeseries.prepare_datetimes).
+    sketch: DatasetSketch opcional, alimentado chunk a chunk na mesma passada
+    (ver sketches.py); as colunas convertidas em data são refeitas no final.
+    Retorna (df, info) com info = {engine, chunks, mem_before, mem_after} e, com
+    parse_dates, datetime_columns, parsed, sorted_by, parse_failures e raw_columns
+    (ver timeseries.prepare_datetimes).
+    """
+    total = _file_size(f)
+    engines = ['pyarrow', 'c'] if pa_csv is not None else ['c']
+
+    for engine in engines:
+        f.seek(0)
+        chunks, mem_before = [], 0
+        n_chunks = 0
+        part = DatasetSketch() if sketch is not None else None
+        it = _iter_pyarrow(f) if engine == 'pyarrow' else _iter_pandas(f, chunksize)
+        try:
+            for chunk in it:
+                mem_before += memory_bytes(chunk)
+                chunks.append(optimize_chunk(chunk))
+                if part is not None:
+                    part.update(chunks[-1])
+                n_chunks += 1
+                if progress is not None and total:
+                    try:
+                        progress(min(f.tell() / total, 1.0))
+                    except Exception:
+                        pass
+        except Exception:
+            # tipos inconsistentes entre blocos no pyarrow: refaz com o engine C
+            if engine == 'pyarrow':
+                continue
+            raise
+        if part is not None:
+            sketch.merge(part)
+        break
+
+    if chunks:
+        df = pd.concat(chunks, ignore_index=True)
+        if sketch is not None and sketch.partial:
+            # colunas que mudaram de tipo entre chunks: refeitas sobre o df com o tipo final
+            sketch.refresh(df, [c for c in sketch.partial if c in df.columns])
+    else:
+        f.seek(0)
+        df = pd.read_csv(f)
+        if sketch is not None:
+            sketch.update(df)
+    del chunks
+    dt_info = {}
+    if parse_dates:
+        df, dt_info = prepare_datetimes(df)
+        if sketch is not None and dt_info['parsed']:
+            # o texto original mantido ao lado da data tem o sketch que a coluna tinha antes
+            for col, raw in dt_info['raw_columns'].items():
+                sketch.columns[raw] = sketch.columns[col]
+            sketch.refresh(df, dt_info['parsed'])
+    df = categorize(df)
+
+    if progress is not None:
+        progress(1.0)
+
+    info = {
+        'engine': engine,
+        'chunks': n_chunks,
+        'mem_before': mem_before,
+        'mem_after': memory_bytes(df),
+        **dt_info,
+    }
+    return df, info
@@ -0,0 +1,213 @@
+# intent_model.py
+"""
+Classificador local de intenção ("analysis" x "chat") por n-gramas de caracteres
+(Naive Bayes multinomial). Responde em microssegundos; o agent só consulta o LLM
+quando a confiança fica abaixo do limiar.
+
+Treino a partir dos prompts registrados (rótulo dado pelo LLM) + exemplos-semente:
+    python intent_model.py [--log .cache/intent_log.jsonl] [--out intent_model.json]
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+import unicodedata
+from collections import Counter
+
+LABELS = ('analysis', 'chat')
+NGRAM_RANGE = (2, 4)
+CONFIDENCE_SCALE = 4.0  # temperatura do softmax sobre a log-verossimilhança média por n-grama
+MODEL_PATH = os.environ.get(
+    'EDA_INTENT_MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent_model.json')
+)
+LOG_PATH = os.environ.get('EDA_INTENT_LOG_PATH', os.path.join('.cache', 'intent_log.jsonl'))
+
+SEED_EXAMPLES = [
+    ('histograma de amount', 'analysis'),
+    ('faça um histograma da coluna idade', 'analysis'),
+    ('plot a distribuição de preços', 'analysis'),
+    ('gráfico de barras por categoria', 'analysis'),
+    ('grafico de dispersão entre x e y', 'analysis'),
+    ('correlação entre as variáveis numéricas', 'analysis'),
+    ('matriz de correlação', 'analysis'),
+    ('qual a média de amount', 'analysis'),
+    ('calcule a mediana e a moda de time', 'analysis'),
+    ('desvio padrão e variância das colunas', 'analysis'),
+    ('boxplot de valor por classe', 'analysis'),
+    ('tendência temporal das vendas', 'analysis'),
+    ('série temporal por mês', 'analysis'),
+    ('quantos valores nulos existem', 'analysis'),
+    ('describe do dataframe', 'analysis'),
+    ('mostre os outliers de amount', 'analysis'),
+    ('top 10 categorias mais frequentes', 'analysis'),
+    ('conte as linhas por classe', 'analysis'),
+    ('analise a coluna class', 'analysis'),
+    ('compare a média de amount entre fraudes e não fraudes', 'analysis'),
+    ('distribuição do amount', 'analysis'),
+    ('plot hist amount', 'analysis'),
+    ('scatter plot of v1 vs v2', 'analysis'),
+    ('show the correlation heatmap', 'analysis'),
+    ('what is the average amount per class', 'analysis'),
+    ('group by category and sum sales', 'analysis'),
+    ('olá', 'chat'),
+    ('oi, tudo bem?', 'chat'),
+    ('bom dia', 'chat'),
+    ('obrigado!', 'chat'),
+    ('valeu pela ajuda', 'chat'),
+    ('quem é você?', 'chat'),
+    ('o que você consegue fazer?', 'chat'),
+    ('como funciona esse app?', 'chat'),
+    ('explique o que é eda', 'chat'),
+    ('o que significa desvio padrão?', 'chat'),
+    ('me explique o conceito de correlação', 'chat'),
+    ('qual modelo você usa?', 'chat'),
+    ('tchau', 'chat'),
+    ('pode me ajudar?', 'chat'),
+    ('que horas são?', 'chat'),
+    ('conte uma piada', 'chat'),
+    ('hello', 'chat'),
+    ('thanks', 'chat'),
+    ('who are you?', 'chat'),
+    ('what can you do?', 'chat'),
+    ('how does this work?', 'chat'),
+    ('me dê dicas de perguntas', 'chat'),
+]
+
+# ================= Features =================
+def normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.split())
+
+def ngrams(text: str) -> Counter:
+    padded = f' {normalize(text)} '
+    lo, hi = NGRAM_RANGE
+    grams = Counter()
+    for n in range(lo, hi + 1):
+        for i in range(len(padded) - n + 1):
+            grams[padded[i:i + n]] += 1
+    return grams
+
+# ================= Modelo =================
+class IntentModel:
+    """Naive Bayes multinomial com suavização de Laplace sobre n-gramas de caracteres."""
+
+    def __init__(self, priors=None, counts=None, totals=None, vocab_size=0):
+        self.priors = priors or {}
+        self.counts = counts or {label: {} for label in LABELS}
+        self.totals = totals or {label: 0 for label in LABELS}
+        self.vocab_size = vocab_size
+
+    @classmethod
+    def train(cls, examples) -> 'IntentModel':
+        counts = {label: Counter() for label in LABELS}
+        docs = Counter()
+        for text, label in examples:
+            if label not in counts:
+                continue
+            counts[label].update(ngrams(text))
+            docs[label] += 1
+        n_docs = sum(docs.values()) or 1
+        vocab = set()
+        for c in counts.values():
+            vocab.update(c)
+        return cls(
+            priors={label: (docs[label] + 1) / (n_docs + len(LABELS)) for label in LABELS},
+            counts={label: dict(counts[label]) for label in LABELS},
+            totals={label: sum(counts[label].values()) for label in LABELS},
+            vocab_size=len(vocab),
+        )
+
+    def predict(self, text: str):
+        """
+        Retorna (rótulo, confiança). A log-verossimilhança é normalizada pelo número
+        de n-gramas, para que prompts longos não saturem a confiança em 1.0.
+        """
+        grams = ngrams(text)
+        n = sum(grams.values()) or 1
+        scores = {}
+        for label in LABELS:
+            counts = self.counts.get(label, {})
+            denom = self.totals.get(label, 0) + self.vocab_size + 1
+            score = math.log(self.priors.get(label, 1 / len(LABELS)))
+            for g, k in grams.items():
+                score += k * math.log((counts.get(g, 0) + 1) / denom)
+            scores[label] = score / n
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        z = sum(math.exp(CONFIDENCE_SCALE * (s - top)) for s in scores.values())
+        return best, 1.0 / z
+
+    def to_dict(self) -> dict:
+        return {
+            'ngram_range': list(NGRAM_RANGE),
+            'priors': self.priors,
+            'counts': self.counts,
+            'totals': self.totals,
+            'vocab_size': self.vocab_size,
+        }
+
+    def save(self, path: str = MODEL_PATH):
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(self.to_dict(), fh, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> 'IntentModel':
+        with open(path, encoding='utf-8') as fh:
+            data = json.load(fh)
+        return cls(data['priors'], data['counts'], data['totals'], data['vocab_size'])
+
+# ================= Log de decisões =================
+def load_logged_examples(path: str = LOG_PATH):
+    """Exemplos (prompt, rótulo do LLM) extraídos do log de classificação."""
+    examples = []
+    if not os.path.exists(path):
+        return examples
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get('llm_label') in LABELS and rec.get('prompt'):
+                examples.append((rec['prompt'], rec['llm_label']))
+    return examples
+
+def append_log(record: dict, path: str = LOG_PATH):
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as fh:
+            fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+    except Exception:
+        pass
+
+_model = None
+
+def get_model() -> IntentModel:
+    """Carrega o artefato treinado; sem ele, treina com os exemplos-semente."""
+    global _model
+    if _model is None:
+        try:
+            _model = IntentModel.load(MODEL_PATH)
+        except Exception:
+            _model = IntentModel.train(SEED_EXAMPLES)
+    return _model
+
+# ================= CLI de treino =================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Treina o classificador local de intenção.')
+    parser.add_argument('--log', default=LOG_PATH, help='log JSONL com rótulos do LLM')
+    parser.add_argument('--out', default=MODEL_PATH, help='arquivo do artefato gerado')
+    args = parser.parse_args(argv)
+
+    logged = load_logged_examples(args.log)
+    model = IntentModel.train(SEED_EXAMPLES + logged)
+    model.save(args.out)
+    print(f'Modelo salvo em {args.out} ({len(SEED_EXAMPLES)} sementes + {len(logged)} do log, '
+          f'{model.vocab_size} n-gramas).')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
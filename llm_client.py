@@ -0,0 +1,178 @@
+# llm_client.py
+"""
+Cliente OpenAI compartilhado pelo processo: pool HTTP com keep-alive e limites de
+conexão, timeouts por fase e novas tentativas com backoff exponencial com jitter
+(full jitter, respeitando Retry-After) em 408/409/429/5xx e falhas de conexão.
+
+As tentativas ficam na camada de transporte (RetryTransport), então valem também
+para o início de respostas em streaming; as do SDK são desligadas (max_retries=0)
+para não somar às nossas. OPENAI_BASE_URL permite apontar para um servidor stub.
+"""
+
+import os
+import time
+import socket
+import random
+import asyncio
+
+from openai import OpenAI, AsyncOpenAI
+
+try:
+    import httpx
+except ImportError:  # versões recentes do SDK usam o fork httpx2
+    import httpx2 as httpx
+
+import telemetry
+
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+OPENAI_TIMEOUT = float(os.environ.get('EDA_OPENAI_TIMEOUT', 60))          # leitura (entre pedaços do stream)
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('EDA_OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_MAX_RETRIES = int(os.environ.get('EDA_OPENAI_MAX_RETRIES', 3))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get('EDA_OPENAI_MAX_CONNECTIONS', 32))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get('EDA_OPENAI_MAX_KEEPALIVE', 16))
+KEEPALIVE_EXPIRY = 120.0
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20.0
+RETRY_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+# ================= Backoff =================
+def _retry_after(response) -> float | None:
+    value = response.headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get('retry-after')
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Espera antes da tentativa attempt+1: full jitter sobre base*2^attempt, ou o Retry-After do servidor."""
+    if retry_after is not None and 0 <= retry_after <= BACKOFF_MAX:
+        return retry_after
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def _should_retry(response=None, error=None) -> bool:
+    if error is not None:
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout,
+                                  httpx.RemoteProtocolError, httpx.PoolTimeout))
+    if response.headers.get('x-should-retry') == 'false':
+        return False
+    return response.status_code in RETRY_STATUS
+
+# ================= Transportes =================
+class RetryTransport(httpx.BaseTransport):
+    """HTTPTransport com pool/keep-alive e novas tentativas com backoff com jitter."""
+
+    def __init__(self, max_retries: int = OPENAI_MAX_RETRIES, **transport_kwargs):
+        self.max_retries = max_retries
+        self._inner = httpx.HTTPTransport(**transport_kwargs)
+
+    def handle_request(self, request):
+        attempt = 0
+        while True:
+            try:
+                response = self._inner.handle_request(request)
+            except Exception as e:
+                if attempt >= self.max_retries or not _should_retry(error=e):
+                    raise
+                delay = backoff_delay(attempt)
+                telemetry.record('llm.retry', delay, reason=type(e).__name__)
+            else:
+                if attempt >= self.max_retries or not _should_retry(response):
+                    return response
+                delay = backoff_delay(attempt, _retry_after(response))
+                telemetry.record('llm.retry', delay, status=response.status_code)
+                response.read()  # consome o corpo (curto) para a conexão voltar ao pool
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self._inner.close()
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Versão assíncrona de RetryTransport."""
+
+    def __init__(self, max_retries: int = OPENAI_MAX_RETRIES, **transport_kwargs):
+        self.max_retries = max_retries
+        self._inner = httpx.AsyncHTTPTransport(**transport_kwargs)
+
+    async def handle_async_request(self, request):
+        attempt = 0
+        while True:
+            try:
+                response = await self._inner.handle_async_request(request)
+            except Exception as e:
+                if attempt >= self.max_retries or not _should_retry(error=e):
+                    raise
+                delay = backoff_delay(attempt)
+                telemetry.record('llm.retry', delay, reason=type(e).__name__)
+            else:
+                if attempt >= self.max_retries or not _should_retry(response):
+                    return response
+                delay = backoff_delay(attempt, _retry_after(response))
+                telemetry.record('llm.retry', delay, status=response.status_code)
+                await response.aread()
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+# ================= Cancelamento =================
+def abort_stream(stream):
+    """
+    Interrompe, de outra thread, um stream de resposta em andamento. Fechar a resposta não
+    acorda uma leitura já bloqueada no socket (ex.: esperando o primeiro token), então o
+    socket é desligado e a leitura falha na hora; a conexão não volta ao pool.
+    Objetos sem resposta HTTP (stubs de teste) são apenas fechados.
+    """
+    response = getattr(stream, 'response', None)
+    network = getattr(response, 'extensions', {}).get('network_stream')
+    sock = network.get_extra_info('socket') if network is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+            return
+        except OSError:
+            pass
+    try:
+        stream.close()
+    except Exception:
+        pass  # já fechado, ou um gerador em execução em outra thread
+
+# ================= Clientes =================
+def _limits():
+    return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                        keepalive_expiry=KEEPALIVE_EXPIRY)
+
+def _timeout(timeout: float):
+    return httpx.Timeout(timeout, connect=OPENAI_CONNECT_TIMEOUT)
+
+def make_client(api_key: str, base_url: str | None = OPENAI_BASE_URL, timeout: float = OPENAI_TIMEOUT,
+                max_retries: int = OPENAI_MAX_RETRIES) -> OpenAI:
+    """Cliente síncrono com pool persistente; crie um por processo e reutilize (ex.: st.cache_resource)."""
+    http_client = httpx.Client(
+        transport=RetryTransport(max_retries=max_retries, limits=_limits()),
+        timeout=_timeout(timeout),
+        follow_redirects=True,
+    )
+    return OpenAI(api_key=api_key, base_url=base_url, timeout=_timeout(timeout), max_retries=0,
+                  http_client=http_client)
+
+def make_async_client(api_key: str, base_url: str | None = OPENAI_BASE_URL, timeout: float = OPENAI_TIMEOUT,
+                      max_retries: int = OPENAI_MAX_RETRIES) -> AsyncOpenAI:
+    """Cliente assíncrono equivalente (para uso em event loops, ex.: lotes com asyncio)."""
+    http_client = httpx.AsyncClient(
+        transport=AsyncRetryTransport(max_retries=max_retries, limits=_limits()),
+        timeout=_timeout(timeout),
+        follow_redirects=True,
+    )
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=_timeout(timeout), max_retries=0,
+                       http_client=http_client)
@@ -0,0 +1,517 @@
+# loadtest.py
+"""
+Teste de carga multi-sessão do app.py, sem chamadas à OpenAI.
+
+N sessões simultâneas do Streamlit (streamlit.testing AppTest, cada uma com seu
+session_state, todas no mesmo processo como num servidor real: cache_resource, pool
+de workers e cliente OpenAI compartilhados) enviam um CSV e uma sequência de
+mensagens roteirizadas. A OpenAI é substituída por um servidor HTTP local
+compatível com /v1/chat/completions (com streaming SSE e latência simulada),
+usado pelo app via OPENAI_BASE_URL, ou seja, passando pelo cliente real
+(llm_client: pool de conexões e novas tentativas).
+
+Para cada nível de concorrência são medidos: latência por etapa vista pela sessão
+(abertura, upload, cada mensagem) e pelo servidor (spans da telemetria), em
+p50/p95/p99; RSS do processo somada à dos workers; e uso de CPU em % de todos os
+núcleos. Limites (--max-p95, --max-p99, --max-rss-mb, --max-cpu-pct,
+--max-error-rate) fazem o comando terminar com código 1, para barrar regressões
+antes do deploy.
+
+Uso:
+    python loadtest.py --sessions 1 4 8 16 --rows 50000 --out carga.json
+    python loadtest.py --sessions 8 --max-p95 upload=5 message=10 --max-rss-mb 4000
+    python loadtest.py --sessions 4 --ttft-ms 400 --token-ms 10 --fail-rate 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+DEFAULT_MESSAGES = [
+    'olá, o que você consegue fazer?',
+    'histograma de num_0',
+    'média de num_1 por cat_0',
+    'quais conclusões?',
+]
+SAMPLE_INTERVAL = 0.25  # segundos entre amostras de RSS/CPU
+# respostas do assistente que o app usa para reportar falhas (sem st.error)
+ERROR_PREFIXES = ('Ocorreu um erro', 'A análise falhou', 'Falha')
+
+# ================= OpenAI falso (HTTP) =================
+class StubOpenAI:
+    """
+    Servidor local com a API de chat completions: respostas gravadas (as do benchmark),
+    escolhidas pelo tipo de chamada, com latência até o 1º token e por token e uma
+    fração opcional de 503 (exercita as novas tentativas do cliente).
+    """
+
+    def __init__(self, responses: dict, ttft_ms: float = 0.0, token_ms: float = 0.0, fail_rate: float = 0.0):
+        from benchmark import FakeCompletions
+
+        self._kind = FakeCompletions(responses)._kind
+        self.responses = responses
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.fail_rate = fail_rate
+        self.calls = {}
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}/v1'
+
+    def start(self) -> 'StubOpenAI':
+        threading.Thread(target=self._server.serve_forever, name='openai-stub', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _enter(self, kind: str | None):
+        with self._lock:
+            if kind is None:
+                self.failures += 1
+            else:
+                self.calls[kind] = self.calls.get(kind, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'calls': dict(self.calls), 'failures': self.failures, 'max_in_flight': self.max_in_flight}
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls, self.failures, self.max_in_flight = {}, 0, self.in_flight
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como a API real
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, data: dict, headers: dict | None = None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def do_POST(self):
+        stub = self.server.stub
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        if stub.fail_rate and random.random() < stub.fail_rate:
+            stub._enter(None)
+            try:
+                self._send_json(503, {'error': {'message': 'stub overloaded', 'type': 'server_error'}},
+                                {'retry-after-ms': '50'})
+            finally:
+                stub._leave()
+            return
+        kind = stub._kind(request)
+        text = stub.responses[kind]
+        stub._enter(kind)
+        try:
+            time.sleep(stub.ttft_ms / 1000)
+            base = {'id': f'chatcmpl-{uuid.uuid4().hex[:12]}', 'created': int(time.time()),
+                    'model': request.get('model', 'stub')}
+            usage = {'prompt_tokens': len(json.dumps(request.get('messages', []))) // 4,
+                     'completion_tokens': len(text) // 4}
+            usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+            if not request.get('stream'):
+                self._send_json(200, {**base, 'object': 'chat.completion', 'usage': usage, 'choices': [
+                    {'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}]})
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            chunk = {**base, 'object': 'chat.completion.chunk'}
+            for i in range(0, len(text), 4):  # ~4 caracteres por token, como no benchmark
+                if stub.token_ms:
+                    time.sleep(stub.token_ms / 1000)
+                delta = {'index': 0, 'delta': {'content': text[i:i + 4]}, 'finish_reason': None}
+                self._send_chunk(f"data: {json.dumps({**chunk, 'choices': [delta]})}\n\n".encode())
+            if (request.get('stream_options') or {}).get('include_usage'):
+                self._send_chunk(f"data: {json.dumps({**chunk, 'choices': [], 'usage': usage})}\n\n".encode())
+            self._send_chunk(b'data: [DONE]\n\n')
+            self._send_chunk(b'')
+        finally:
+            stub._leave()
+
+# ================= RSS e CPU =================
+_CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+def _proc_tree(root: int) -> list:
+    """root e descendentes (workers, forkserver) via /proc; só root fora do Linux."""
+    parents = {}
+    try:
+        for name in os.listdir('/proc'):
+            if name.isdigit():
+                try:
+                    with open(f'/proc/{name}/stat') as fh:
+                        parents[int(name)] = int(fh.read().rsplit(')', 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+    except OSError:
+        return [root]
+    tree, frontier = [root], [root]
+    while frontier:
+        frontier = [pid for pid, ppid in parents.items() if ppid in frontier]
+        tree += frontier
+    return tree
+
+def _proc_usage(pid: int):
+    """(RSS em MB, tempo de CPU em s) de um processo via /proc; None se indisponível."""
+    try:
+        with open(f'/proc/{pid}/stat') as fh:
+            fields = fh.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/statm') as fh:
+            rss_pages = int(fh.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    cpu = (int(fields[11]) + int(fields[12])) / _CLK_TCK  # utime + stime
+    return rss_pages * os.sysconf('SC_PAGE_SIZE') / 2**20, cpu
+
+class ResourceSampler:
+    """Amostra, em segundo plano, RSS total e % de CPU (de todos os núcleos) do processo e dos filhos."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._cpu = {}
+
+    def _sample(self):
+        rss, cpu_delta = 0.0, 0.0
+        for pid in _proc_tree(os.getpid()):
+            usage = _proc_usage(pid)
+            if usage is None:
+                continue
+            rss += usage[0]
+            cpu_delta += max(0.0, usage[1] - self._cpu.get(pid, usage[1]))
+            self._cpu[pid] = usage[1]
+        return rss, cpu_delta
+
+    def _run(self):
+        self._sample()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            rss, cpu_delta = self._sample()
+            now = time.perf_counter()
+            cpu_pct = cpu_delta / (now - last) / (os.cpu_count() or 1) * 100
+            self.samples.append((rss, cpu_pct))
+            last = now
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='loadtest-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {'rss_peak_mb': None, 'rss_end_mb': None, 'cpu_mean_pct': None, 'cpu_peak_pct': None}
+        rss = [s[0] for s in self.samples]
+        cpu = [s[1] for s in self.samples]
+        return {
+            'rss_peak_mb': round(max(rss), 1),
+            'rss_end_mb': round(rss[-1], 1),
+            'cpu_mean_pct': round(float(np.mean(cpu)), 1),
+            'cpu_peak_pct': round(max(cpu), 1),
+        }
+
+# ================= Sessões =================
+def _server_like_apptest():
+    """
+    Ajusta o AppTest, feito para uma sessão por vez, ao modelo do servidor real
+    (um runtime e um script compilado para todas as sessões):
+
+    - AppTest compila o app.py a cada rerun (ScriptCaches novos por execução): um cache
+      comum, já aquecido, evita ast.parse simultâneos em várias threads (instável no
+      CPython 3.11) e tira a compilação das medições;
+    - ao fim de cada rerun o AppTest zera o Runtime global, que as outras sessões ainda
+      em execução perderiam: o último runtime criado continua visível.
+    """
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    shared = ScriptCache()
+    shared.get_bytecode(APP_PATH)
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: shared
+
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last['runtime'] = cls._instance
+        elif 'runtime' not in last:
+            raise RuntimeError("Runtime hasn't been created!")
+        return cls._instance or last['runtime']
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or 'runtime' in last)
+
+def _page_errors(at) -> list:
+    """Exceções não tratadas e mensagens de erro exibidas na página (st.error ou no chat)."""
+    errors = [e.value for e in at.exception]
+    errors += [e.value for e in at.error]
+    errors += [m.value for m in at.markdown if m.value.startswith(ERROR_PREFIXES)]
+    return errors
+
+def run_session(index: int, csv_name: str, csv_bytes: bytes, messages: list, timeout: float,
+                start_delay: float = 0.0) -> list:
+    """Uma sessão completa: abre o app, envia o CSV e as mensagens. Retorna um registro por etapa."""
+    from streamlit.testing.v1 import AppTest
+
+    time.sleep(start_delay)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    steps = []
+
+    def step(name: str, action):
+        t0 = time.perf_counter()
+        try:
+            action()
+            errors = _page_errors(at)
+        except Exception as e:
+            errors = [f'{type(e).__name__}: {e}']
+        steps.append({'session': index, 'step': name, 'seconds': time.perf_counter() - t0,
+                      'ok': not errors, 'error': str(errors[0])[:500] if errors else None})
+        return not errors
+
+    if not step('open', at.run):
+        return steps
+    if not step('upload', lambda: at.file_uploader[0].set_value((csv_name, csv_bytes, 'text/csv')).run()):
+        return steps
+    for i, msg in enumerate(messages, 1):
+        step(f'message {i}', lambda: at.chat_input[0].set_value(msg).run())
+    return steps
+
+def _percentiles(values: list) -> dict:
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if values else (0.0, 0.0, 0.0)
+    return {'n': len(values), 'p50_s': round(float(p50), 4), 'p95_s': round(float(p95), 4),
+            'p99_s': round(float(p99), 4), 'max_s': round(max(values), 4) if values else 0.0}
+
+def make_datasets(out_dir: str, n: int, rows: int, shape: str, seed: int = 0) -> list:
+    """n CSVs sintéticos (ver benchmark.make_csv) como (nome, bytes); os arquivos não ficam em disco."""
+    from benchmark import make_csv
+
+    os.makedirs(out_dir, exist_ok=True)
+    datasets = []
+    for i in range(n):
+        path = os.path.join(out_dir, f'load_{shape}_{seed + i}.csv')
+        make_csv(path, rows, shape, seed=seed + i)
+        with open(path, 'rb') as fh:
+            datasets.append((os.path.basename(path), fh.read()))
+        os.remove(path)
+    return datasets
+
+def _fresh_caches(level_dir: str):
+    """Cache de código e índice semântico vazios (em level_dir) para as sessões do nível."""
+    import agent
+    from code_cache import CodeCache
+    from semantic_cache import SemanticIndex
+
+    path = os.path.join(level_dir, 'code_cache.sqlite')
+    agent._code_cache = CodeCache(path=path)
+    agent._semantic_index = SemanticIndex(path=path)
+
+def run_level(n_sessions: int, datasets: list, messages: list, stub: StubOpenAI, timeout: float,
+              ramp_s: float = 0.0) -> dict:
+    """Roda n_sessions sessões simultâneas e resume latências, erros e recursos do nível."""
+    import telemetry
+
+    telemetry.reset()
+    stub.reset_stats()
+    with ResourceSampler() as sampler, ThreadPoolExecutor(max_workers=n_sessions,
+                                                          thread_name_prefix='loadtest-session') as ex:
+        t0 = time.perf_counter()
+        futures = [
+            ex.submit(run_session, i, *datasets[i % len(datasets)], messages, timeout, ramp_s * i / n_sessions)
+            for i in range(n_sessions)
+        ]
+        steps = [s for fut in futures for s in fut.result()]
+        wall = time.perf_counter() - t0
+
+    by_step = {}
+    for s in steps:
+        by_step.setdefault(s['step'], []).append(s['seconds'])
+        if s['step'].startswith('message'):
+            by_step.setdefault('message', []).append(s['seconds'])
+    errors = [s for s in steps if not s['ok']]
+    n_messages = sum(1 for s in steps if s['step'].startswith('message '))
+    return {
+        'sessions': n_sessions,
+        'wall_s': round(wall, 3),
+        'messages_per_s': round(n_messages / wall, 3) if wall else 0.0,
+        'steps': {name: _percentiles(v) for name, v in by_step.items()},
+        'server': telemetry.summary(),
+        'errors': len(errors),
+        'error_rate': round(len(errors) / len(steps), 4) if steps else 0.0,
+        'error_samples': [{'step': e['step'], 'error': e['error']} for e in errors[:5]],
+        'llm': stub.stats(),
+        **sampler.summary(),
+    }
+
+# ================= Limites =================
+def _parse_limits(items: list | None) -> dict:
+    limits = {}
+    for item in items or []:
+        name, _, value = item.partition('=')
+        if not value:
+            raise argparse.ArgumentTypeError(f'limite inválido {item!r}; use etapa=segundos')
+        limits[name] = float(value)
+    return limits
+
+def check_thresholds(level: dict, max_p95: dict, max_p99: dict, max_rss_mb: float | None,
+                     max_cpu_pct: float | None, max_error_rate: float) -> list:
+    """Violações dos limites num nível; etapas da sessão ou spans do servidor (telemetria)."""
+    server = {row['etapa']: row for row in level['server']}
+    violations = []
+    for key, limits in (('p95_s', max_p95), ('p99_s', max_p99)):
+        for name, limit in limits.items():
+            stats = level['steps'].get(name) or server.get(name)
+            if stats is not None and stats[key] > limit:
+                violations.append(f"{level['sessions']} sessões: {name} {key}={stats[key]:.3f}s > {limit}s")
+    if max_rss_mb is not None and (level['rss_peak_mb'] or 0) > max_rss_mb:
+        violations.append(f"{level['sessions']} sessões: RSS de pico {level['rss_peak_mb']} MB > {max_rss_mb} MB")
+    if max_cpu_pct is not None and (level['cpu_mean_pct'] or 0) > max_cpu_pct:
+        violations.append(f"{level['sessions']} sessões: CPU média {level['cpu_mean_pct']}% > {max_cpu_pct}%")
+    if level['error_rate'] > max_error_rate:
+        violations.append(f"{level['sessions']} sessões: taxa de erro {level['error_rate']:.1%} > {max_error_rate:.1%}"
+                          f" (ex.: {level['error_samples'][0]['error']})")
+    return violations
+
+def _print_level(level: dict):
+    rows = [{'etapa': name, **stats} for name, stats in level['steps'].items()]
+    print(f"\n## {level['sessions']} sessões — {level['wall_s']}s, {level['messages_per_s']} msg/s, "
+          f"erros {level['errors']}, RSS pico {level['rss_peak_mb']} MB, "
+          f"CPU média/pico {level['cpu_mean_pct']}%/{level['cpu_peak_pct']}%, "
+          f"LLM {level['llm']['calls']} (máx. {level['llm']['max_in_flight']} simultâneas)", file=sys.stderr)
+    print(pd.DataFrame(rows).to_markdown(index=False), file=sys.stderr)
+
+# ================= CLI =================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Teste de carga multi-sessão do app Streamlit com OpenAI falsa.')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8], help='níveis de concorrência')
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--shape', default='narrow', help='formato do CSV sintético (ver benchmark.SHAPES)')
+    parser.add_argument('--shared-dataset', action='store_true',
+                        help='todas as sessões enviam o mesmo CSV (padrão: um CSV diferente por sessão)')
+    parser.add_argument('--messages', help='arquivo com uma mensagem por linha (padrão: roteiro embutido)')
+    parser.add_argument('--responses', help='JSON com respostas gravadas (classify/chat/analysis)')
+    parser.add_argument('--ttft-ms', type=float, default=200.0, help='latência simulada até o 1º token')
+    parser.add_argument('--token-ms', type=float, default=5.0, help='latência simulada por token')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fração de chamadas respondidas com 503')
+    parser.add_argument('--ramp', type=float, default=0.0, help='segundos para iniciar todas as sessões do nível')
+    parser.add_argument('--timeout', type=float, default=120.0, help='tempo máximo de cada rerun da sessão')
+    parser.add_argument('--out', default='loadtest_results.json')
+    parser.add_argument('--max-p95', nargs='+', metavar='ETAPA=S', help='ex.: upload=5 message=10 exec=2')
+    parser.add_argument('--max-p99', nargs='+', metavar='ETAPA=S')
+    parser.add_argument('--max-rss-mb', type=float)
+    parser.add_argument('--max-cpu-pct', type=float)
+    parser.add_argument('--max-error-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+    max_p95, max_p99 = _parse_limits(args.max_p95), _parse_limits(args.max_p99)
+
+    # caches e logs isolados; a URL do stub precisa estar no ambiente antes de importar o app
+    tmp = tempfile.mkdtemp(prefix='eda-load-')
+    atexit.register(shutil.rmtree, tmp, ignore_errors=True)
+    os.environ.setdefault('EDA_CODE_CACHE_PATH', os.path.join(tmp, 'code_cache.sqlite'))
+    os.environ.setdefault('EDA_INTENT_LOG_PATH', os.path.join(tmp, 'intent_log.jsonl'))
+    os.environ.setdefault('EDA_CACHE_DIR', os.path.join(tmp, 'datasets'))
+    os.environ.setdefault('EDA_TRACE_PATH', os.path.join(tmp, 'traces.jsonl'))
+    from benchmark import DEFAULT_RESPONSES, SHAPES
+    from streamlit import config as st_config
+    from streamlit.logger import set_log_level
+
+    # avisos de depreciação e de execução sem servidor, repetidos a cada rerun
+    st_config.set_option('logger.level', 'error')
+    set_log_level('error')
+    # chave via arquivo de secrets: AppTest.secrets troca o st.secrets global a cada rerun,
+    # o que não é seguro com várias sessões rodando ao mesmo tempo
+    secrets_path = os.path.join(tmp, 'secrets.toml')
+    with open(secrets_path, 'w', encoding='utf-8') as fh:
+        fh.write('OPENAI_API_KEY = "sk-loadtest"\n')
+    st_config.set_option('secrets.files', [secrets_path])
+    _server_like_apptest()
+
+    if args.shape not in SHAPES:
+        parser.error(f'--shape deve ser um de {sorted(SHAPES)}')
+    responses = dict(DEFAULT_RESPONSES)
+    if args.responses:
+        with open(args.responses, encoding='utf-8') as fh:
+            responses.update(json.load(fh))
+    stub = StubOpenAI(responses, args.ttft_ms, args.token_ms, args.fail_rate).start()
+    os.environ['OPENAI_BASE_URL'] = stub.base_url
+
+    messages = DEFAULT_MESSAGES
+    if args.messages:
+        with open(args.messages, encoding='utf-8') as fh:
+            messages = [line.strip() for line in fh if line.strip()]
+
+    n_datasets = 1 if args.shared_dataset else max(args.sessions)
+    results, violations = [], []
+    try:
+        for i, n in enumerate(args.sessions):
+            # dados e caches novos por nível: senão, do 2º nível em diante código, perfis e
+            # resultados já estariam em cache e a curva compararia caminhos diferentes
+            level_dir = os.path.join(tmp, f'level_{i}')
+            print(f'Gerando {n_datasets} CSV(s) de {args.rows:,} linhas...', file=sys.stderr)
+            datasets = make_datasets(level_dir, n_datasets, args.rows, args.shape, seed=i * n_datasets)
+            _fresh_caches(level_dir)
+            level = run_level(n, datasets, messages, stub, args.timeout, args.ramp)
+            results.append(level)
+            _print_level(level)
+            violations += check_thresholds(level, max_p95, max_p99, args.max_rss_mb, args.max_cpu_pct,
+                                           args.max_error_rate)
+    finally:
+        stub.stop()
+
+    with open(args.out, 'w', encoding='utf-8') as fh:
+        json.dump({'config': {k: v for k, v in vars(args).items() if k != 'out'}, 'levels': results},
+                  fh, indent=2, default=str)
+    print(f'\nResultados gravados em {args.out}', file=sys.stderr)
+    for v in violations:
+        print(f'LIMITE EXCEDIDO: {v}', file=sys.stderr)
+    return 1 if violations else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# pipeline.py
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from llm_client import abort_stream
+from agent import classify_intent, local_intent, stream_analysis_code
+
+PIPELINE_WORKERS = int(os.environ.get('EDA_PIPELINE_WORKERS', 32))
+INTENT_WORKERS = int(os.environ.get('EDA_INTENT_WORKERS', 8))
+
+# streams de código são longos (segundos); a classificação de intenção é curta e tem pool
+# próprio para não entrar na fila atrás deles quando há muitas sessões
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix='eda-codegen')
+_intent_executor = ThreadPoolExecutor(max_workers=INTENT_WORKERS, thread_name_prefix='eda-intent')
+_DONE = object()
+
+# ================= Pipeline especulativo =================
+class SpeculativeAnalysis:
+    """
+    Dispara a classificação de intenção e, em paralelo, a geração de código
+    (incluindo a montagem do contexto do prompt), de forma especulativa.
+
+    A especulação só acontece quando o classificador local não tem certeza de que
+    é "chat"; se a intenção final for "chat", a geração é cancelada e o stream fechado.
+    build_context: callable sem argumentos que retorna (sample_markdown, schema).
+    engine: repassado a stream_analysis_code (None ou "duckdb").
+    Nenhuma chamada a `st` é feita nas threads de trabalho; os spans de telemetria
+    delas entram no trace de quem criou a análise.
+    """
+
+    def __init__(self, user_prompt: str, build_context, engine: str | None = None,
+                 executor: ThreadPoolExecutor = _executor,
+                 intent_executor: ThreadPoolExecutor = _intent_executor):
+        self.user_prompt = user_prompt
+        self.build_context = build_context
+        self.engine = engine
+        self._executor = executor
+        self._cancel = threading.Event()
+        self._queue = queue.Queue()
+        self._codegen = None
+        self._stream = None
+        self._stream_lock = threading.Lock()
+
+        self._intent = intent_executor.submit(telemetry.run_in_context(classify_intent), user_prompt)
+        label, _, confident = local_intent(user_prompt)
+        self.speculated = not (confident and label == 'chat')
+        if self.speculated:
+            self._start_codegen()
+
+    # -------- geração de código --------
+    def _start_codegen(self):
+        if self._codegen is None:
+            self._codegen = self._executor.submit(telemetry.run_in_context(self._run_codegen))
+
+    def _on_stream(self, stream):
+        with self._stream_lock:
+            self._stream = stream
+            cancelled = self._cancel.is_set()
+        if cancelled:
+            abort_stream(stream)
+
+    def _run_codegen(self):
+        try:
+            if self._cancel.is_set():
+                return  # cancelada enquanto esperava na fila
+            sample_markdown, schema = self.build_context()
+            if self._cancel.is_set():
+                return
+            gen = stream_analysis_code(self.user_prompt, sample_markdown, schema=schema, engine=self.engine,
+                                       on_stream=self._on_stream)
+            try:
+                for delta in gen:
+                    if self._cancel.is_set():
+                        break
+                    self._queue.put(delta)
+            finally:
+                gen.close()
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            self._queue.put(_DONE)
+
+    # -------- API --------
+    def intent(self, timeout: float | None = None) -> str:
+        """Aguarda e retorna a intenção classificada."""
+        return self._intent.result(timeout=timeout)
+
+    def code_deltas(self):
+        """Pedaços do código gerado, na ordem; inicia a geração se ela não foi especulada."""
+        self._start_codegen()
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        """Descarta a geração especulativa; um stream da API já aberto é interrompido na hora (ver abort_stream)."""
+        self._cancel.set()
+        with self._stream_lock:
+            stream = self._stream
+        if stream is not None:
+            abort_stream(stream)
@@ -0,0 +1,123 @@
+# plot_helpers.py
+"""
+Helpers de gráfico com agregação no servidor, injetados no namespace do código
+gerado. Todos retornam figuras Plotly cujo tamanho não cresce com o número de
+linhas: a agregação é feita com NumPy antes de montar a figura.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+MAX_LINE_POINTS = 4000
+MAX_SCATTER_POINTS = 20_000
+MAX_CATEGORIES = 50
+
+# ================= Utilitários =================
+def _finite(values: pd.Series) -> np.ndarray:
+    arr = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    return arr[np.isfinite(arr)]
+
+def _as_sortable(values: pd.Series) -> np.ndarray:
+    """Eixo x como float64 (datas viram nanossegundos UTC, NaT vira NaN) para ordenar e agrupar."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        if getattr(values.dt, 'tz', None) is not None:
+            values = values.dt.tz_convert(None)
+        arr = values.astype('datetime64[ns]').to_numpy().view('int64').astype('float64')
+        arr[values.isna().to_numpy()] = np.nan
+        return arr
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+def _to_datetimes(ns: np.ndarray, tz):
+    """Inverso de _as_sortable para datas: nanossegundos UTC -> DatetimeIndex (no fuso original)."""
+    out = pd.to_datetime(ns.astype('int64'))
+    return out.tz_localize('UTC').tz_convert(tz) if tz is not None else out
+
+# ================= Histograma =================
+def plot_hist(df: pd.DataFrame, col: str, bins: int = 50, title: str | None = None):
+    """
+    Histograma pré-agregado (np.histogram); datas são agrupadas em intervalos de tempo
+    e colunas de texto/booleanas viram contagem das top categorias.
+    """
+    s = df[col]
+    title = title or f'Distribuição de {col}'
+    is_datetime = pd.api.types.is_datetime64_any_dtype(s)
+    if not is_datetime and (not pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s)):
+        counts = s.value_counts(dropna=False).head(MAX_CATEGORIES)
+        return px.bar(x=counts.index.astype(str), y=counts.values, labels={'x': col, 'y': 'contagem'}, title=title)
+
+    values = _as_sortable(s) if is_datetime else _finite(s)
+    values = values[np.isfinite(values)]
+    counts, edges = np.histogram(values, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    widths = np.diff(edges)
+    if is_datetime:
+        # eixo de datas do Plotly mede larguras em milissegundos
+        centers, widths = _to_datetimes(centers, getattr(s.dt, 'tz', None)), widths / 1e6
+    fig = go.Figure(go.Bar(x=centers, y=counts, width=widths, marker_line_width=0))
+    fig.update_layout(title=title, xaxis_title=col, yaxis_title='contagem', bargap=0)
+    return fig
+
+# ================= Densidade 2D =================
+def plot_density(df: pd.DataFrame, x: str, y: str, bins: int = 120, log: bool = True, title: str | None = None):
+    """Mapa de calor de densidade (np.histogram2d) no lugar de um scatter com milhões de pontos."""
+    xv = pd.to_numeric(df[x], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    yv = pd.to_numeric(df[y], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    mask = np.isfinite(xv) & np.isfinite(yv)
+    counts, xe, ye = np.histogram2d(xv[mask], yv[mask], bins=bins)
+    z = np.log1p(counts.T) if log else counts.T
+    fig = go.Figure(go.Heatmap(
+        x=(xe[:-1] + xe[1:]) / 2,
+        y=(ye[:-1] + ye[1:]) / 2,
+        z=z,
+        colorscale='Viridis',
+        colorbar_title='log(1+n)' if log else 'n',
+    ))
+    fig.update_layout(title=title or f'Densidade de {y} x {x}', xaxis_title=x, yaxis_title=y)
+    return fig
+
+# ================= Linha decimada =================
+def decimate_minmax(x: np.ndarray, y: np.ndarray, max_points: int = MAX_LINE_POINTS) -> np.ndarray:
+    """
+    Índices a manter para desenhar y(x) com no máximo ~max_points pontos:
+    em cada bucket guarda primeiro, último, mínimo e máximo (preserva picos).
+    x deve estar ordenado.
+    """
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n)
+    n_buckets = max(1, max_points // 4)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    keep = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi <= lo:
+            continue
+        seg = y[lo:hi]
+        keep.extend((lo, hi - 1))
+        if np.isfinite(seg).any():
+            keep.extend((lo + int(np.nanargmin(seg)), lo + int(np.nanargmax(seg))))
+    return np.unique(np.asarray(keep, dtype=np.int64))
+
+def plot_line(df: pd.DataFrame, x: str, y: str, max_points: int = MAX_LINE_POINTS, title: str | None = None):
+    """Série (ex.: temporal) ordenada por x e decimada preservando mínimos e máximos."""
+    xs = _as_sortable(df[x])
+    ys = pd.to_numeric(df[y], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    order = np.argsort(xs, kind='stable')
+    order = order[np.isfinite(xs[order])]
+    idx = order[decimate_minmax(xs[order], ys[order], max_points)]
+    fig = go.Figure(go.Scattergl(x=df[x].iloc[idx], y=ys[idx], mode='lines'))
+    fig.update_layout(title=title or f'{y} por {x}', xaxis_title=x, yaxis_title=y)
+    return fig
+
+# ================= Scatter amostrado =================
+def plot_scatter(df: pd.DataFrame, x: str, y: str, color: str | None = None,
+                 max_points: int = MAX_SCATTER_POINTS, title: str | None = None):
+    """Scatter (WebGL) sobre uma amostra aleatória de no máximo max_points linhas."""
+    cols = [c for c in (x, y, color) if c is not None]
+    data = df[cols]
+    if len(data) > max_points:
+        data = data.sample(n=max_points, random_state=0)
+    fig = px.scatter(data, x=x, y=y, color=color, render_mode='webgl',
+                     title=title or f'{y} x {x} (amostra de {len(data):,} pontos)')
+    return fig
@@ -0,0 +1,121 @@
+# profiling.py
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from timeseries import is_sorted
+
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+QUANTILES = (0.25, 0.5, 0.75)
+N_EXAMPLES = 3
+EXAMPLE_SCAN_ROWS = 1000  # exemplos vêm do início da coluna (sem varrer tudo)
+EXAMPLE_MAX_CHARS = 40
+
+# ================= Perfil por coluna =================
+def _kind(s: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(s):
+        return 'bool'
+    if pd.api.types.is_numeric_dtype(s):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return 'datetime'
+    if isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(s) or pd.api.types.is_object_dtype(s):
+        return 'categorical'
+    return 'other'
+
+def example_values(s: pd.Series, k: int = N_EXAMPLES) -> list:
+    """Até k valores distintos não nulos do início da coluna, como texto curto."""
+    values = s.iloc[:EXAMPLE_SCAN_ROWS].dropna().unique()[:k]
+    return [(f'{v:.6g}' if isinstance(v, float) else str(v))[:EXAMPLE_MAX_CHARS] for v in values]
+
+def profile_column(s: pd.Series, col_sketch=None) -> dict:
+    """
+    Estatísticas de uma coluna: nulos, distintos, min/max, quartis (numéricas) e exemplos.
+    Com col_sketch (sketches.ColumnSketch), distintos e quartis saem do sketch (aproximados).
+    """
+    n = len(s)
+    n_nulls = int(s.isna().sum())
+    kind = _kind(s)
+    col = {
+        'coluna': s.name,
+        'dtype': str(s.dtype),
+        'tipo': kind,
+        'n_nulos': n_nulls,
+        'pct_nulos': round(n_nulls / n * 100, 2) if n else 0.0,
+        'n_distintos': None,
+        'min': None,
+        'max': None,
+        'q25': None,
+        'q50': None,
+        'q75': None,
+        'exemplos': [],
+    }
+    try:
+        col['exemplos'] = example_values(s)
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            col['n_distintos'] = int(len(s.cat.categories))
+        elif col_sketch is not None:
+            col['n_distintos'] = col_sketch.nunique()
+        else:
+            col['n_distintos'] = int(s.nunique(dropna=True))
+
+        if kind in {'numeric', 'datetime'} and n_nulls < n:
+            col['min'] = s.min()
+            col['max'] = s.max()
+        if kind == 'numeric' and n_nulls < n:
+            if col_sketch is not None and col_sketch.digest is not None:
+                qs = pd.Series(col_sketch.digest.quantile(list(QUANTILES)))
+            else:
+                qs = s.quantile(list(QUANTILES))
+            col['q25'], col['q50'], col['q75'] = (float(v) for v in qs.values)
+    except Exception:
+        pass
+    return col
+
+# ================= Perfil do dataset =================
+def build_profile(df: pd.DataFrame, max_workers: int = MAX_WORKERS, sketch=None) -> dict:
+    """
+    Calcula o perfil completo do DataFrame uma única vez, coluna a coluna em paralelo.
+    Retorna dict com n_rows, n_cols, columns (DataFrame, uma linha por coluna), counts por
+    tipo, sorted_by (primeira coluna de data pela qual o df está ordenado, ou None) e
+    approx (True se distintos e quartis vieram do `sketch`, um sketches.DatasetSketch).
+    """
+    series = [df[c] for c in df.columns]
+    col_sketches = [sketch.columns.get(c) if sketch is not None and not sketch.is_partial(c) else None
+                    for c in df.columns]
+    if max_workers > 1 and len(series) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            rows = list(pool.map(profile_column, series, col_sketches))
+    else:
+        rows = [profile_column(s, sk) for s, sk in zip(series, col_sketches)]
+
+    columns = pd.DataFrame(rows, columns=[
+        'coluna', 'dtype', 'tipo', 'n_nulos', 'pct_nulos', 'n_distintos',
+        'min', 'max', 'q25', 'q50', 'q75', 'exemplos',
+    ])
+    kinds = columns['tipo'].value_counts()
+    dt_cols = columns.loc[columns['tipo'] == 'datetime', 'coluna']
+    return {
+        'n_rows': len(df),
+        'n_cols': df.shape[1],
+        'columns': columns,
+        'counts': {k: int(kinds.get(k, 0)) for k in ('numeric', 'categorical', 'datetime', 'bool')},
+        'sorted_by': next((c for c in dt_cols if is_sorted(df[c])), None),
+        'approx': sketch is not None,
+    }
+
+def pick_strata_column(profile: dict, max_distinct: int = 50):
+    """Coluna categórica de baixa cardinalidade (menos nulos, depois menos categorias) para estratificar amostras."""
+    cols = profile['columns']
+    cand = cols[(cols['tipo'].isin(['categorical', 'bool']))
+                & (cols['n_distintos'] >= 2) & (cols['n_distintos'] <= max_distinct)]
+    if cand.empty:
+        return None
+    return cand.sort_values(['n_nulos', 'n_distintos']).iloc[0]['coluna']
+
+def profile_markdown(profile: dict) -> str:
+    """Resumo do perfil em Markdown, para contexto do LLM."""
+    cols = profile['columns'][['coluna', 'dtype', 'pct_nulos', 'n_distintos', 'min', 'max']]
+    header = f"Linhas: {profile['n_rows']:,} | Colunas: {profile['n_cols']}"
+    return f'{header}\n\n{cols.to_markdown(index=False)}'
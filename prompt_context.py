@@ -0,0 +1,114 @@
+# prompt_context.py
+"""
+Contexto compacto do dataset para o prompt de geração de código: nomes, dtypes,
+% de nulos, distintos, faixa, mediana e alguns exemplos por coluna, tudo vindo do
+perfil já calculado (profiling.build_profile), dentro de um orçamento de tokens.
+
+Quando nem tudo cabe, o texto é degradado em etapas: todas as colunas em forma
+resumida e as primeiras promovidas à forma completa enquanto houver orçamento;
+se nem a forma resumida couber, só nome:dtype, com as colunas excedentes omitidas.
+"""
+
+import os
+import pandas as pd
+
+from timeseries import describe_rollups
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get('EDA_PROMPT_TOKEN_BUDGET', 1500))
+CHARS_PER_TOKEN = 4  # estimativa grosseira, a mesma usada na telemetria
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _fmt(v) -> str:
+    if v is None or (not isinstance(v, (list, tuple)) and pd.isna(v)):
+        return '—'
+    if isinstance(v, float):
+        return f'{v:.4g}'
+    return str(v)
+
+# ================= Linhas por coluna =================
+def _compact_line(c: dict) -> str:
+    line = f"- {c['coluna']} ({c['dtype']}) · nulos {c['pct_nulos']}%"
+    if c['n_distintos'] is not None:
+        line += f" · distintos {c['n_distintos']:,}"
+    return line
+
+def _full_line(c: dict) -> str:
+    line = _compact_line(c)
+    if c['min'] is not None and not pd.isna(c['min']):
+        line += f" · {_fmt(c['min'])} … {_fmt(c['max'])}"
+    if c['q50'] is not None and not pd.isna(c['q50']):
+        line += f" · mediana {_fmt(c['q50'])}"
+    examples = c.get('exemplos')
+    if examples is not None and len(examples):
+        line += ' · ex: ' + ', '.join(examples)
+    return line
+
+def _header(profile: dict) -> str:
+    counts = profile['counts']
+    header = (
+        f"Linhas: {profile['n_rows']:,} | Colunas: {profile['n_cols']} | "
+        f"numéricas {counts['numeric']}, categóricas {counts['categorical']}, "
+        f"datas {counts['datetime']}, booleanas {counts['bool']}\n"
+        'Por coluna: nome (dtype) · % nulos · distintos · mín … máx · mediana · exemplos'
+    )
+    if profile.get('approx'):
+        header += ('\nDistintos e mediana são aproximados (sketches); o objeto sketch responde '
+                   'nunique/quantile/top(col, ..., exact=True) quando a precisão importar.')
+    return header
+
+def _time_lines(profile: dict, rollups: dict | None) -> str:
+    """Colunas de data já convertidas na ingestão, ordenação e rollups disponíveis."""
+    cols = profile['columns']
+    dt_cols = [str(c) for c in cols.loc[cols['tipo'] == 'datetime', 'coluna']]
+    if not dt_cols:
+        return ''
+    lines = [f"Datas já em datetime64 (não reconverta com pd.to_datetime): {', '.join(dt_cols)}."]
+    if profile.get('sorted_by') is not None:
+        lines.append(f"df já está ordenado por {profile['sorted_by']}.")
+    if rollups:
+        lines.append(describe_rollups(rollups))
+    return '\n'.join(lines)
+
+# ================= Montagem =================
+def build_prompt_context(profile: dict, budget_tokens: int = PROMPT_TOKEN_BUDGET, rollups: dict | None = None) -> str:
+    """
+    Resumo de esquema e estatísticas do dataset com no máximo ~budget_tokens tokens.
+    rollups: agregados por período já calculados (timeseries.build_rollups), citados no texto.
+    """
+    header = _header(profile)
+    time_lines = _time_lines(profile, rollups)
+    if time_lines:
+        header += '\n' + time_lines
+    cols = profile['columns'].to_dict('records')
+    budget = max(0, budget_tokens * CHARS_PER_TOKEN - len(header) - 1)
+
+    compact = [_compact_line(c) for c in cols]
+    used = sum(len(line) + 1 for line in compact)
+    if used <= budget:
+        lines = list(compact)
+        remaining = budget - used
+        for i, c in enumerate(cols):
+            full = _full_line(c)
+            extra = len(full) - len(lines[i])
+            if extra <= remaining:
+                lines[i] = full
+                remaining -= extra
+        return header + '\n' + '\n'.join(lines)
+
+    # nem a forma resumida cabe: só nome:dtype, na ordem original
+    prefix = 'Colunas (nome:dtype): '
+    names = [f"{c['coluna']}:{c['dtype']}" for c in cols]
+    omitted_note = '\n… +{} colunas omitidas (use df.columns para listar todas).'
+    room = budget - len(prefix) - len(omitted_note) - 6
+    kept, used = [], 0
+    for name in names:
+        if used + len(name) + 2 > room:
+            break
+        kept.append(name)
+        used += len(name) + 2
+    body = prefix + ', '.join(kept)
+    if len(kept) < len(names):
+        body += omitted_note.format(len(names) - len(kept))
+    return header + '\n' + body
@@ -0,0 +1,140 @@
+# result_store.py
+"""
+Saídas das análises (stdout + ops gravados pelo _Recorder) guardadas por id para
+reprodução no histórico do chat sem nova chamada ao LLM nem nova execução.
+
+Também serve de memo de execução: com exec_key(código, hash do dataset) como id,
+o mesmo código sobre os mesmos dados não é executado de novo.
+
+O JSON das figuras Plotly é comprimido com zlib (PNGs já vêm comprimidos) e o
+total é limitado em bytes, com descarte LRU.
+"""
+
+import os
+import ast
+import zlib
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('EDA_RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# ================= Chave de execução =================
+def normalize_code(code: str) -> str:
+    """Forma canônica do código (AST, sem comentários nem formatação); o próprio texto se não compilar."""
+    try:
+        return ast.dump(ast.parse(code))
+    except SyntaxError:
+        return code.strip()
+
+def exec_key(code: str, dataset_key: str) -> str:
+    """Id do resultado de executar `code` sobre o dataset de hash `dataset_key`."""
+    payload = f'{dataset_key}\n{normalize_code(code)}'
+    return 'exec-' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def extract_insights(stdout: str) -> list:
+    """Textos das linhas 'INSIGHT: ...' impressas pela análise."""
+    insights = []
+    for line in stdout.splitlines():
+        line = line.strip()
+        if 'INSIGHT:' in line.upper() and ':' in line:
+            insight = line.split(':', 1)[1].strip()
+            if insight:
+                insights.append(insight)
+    return insights
+
+# ================= Armazenamento =================
+def _pack_op(op: dict) -> dict:
+    if op.get('kind') == 'plotly' and isinstance(op.get('json'), str):
+        return {**op, 'json': zlib.compress(op['json'].encode('utf-8'), 6), 'zlib': True}
+    return op
+
+def _unpack_op(op: dict) -> dict:
+    if op.get('zlib'):
+        op = {k: v for k, v in op.items() if k != 'zlib'}
+        op['json'] = zlib.decompress(op['json']).decode('utf-8')
+    return op
+
+def _value_bytes(value) -> int:
+    """Memória ocupada por um argumento de op 'call' (DataFrame/Series/ndarray guardados inteiros)."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_value_bytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_value_bytes(v) for v in value.values())
+    return len(repr(value))
+
+def _op_bytes(op: dict) -> int:
+    kind = op.get('kind')
+    if kind == 'plotly':
+        return len(op['json'])
+    if kind == 'image':
+        return len(op['png'])
+    if kind == 'call':
+        return len(op.get('name', '')) + _value_bytes(op.get('args', ())) + _value_bytes(op.get('kwargs', {}))
+    return len(repr(op))
+
+class ResultStore:
+    """LRU de resultados de análise limitado por bytes; seguro entre threads (compartilhado entre sessões)."""
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+
+    def put(self, stdout: str, ops: list, key: str | None = None) -> str | None:
+        """
+        Guarda o resultado (com os INSIGHTs extraídos) e devolve seu id: `key` quando dada
+        (ex.: exec_key), senão um id novo. None se sozinho ele já excede o limite.
+        """
+        packed = [_pack_op(op) for op in ops]
+        size = len(stdout.encode('utf-8')) + sum(_op_bytes(op) for op in packed)
+        if size > self.max_bytes:
+            return None
+        result_id = key or uuid.uuid4().hex
+        entry = {'stdout': stdout, 'ops': packed, 'insights': extract_insights(stdout), 'size': size}
+        with self._lock:
+            old = self._items.pop(result_id, None)
+            if old is not None:
+                self._bytes -= old['size']
+            self._items[result_id] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= evicted['size']
+        return result_id
+
+    def has(self, result_id: str) -> bool:
+        with self._lock:
+            return result_id in self._items
+
+    def get(self, result_id: str):
+        """
+        dict com stdout, ops (prontos para render_outputs) e insights,
+        ou None se o resultado foi descartado.
+        """
+        with self._lock:
+            entry = self._items.get(result_id)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._items.move_to_end(result_id)
+            self._stats['hits'] += 1
+        return {'stdout': entry['stdout'], 'ops': [_unpack_op(op) for op in entry['ops']],
+                'insights': list(entry['insights'])}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._items), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    **self._stats}
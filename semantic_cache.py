@@ -0,0 +1,283 @@
+# semantic_cache.py
+"""
+Cache semântico de prompts: reaproveita o código gerado para uma pergunta
+parecida sobre o mesmo esquema ("histograma de Amount", "distribuição do Amount",
+"plot hist amount"), sem chamada ao LLM.
+
+Cada prompt vira um vetor TF-IDF de termos: palavras normalizadas (sem acento),
+sinônimos de operações de EDA levados a um conceito canônico e verbos genéricos
+descartados. As colunas citadas, os números e as negações não entram no vetor,
+mas precisam coincidir exatamente ("média de Amount" nunca reaproveita "média de
+Time", nem "top 5" reaproveita "top 10"). O mesmo vale para as palavras de conteúdo
+fora do vocabulário de conceitos, que costumam ser valores ou filtros ("transações
+fraudulentas" nunca reaproveita "transações legítimas"): só os conceitos de EDA
+admitem sinônimos. Acima do limiar de similaridade do cosseno, o código da
+pergunta anterior é reutilizado; abaixo, segue para o LLM.
+
+O índice é separado por esquema (chave make_key com prompt vazio) e fica no mesmo
+SQLite do cache de código; ele guarda só a chave exata, então o código continua
+sujeito ao TTL e à poda do CodeCache.
+"""
+
+import os
+import re
+import math
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from collections import Counter, OrderedDict
+
+from code_cache import CACHE_PATH
+from intent_model import normalize
+
+SEMANTIC_THRESHOLD = float(os.environ.get('EDA_SEMANTIC_THRESHOLD', 0.8))  # similaridade do cosseno
+SEMANTIC_MAX_ENTRIES = 500   # prompts indexados por esquema
+SEMANTIC_MAX_SCHEMAS = 32    # esquemas mantidos em memória
+
+# ================= Termos =================
+CONCEPTS = {
+    'hist': ('histograma', 'histogram', 'hist', 'distribuicao', 'distribution', 'distribuicoes'),
+    'density': ('densidade', 'density', 'kde'),
+    'corr': ('correlacao', 'correlacoes', 'correlation', 'correlations', 'corr', 'correlacionadas'),
+    'heatmap': ('heatmap', 'mapa', 'calor'),
+    'mean': ('media', 'medias', 'average', 'mean', 'avg', 'medio'),
+    'median': ('mediana', 'median'),
+    'mode': ('moda', 'mode'),
+    'std': ('desvio', 'std', 'variancia', 'variance', 'padrao'),
+    'scatter': ('dispersao', 'scatter', 'scatterplot'),
+    'box': ('boxplot', 'boxplots', 'box', 'caixa'),
+    'bar': ('barras', 'barra', 'bar', 'bars', 'barplot'),
+    'pie': ('pizza', 'pie', 'setores'),
+    'trend': ('tendencia', 'trend', 'temporal', 'serie', 'series', 'evolucao', 'timeline'),
+    'count': ('contagem', 'conte', 'contar', 'count', 'counts', 'quantos', 'quantas', 'quantidade',
+              'frequencia', 'frequencias', 'frequency', 'frequentes', 'frequent'),
+    'null': ('nulos', 'nulo', 'null', 'nulls', 'faltantes', 'missing', 'ausentes', 'nan', 'vazios'),
+    'outlier': ('outliers', 'outlier', 'atipicos', 'anomalias', 'anomalies'),
+    'top': ('top', 'maiores', 'ranking', 'largest', 'biggest', 'principais'),
+    'bottom': ('menores', 'smallest', 'bottom'),
+    'describe': ('describe', 'resumo', 'summary', 'estatisticas', 'descritiva', 'descritivas', 'statistics'),
+    'sum': ('soma', 'total', 'sum', 'somatorio'),
+    'min': ('minimo', 'min', 'minimum'),
+    'max': ('maximo', 'max', 'maximum'),
+    'unique': ('unicos', 'distintos', 'unique', 'distinct'),
+    'group': ('por', 'per', 'by', 'agrupado', 'agrupe', 'group', 'groupby', 'cada', 'each'),
+    'compare': ('compare', 'comparar', 'comparacao', 'versus', 'vs'),
+    'percent': ('percentual', 'porcentagem', 'proporcao', 'percent', 'percentage', 'proportion'),
+}
+_CONCEPT_OF = {word: concept for concept, words in CONCEPTS.items() for word in words}
+
+STOPWORDS = frozenset((
+    'a', 'o', 'as', 'os', 'um', 'uma', 'de', 'do', 'da', 'dos', 'das', 'e', 'em', 'no', 'na',
+    'nos', 'nas', 'para', 'pra', 'com', 'me', 'favor', 'qual', 'quais', 'que',
+    'the', 'of', 'for', 'in', 'on', 'and', 'to', 'an', 'is', 'are', 'what', 'please',
+    'plot', 'plote', 'plotar', 'grafico', 'graficos', 'graph', 'chart', 'mostre', 'mostrar',
+    'show', 'faca', 'faz', 'fazer', 'gere', 'gerar', 'crie', 'criar', 'exiba', 'exibir',
+    'desenhe', 'make', 'create', 'draw', 'display', 'ver', 'veja', 'calcule', 'calcular',
+    'compute', 'calculate', 'analise', 'analisar', 'analyze', 'coluna', 'colunas', 'column',
+    'columns', 'variavel', 'variaveis', 'variable', 'dataset', 'dados', 'data', 'df', 'tabela',
+    'entre', 'between', 'quero', 'gostaria', 'visualize', 'visualizar', 'como', 'sobre',
+    'how', 'about', 'give', 'get', 'list', 'liste', 'listar',
+))
+NEGATIONS = frozenset(('nao', 'sem', 'exceto', 'excluindo', 'not', 'without', 'except', 'excluding'))
+
+_WORD = re.compile(r'[a-z0-9_]+')
+
+def _column_pattern(columns):
+    names = sorted({normalize(str(c)) for c in columns if str(c).strip()}, key=len, reverse=True)
+    if not names:
+        return None, {}
+    by_norm = {normalize(str(c)): str(c) for c in columns}
+    alternation = '|'.join(re.escape(n) for n in names)
+    return re.compile(rf'(?<![a-z0-9_])({alternation})(?![a-z0-9_])'), by_norm
+
+def prompt_features(prompt: str, columns=()) -> dict:
+    """
+    Termos do prompt: `terms` (Counter de conceitos/palavras para o TF-IDF) e as
+    restrições exatas `columns`, `numbers`, `negations` e `words` (palavras fora dos
+    conceitos), como frozensets.
+    """
+    text = normalize(prompt)
+    pattern, by_norm = _column_pattern(columns)
+    mentioned = set()
+    if pattern is not None:
+        mentioned = {by_norm[m] for m in pattern.findall(text)}
+        text = pattern.sub(' ', text)
+
+    terms, numbers, negations, words = Counter(), set(), set(), set()
+    for word in _WORD.findall(text):
+        if word.isdigit():
+            numbers.add(word)
+        elif word in NEGATIONS:
+            negations.add(word)
+        elif word in _CONCEPT_OF:
+            terms['#' + _CONCEPT_OF[word]] += 1
+        elif word not in STOPWORDS and len(word) > 1:
+            # plural simples: "categorias" ~ "categoria"
+            word = word[:-1] if len(word) > 3 and word.endswith('s') else word
+            terms[word] += 1
+            words.add(word)
+    return {'terms': terms, 'columns': frozenset(mentioned), 'numbers': frozenset(numbers),
+            'negations': frozenset(negations), 'words': frozenset(words)}
+
+def _tfidf(terms: Counter, idf: dict) -> dict:
+    vec = {t: (1 + math.log(k)) * idf.get(t, 1.0) for t, k in terms.items()}
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {t: v / norm for t, v in vec.items()}
+
+# ================= Índice =================
+class SemanticIndex:
+    """
+    Prompts já respondidos por esquema -> chave exata do código no CodeCache.
+    Seguro entre threads; persistido na tabela semantic_prompts do SQLite do cache.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, threshold: float = SEMANTIC_THRESHOLD,
+                 max_entries: int = SEMANTIC_MAX_ENTRIES):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._schemas = OrderedDict()  # schema_key -> {prompt: entrada}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'saved_s': 0.0}
+        self._disk_ok = self._init_db()
+
+    # -------- SQLite --------
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _init_db(self) -> bool:
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with closing(self._connect()) as con, con:
+                con.execute(
+                    'CREATE TABLE IF NOT EXISTS semantic_prompts ('
+                    ' schema_key TEXT NOT NULL, prompt TEXT NOT NULL, code_key TEXT NOT NULL,'
+                    ' gen_seconds REAL NOT NULL, created REAL NOT NULL,'
+                    ' PRIMARY KEY (schema_key, prompt))'
+                )
+            return True
+        except Exception:
+            return False
+
+    def _entries(self, schema_key: str, columns) -> dict:
+        """Entradas do esquema (carregadas do disco na primeira consulta). Chamar com o lock."""
+        entries = self._schemas.get(schema_key)
+        if entries is None:
+            entries = OrderedDict()
+            if self._disk_ok:
+                try:
+                    with closing(self._connect()) as con, con:
+                        rows = con.execute(
+                            'SELECT prompt, code_key, gen_seconds FROM semantic_prompts '
+                            'WHERE schema_key = ? ORDER BY created DESC LIMIT ?',
+                            (schema_key, self.max_entries),
+                        ).fetchall()
+                except Exception:
+                    rows = []
+                for prompt, code_key, gen_seconds in reversed(rows):
+                    entries[prompt] = {'code_key': code_key, 'gen_seconds': gen_seconds,
+                                       'features': prompt_features(prompt, columns)}
+            self._schemas[schema_key] = entries
+            while len(self._schemas) > SEMANTIC_MAX_SCHEMAS:
+                self._schemas.popitem(last=False)
+        self._schemas.move_to_end(schema_key)
+        return entries
+
+    # -------- API --------
+    def lookup(self, schema_key: str, prompt: str, columns=()):
+        """
+        Prompt indexado mais parecido com `prompt` no mesmo esquema, se a similaridade
+        atingir o limiar e as restrições exatas coincidirem: dict com prompt, code_key,
+        similarity e gen_seconds. None caso contrário.
+        """
+        query = prompt_features(prompt, columns)
+        with self._lock:
+            entries = list(self._entries(schema_key, columns).items())
+        best, best_sim = None, 0.0
+        if query['terms'] and entries:
+            n = len(entries) + 1
+            df_counts = Counter(query['terms'].keys())
+            for _, entry in entries:
+                df_counts.update(entry['features']['terms'].keys())
+            idf = {t: math.log((1 + n) / (1 + k)) + 1 for t, k in df_counts.items()}
+            q_vec = _tfidf(query['terms'], idf)
+            for text, entry in entries:
+                f = entry['features']
+                if (f['columns'], f['numbers'], f['negations'], f['words']) != \
+                        (query['columns'], query['numbers'], query['negations'], query['words']):
+                    continue
+                vec = _tfidf(f['terms'], idf)
+                sim = sum(v * vec.get(t, 0.0) for t, v in q_vec.items())
+                if sim > best_sim:
+                    best, best_sim = (text, entry), sim
+        if best is None or best_sim < self.threshold:
+            return None
+        text, entry = best
+        return {'prompt': text, 'code_key': entry['code_key'], 'similarity': round(best_sim, 4),
+                'gen_seconds': entry['gen_seconds']}
+
+    def record(self, match: dict | None):
+        """Conta a consulta: acerto quando o código do `match` foi reaproveitado, senão falha."""
+        with self._lock:
+            if match is None:
+                self._stats['misses'] += 1
+            else:
+                self._stats['hits'] += 1
+                self._stats['saved_s'] += match['gen_seconds']
+
+    def add(self, schema_key: str, prompt: str, code_key: str, gen_seconds: float, columns=()):
+        """Indexa o prompt respondido pelo LLM; gen_seconds é a latência que um acerto economiza."""
+        now = time.time()
+        entry = {'code_key': code_key, 'gen_seconds': gen_seconds,
+                 'features': prompt_features(prompt, columns)}
+        with self._lock:
+            entries = self._entries(schema_key, columns)
+            entries.pop(prompt, None)
+            entries[prompt] = entry
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._stats['stores'] += 1
+        if not self._disk_ok:
+            return
+        try:
+            with closing(self._connect()) as con, con:
+                con.execute(
+                    'INSERT OR REPLACE INTO semantic_prompts '
+                    '(schema_key, prompt, code_key, gen_seconds, created) VALUES (?, ?, ?, ?, ?)',
+                    (schema_key, prompt, code_key, gen_seconds, now),
+                )
+        except Exception:
+            pass
+
+    def forget(self, code_key: str):
+        """Remove os prompts que apontam para `code_key` (código que falhou na execução)."""
+        with self._lock:
+            for entries in self._schemas.values():
+                for prompt in [p for p, e in entries.items() if e['code_key'] == code_key]:
+                    del entries[prompt]
+        if not self._disk_ok:
+            return
+        try:
+            with closing(self._connect()) as con, con:
+                con.execute('DELETE FROM semantic_prompts WHERE code_key = ?', (code_key,))
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        lookups = out['hits'] + out['misses']
+        out['hit_rate'] = round(out['hits'] / lookups, 4) if lookups else 0.0
+        out['saved_s'] = round(out['saved_s'], 3)
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._schemas.clear()
+        if self._disk_ok:
+            try:
+                with closing(self._connect()) as con, con:
+                    con.execute('DELETE FROM semantic_prompts')
+            except Exception:
+                pass
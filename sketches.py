@@ -0,0 +1,401 @@
+# sketches.py
+"""
+Estatísticas aproximadas em uma passada, atualizáveis por chunk e mescláveis:
+
+- distintos: HyperLogLog (2^14 registradores, erro típico ~0,8%);
+- quantis: t-digest (merging digest, centróides mais finos nas caudas);
+- mais frequentes: Count-Min com correção de ruído (count-mean-min) + candidatos de cada chunk.
+
+Tudo em numpy vetorizado, sem dependências extras. Um hash de 64 bits por valor
+(pd.util.hash_array) alimenta os três. O DatasetSketch é construído durante a
+leitura do CSV (ingest.read_csv_optimized) ou, para datasets vindos do cache, em
+chunks do próprio df; o código gerado o recebe como `sketch` (SketchView), que
+também sabe responder de forma exata quando a precisão importa.
+"""
+
+import pickle
+import numpy as np
+import pandas as pd
+
+HLL_P = 14
+TDIGEST_DELTA = 200
+CM_WIDTH = 1 << 14
+CM_DEPTH = 4
+TOP_CANDIDATES = 64
+CANDIDATE_SAMPLE = 16_384     # valores por chunk examinados para achar candidatos a frequentes
+SKETCH_CHUNK_ROWS = 1_000_000  # ao construir a partir de um df já carregado
+
+_U64 = np.uint64
+_CM_MULT = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93], dtype=_U64)
+_CM_ADD = np.array([0x27D4EB2F165667C5, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9, 0x2545F4914F6CDD1D], dtype=_U64)
+
+# ================= Hash =================
+def _kind(s: pd.Series) -> str:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return 'datetime'
+    if pd.api.types.is_numeric_dtype(s):
+        return 'numeric'
+    return 'text'
+
+def _as_values(s: pd.Series, kind: str) -> np.ndarray:
+    """Valores não nulos numa representação estável entre chunks (ex.: float32 e int8 viram float64)."""
+    if kind == 'datetime':
+        return s.to_numpy(dtype='datetime64[ns]').view('int64').astype('float64')
+    return s.to_numpy(dtype='float64', na_value=np.nan)
+
+def hash_values(values: np.ndarray) -> np.ndarray:
+    return pd.util.hash_array(values, categorize=False).astype(_U64, copy=False)
+
+def _hash_text(s: pd.Series):
+    """(hashes, códigos, distintos) de texto não nulo: só os distintos são convertidos e hasheados."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes, uniques = s.cat.codes.to_numpy(), s.cat.categories
+    else:
+        codes, uniques = pd.factorize(s)
+    uniques = np.asarray(uniques.astype(str), dtype=object)
+    return hash_values(uniques)[codes], codes, uniques
+
+# ================= HyperLogLog =================
+class HyperLogLog:
+    def __init__(self, p: int = HLL_P):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, hashes: np.ndarray):
+        if not len(hashes):
+            return
+        bits = 64 - self.p
+        idx = (hashes >> _U64(bits)).astype(np.int64)
+        rest = hashes & _U64((1 << bits) - 1)
+        # comprimento em bits exato: rest < 2^50 cabe na mantissa do float64
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other: 'HyperLogLog'):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # contagem linear: exata na prática para poucos distintos
+        return int(round(estimate))
+
+# ================= t-digest =================
+class TDigest:
+    def __init__(self, delta: int = TDIGEST_DELTA):
+        self.delta = delta
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def n(self) -> float:
+        return float(self.weights.sum())
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        mid = (np.cumsum(weights) - weights / 2) / total
+        # função de escala k1: centróides estreitos perto de q=0 e q=1
+        k = np.floor(self.delta / (2 * np.pi) * np.arcsin(np.clip(2 * mid - 1, -1, 1)))
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(k)) + 1))
+        w = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / w
+        self.weights = w
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(np.concatenate((self.means, values)),
+                       np.concatenate((self.weights, np.ones(len(values)))))
+
+    def merge(self, other: 'TDigest'):
+        if not len(other.weights):
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate((self.means, other.means)),
+                       np.concatenate((self.weights, other.weights)))
+
+    def quantile(self, q):
+        if not len(self.weights):
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate(([0.0], centers, [total]))
+        ys = np.concatenate(([self.min], self.means, [self.max]))
+        return np.interp(np.asarray(q, dtype=float) * total, xs, ys)
+
+# ================= Count-Min + candidatos =================
+class CountMinTopK:
+    def __init__(self, width: int = CM_WIDTH, depth: int = CM_DEPTH, k: int = TOP_CANDIDATES):
+        self.width = width
+        self.depth = depth
+        self.k = k
+        self.table = np.zeros((depth, width), dtype=np.int32)
+        self.total = 0
+        self.candidates = {}  # valor -> hash
+
+    def _rows(self, hashes: np.ndarray):
+        shift = _U64(64 - int(np.log2(self.width)))
+        for d in range(self.depth):
+            yield d, ((hashes * _CM_MULT[d] + _CM_ADD[d]) >> shift).astype(np.int64)
+
+    def update(self, values, hashes: np.ndarray):
+        """values: valores alinhados aos hashes (só os candidatos são lidos, via values[i])."""
+        if not len(hashes):
+            return
+        self.total += len(hashes)
+        for d, idx in self._rows(hashes):
+            self.table[d] += np.bincount(idx, minlength=self.width).astype(np.int32)
+        # candidatos: os mais frequentes numa amostra espaçada do chunk; as contagens vêm do Count-Min
+        step = max(1, len(hashes) // CANDIDATE_SAMPLE)
+        uniq, first, counts = np.unique(hashes[::step], return_index=True, return_counts=True)
+        top = np.argsort(counts, kind='stable')[::-1][:self.k]
+        for i in top:
+            self.candidates.setdefault(values[first[i] * step], uniq[i])
+        self._prune()
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Count-mean-min: desconta de cada linha o ruído esperado das colisões e fica com a
+        mediana, limitada pelo mínimo do Count-Min (que nunca subconta).
+        """
+        counts = np.array([self.table[d, idx] for d, idx in self._rows(hashes)], dtype=np.float64)
+        noise = (self.total - counts) / (self.width - 1)
+        est = np.median(counts - noise, axis=0)
+        return np.clip(np.round(est), 0, counts.min(axis=0)).astype(np.int64)
+
+    def _prune(self):
+        if len(self.candidates) <= 4 * self.k:
+            return
+        keep = self.top(2 * self.k)
+        self.candidates = {v: self.candidates[v] for v, _ in keep}
+
+    def merge(self, other: 'CountMinTopK'):
+        self.table += other.table
+        self.total += other.total
+        for v, h in other.candidates.items():
+            self.candidates.setdefault(v, h)
+        self._prune()
+
+    def top(self, k: int = 10) -> list:
+        """[(valor, contagem estimada)] em ordem decrescente."""
+        if not self.candidates:
+            return []
+        values = list(self.candidates)
+        est = self.estimate(np.array([self.candidates[v] for v in values], dtype=_U64))
+        order = np.argsort(est, kind='stable')[::-1][:k]
+        return [(values[i], int(est[i])) for i in order]
+
+# ================= Por coluna / dataset =================
+class _Take:
+    """values[i] = uniques[codes[i]], sem materializar o array de valores do chunk."""
+
+    def __init__(self, codes, uniques):
+        self._codes = codes
+        self._uniques = uniques
+
+    def __getitem__(self, i):
+        return self._uniques[self._codes[i]]
+
+class ColumnSketch:
+    def __init__(self, kind: str, integer: bool = False, boolean: bool = False):
+        self.kind = kind
+        self.integer = integer  # valores frequentes voltam como int
+        self.boolean = boolean  # ... ou como bool (colunas booleanas são sketchadas como 0/1)
+        self.n = 0
+        self.n_null = 0
+        self.hll = HyperLogLog()
+        self.digest = TDigest() if kind in ('numeric', 'datetime') else None
+        self.freq = CountMinTopK()
+
+    def update(self, s: pd.Series):
+        self.n += len(s)
+        valid = s.dropna()
+        self.n_null += len(s) - len(valid)
+        if self.kind == 'text':
+            hashes, codes, uniques = _hash_text(valid)
+            values = _Take(codes, uniques)
+        else:
+            values = _as_values(valid, self.kind)
+            hashes = hash_values(values)
+            self.digest.update(values)
+        self.hll.update(hashes)
+        self.freq.update(values, hashes)
+
+    def merge(self, other: 'ColumnSketch'):
+        self.n += other.n
+        self.n_null += other.n_null
+        self.hll.merge(other.hll)
+        self.freq.merge(other.freq)
+        if self.digest is not None and other.digest is not None:
+            self.digest.merge(other.digest)
+
+    def nunique(self) -> int:
+        """Estimativa do HLL, limitada ao número de valores não nulos vistos."""
+        return min(self.hll.count(), self.n - self.n_null)
+
+    def _out(self, v):
+        """Valor observado (mínimo, máximo, mais frequente) no tipo da coluna."""
+        if self.kind == 'datetime':
+            return pd.Timestamp(int(v))
+        if getattr(self, 'boolean', False):  # sketches gravados antes do atributo existir
+            return bool(v)
+        if self.integer:
+            return int(v)
+        return v
+
+    def _quantile_out(self, v):
+        """Quantis são interpolados: float mesmo em colunas inteiras (a mediana de 37 e 38 é 37.5)."""
+        return pd.Timestamp(int(v)) if self.kind == 'datetime' else float(v)
+
+    @classmethod
+    def for_series(cls, s: pd.Series) -> 'ColumnSketch':
+        return cls(_kind(s), pd.api.types.is_integer_dtype(s), pd.api.types.is_bool_dtype(s))
+
+class DatasetSketch:
+    """Sketches de todas as colunas; update por chunk, merge entre sketches parciais."""
+
+    def __init__(self):
+        self.n_rows = 0
+        self.columns = {}
+        self.partial = set()  # colunas com chunks de outro tipo que ficaram de fora
+
+    def is_partial(self, col) -> bool:
+        return col in getattr(self, 'partial', ())  # sketches gravados antes do atributo existir
+
+    def update(self, chunk: pd.DataFrame):
+        self.n_rows += len(chunk)
+        for col in chunk.columns:
+            s = chunk[col]
+            sk = self.columns.get(col)
+            if sk is None:
+                sk = self.columns[col] = ColumnSketch.for_series(s)
+            elif _kind(s) != sk.kind:
+                # tipo mudou entre chunks (engine C): mantém o primeiro e marca a coluna como parcial
+                self.partial.add(col)
+                continue
+            sk.update(s)
+        return self
+
+    def merge(self, other: 'DatasetSketch'):
+        self.n_rows += other.n_rows
+        self.partial = getattr(self, 'partial', set()) | getattr(other, 'partial', set())
+        for col, sk in other.columns.items():
+            if col not in self.columns:
+                self.columns[col] = sk
+            elif self.columns[col].kind == sk.kind:
+                self.columns[col].merge(sk)
+            else:
+                self.partial.add(col)
+        return self
+
+    def refresh(self, df: pd.DataFrame, columns) -> 'DatasetSketch':
+        """Refaz os sketches de `columns` a partir do df (ex.: texto convertido em data depois da leitura)."""
+        self.partial = getattr(self, 'partial', set()) - set(columns)
+        for col in columns:
+            sk = self.columns[col] = ColumnSketch.for_series(df[col])
+            for start in range(0, len(df), SKETCH_CHUNK_ROWS):
+                sk.update(df[col].iloc[start:start + SKETCH_CHUNK_ROWS])
+        return self
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, chunk_rows: int = SKETCH_CHUNK_ROWS) -> 'DatasetSketch':
+        sketch = cls()
+        for start in range(0, len(df), chunk_rows):
+            sketch.update(df.iloc[start:start + chunk_rows])
+        return sketch
+
+    # -------- consultas --------
+    def _col(self, col) -> ColumnSketch:
+        try:
+            return self.columns[col]
+        except KeyError:
+            raise KeyError(f'coluna sem sketch: {col!r}') from None
+
+    def nunique(self, col) -> int:
+        return self._col(col).nunique()
+
+    def quantile(self, col, q=0.5):
+        sk = self._col(col)
+        if sk.digest is None:
+            raise TypeError(f'quantis exigem coluna numérica ou de data: {col!r}')
+        out = sk.digest.quantile(q)
+        if np.ndim(out):
+            return pd.Series([sk._quantile_out(v) for v in out], index=list(q), name=col)
+        return sk._quantile_out(out)
+
+    def top(self, col, k: int = 10) -> pd.Series:
+        sk = self._col(col)
+        pairs = sk.freq.top(k)
+        return pd.Series([c for _, c in pairs], index=[sk._out(v) for v, _ in pairs], name=col, dtype='int64')
+
+    def to_bytes(self) -> bytes:
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'DatasetSketch':
+        return pickle.loads(data)
+
+# ================= Visão para o código gerado =================
+class SketchView:
+    """
+    Estatísticas rápidas para o código gerado: sketch.nunique(col), sketch.quantile(col, q),
+    sketch.top(col, k) e sketch.describe(). Aproximadas por padrão; exact=True (na chamada
+    ou na visão inteira) calcula sobre o df. Sem sketch disponível, ou em colunas que o
+    sketch só cobre em parte, responde exato.
+    """
+
+    def __init__(self, sketch: DatasetSketch | None, df: pd.DataFrame, exact: bool = False):
+        self._sketch = sketch
+        self._df = df
+        self.exact = exact
+
+    def _use_exact(self, col, exact) -> bool:
+        exact = self.exact if exact is None else exact
+        return (exact or self._sketch is None or col not in self._sketch.columns
+                or self._sketch.is_partial(col))
+
+    def nunique(self, col, exact: bool | None = None) -> int:
+        if self._use_exact(col, exact):
+            return int(self._df[col].nunique(dropna=True))
+        return self._sketch.nunique(col)
+
+    def quantile(self, col, q=0.5, exact: bool | None = None):
+        if self._use_exact(col, exact):
+            return self._df[col].quantile(q)
+        return self._sketch.quantile(col, q)
+
+    def top(self, col, k: int = 10, exact: bool | None = None) -> pd.Series:
+        if self._use_exact(col, exact):
+            return self._df[col].value_counts(dropna=True).head(k)
+        return self._sketch.top(col, k)
+
+    def describe(self, exact: bool | None = None) -> pd.DataFrame:
+        """Uma linha por coluna: distintos, p25/p50/p75/p99 (numéricas e datas) e valor mais frequente."""
+        rows = []
+        for col in self._df.columns:
+            row = {'coluna': col, 'distintos': self.nunique(col, exact)}
+            s = self._df[col]
+            if _kind(s) in ('numeric', 'datetime') and not pd.api.types.is_bool_dtype(s):
+                qs = self.quantile(col, [0.25, 0.5, 0.75, 0.99], exact)
+                row.update({f'p{int(q * 100)}': v for q, v in zip([0.25, 0.5, 0.75, 0.99], qs)})
+            top = self.top(col, 1, exact)
+            row['mais_frequente'] = top.index[0] if len(top) else None
+            row['freq'] = int(top.iloc[0]) if len(top) else 0
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def __repr__(self):
+        mode = 'exato' if self.exact or self._sketch is None else 'aproximado'
+        return f'<sketch {mode}: nunique(col), quantile(col, q), top(col, k), describe()>'
@@ -0,0 +1,224 @@
+# telemetry.py
+"""
+Instrumentação de latência por etapa.
+
+- span(nome, **attrs): mede uma etapa; o dict yieldado aceita atributos extras
+  (tokens, bytes, memória...). Entra no trace corrente e nas métricas agregadas.
+- trace(nome): agrupa os spans de uma requisição; ao final é gravado em JSONL.
+- prometheus_text(): métricas no formato de exposição do Prometheus; opcionalmente
+  servidas em http://0.0.0.0:EDA_METRICS_PORT/metrics (start_metrics_server).
+
+O trace corrente vive num ContextVar; para threads de pools use run_in_context().
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACE_PATH = os.environ.get('EDA_TRACE_PATH', os.path.join('.cache', 'traces.jsonl'))
+METRICS_PORT = int(os.environ.get('EDA_METRICS_PORT', 0))  # 0 = servidor desligado
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+WINDOW = 1000        # amostras recentes por etapa usadas nos percentis
+RECENT_TRACES = 50   # traces mantidos em memória para o painel
+COUNTER_ATTRS = ('tokens_prompt', 'tokens_completion', 'bytes_in', 'bytes_out')
+
+_current = contextvars.ContextVar('eda_trace', default=None)
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_recent = deque(maxlen=RECENT_TRACES)
+_server = None
+
+# ================= Agregação =================
+class _Stage:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.samples = deque(maxlen=WINDOW)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                self.buckets[i] += 1
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+def record(name: str, seconds: float, **attrs):
+    """Registra uma duração já medida (ex.: tempo até o primeiro token)."""
+    entry = {'name': name, 'seconds': round(seconds, 6), **attrs}
+    with _lock:
+        _stages.setdefault(name, _Stage()).observe(seconds)
+        for key in COUNTER_ATTRS:
+            value = attrs.get(key)
+            if isinstance(value, (int, float)):
+                _counters[(name, key)] = _counters.get((name, key), 0) + value
+    tr = _current.get()
+    if tr is not None:
+        tr.add(entry)
+    return entry
+
+# ================= Spans e traces =================
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """Mede o bloco; o dict yieldado pode receber atributos durante a execução."""
+    attrs = dict(attrs)
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs.setdefault('error', type(e).__name__)
+        raise
+    finally:
+        record(name, time.perf_counter() - t0, **attrs)
+
+class Trace:
+    def __init__(self, name: str, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs)
+        self.started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict):
+        with self._lock:
+            self.spans.append(entry)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {'trace_id': self.id, 'name': self.name, 'ts': self.started, **self.attrs, 'spans': spans}
+
+@contextlib.contextmanager
+def trace(name: str, **attrs):
+    """Agrupa os spans do bloco; no final, grava o trace no JSONL e no histórico recente."""
+    tr = Trace(name, **attrs)
+    token = _current.set(tr)
+    t0 = time.perf_counter()
+    try:
+        yield tr
+    finally:
+        _current.reset(token)
+        tr.attrs['seconds'] = round(time.perf_counter() - t0, 6)
+        record(name, tr.attrs['seconds'])
+        data = tr.to_dict()
+        with _lock:
+            _recent.append(data)
+        _append_jsonl(data)
+
+def current_trace():
+    return _current.get()
+
+def run_in_context(fn):
+    """Envolve fn para rodar com o contexto (trace corrente) de quem a submeteu a um pool."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+def _append_jsonl(data: dict):
+    try:
+        os.makedirs(os.path.dirname(TRACE_PATH) or '.', exist_ok=True)
+        with open(TRACE_PATH, 'a', encoding='utf-8') as fh:
+            fh.write(json.dumps(data, ensure_ascii=False, default=str) + '\n')
+    except Exception:
+        pass
+
+# ================= Consulta =================
+def summary() -> list:
+    """Por etapa: contagem, p50/p95/p99 (janela recente) e média, em segundos."""
+    with _lock:
+        items = [(name, st.count, st.total, sorted(st.samples)) for name, st in _stages.items()]
+    rows = []
+    for name, count, total, samples in sorted(items):
+        rows.append({
+            'etapa': name,
+            'n': count,
+            'p50_s': round(_percentile(samples, 0.50), 4),
+            'p95_s': round(_percentile(samples, 0.95), 4),
+            'p99_s': round(_percentile(samples, 0.99), 4),
+            'media_s': round(total / count, 4) if count else 0.0,
+        })
+    return rows
+
+def reset():
+    """Zera métricas agregadas, contadores e traces recentes (ex.: entre níveis de um teste de carga)."""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _recent.clear()
+
+def recent_traces() -> list:
+    with _lock:
+        return list(_recent)
+
+def prometheus_text() -> str:
+    """Métricas no formato texto do Prometheus (histograma por etapa + contadores)."""
+    lines = [
+        '# HELP eda_stage_seconds Duração das etapas do agente de EDA.',
+        '# TYPE eda_stage_seconds histogram',
+    ]
+    with _lock:
+        stages = {name: (list(st.buckets), st.count, st.total) for name, st in _stages.items()}
+        windows = {name: sorted(st.samples) for name, st in _stages.items()}
+        counters = dict(_counters)
+    for name, (buckets, count, total) in sorted(stages.items()):
+        label = name.replace('"', "'")
+        for le, n in zip(BUCKETS, buckets):
+            lines.append(f'eda_stage_seconds_bucket{{stage="{label}",le="{le}"}} {n}')
+        lines.append(f'eda_stage_seconds_bucket{{stage="{label}",le="+Inf"}} {count}')
+        lines.append(f'eda_stage_seconds_sum{{stage="{label}"}} {total:.6f}')
+        lines.append(f'eda_stage_seconds_count{{stage="{label}"}} {count}')
+    lines.append('# HELP eda_stage_quantile_seconds Percentis da janela recente (últimas amostras por etapa).')
+    lines.append('# TYPE eda_stage_quantile_seconds gauge')
+    for name, samples in sorted(windows.items()):
+        for q in (0.5, 0.95, 0.99):
+            lines.append(f'eda_stage_quantile_seconds{{stage="{name}",quantile="{q}"}} {_percentile(samples, q):.6f}')
+    if counters:
+        lines.append('# HELP eda_stage_units_total Tokens e bytes acumulados por etapa.')
+        lines.append('# TYPE eda_stage_units_total counter')
+        for (name, key), value in sorted(counters.items()):
+            lines.append(f'eda_stage_units_total{{stage="{name}",unit="{key}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+# ================= Servidor /metrics =================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """Sobe (uma vez por processo) o endpoint /metrics em uma thread daemon. port=0 não faz nada."""
+    global _server
+    if not port:
+        return None
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+            except OSError:
+                return None
+            threading.Thread(target=_server.serve_forever, name='eda-metrics', daemon=True).start()
+    return _server
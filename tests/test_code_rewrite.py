@@ -0,0 +1,72 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_rewrite import optimize_code
+
+
+def _frame():
+    return pd.DataFrame({
+        'a': np.array([100, 120, 100], dtype='int8'),
+        'b': np.array([2, 3, 2], dtype='int8'),
+        'n': np.array([1, 2, 3], dtype='int8'),
+        'c': pd.Categorical(['SP', 'RJ', 'SP']),
+        'f': np.array([1.5, 2.5, 3.5], dtype='float32'),
+        'd': ['2020-01-01', '2020-02-01', '2020-03-01'],
+    })
+
+
+def _run(code: str):
+    ns = {'df': _frame(), 'pd': pd, 'np': np}
+    exec(code, ns)
+    out = ns['out']
+    return out if isinstance(out, list) else out.tolist()
+
+
+@pytest.mark.parametrize('code', [
+    "out = df.apply(lambda r: r['a'] * r['b'], axis=1)",
+    "out = df['a'].apply(lambda v: v * 3)",
+    "out = df['n'].apply(lambda v: v - 200)",
+    "out = []\nfor v in df['a']:\n    out.append(v + 100)",
+    "out = [r.a * 2 for r in df.itertuples()]",
+    "out = df['c'].apply(lambda v: v + '-BR')",
+    "out = df.apply(lambda r: r['c'] + '-BR', axis=1)",
+    "out = df['f'].apply(lambda v: v / 3)",
+])
+def test_rewrite_keeps_results(code):
+    new_code, report = optimize_code(code, n_rows=3, dtypes=_frame().dtypes)
+    assert report['rewrites']
+    assert _run(new_code) == _run(code)
+
+
+def test_no_rewrite_without_dtypes():
+    code = "out = df['a'].apply(lambda v: v * 3)"
+    new_code, report = optimize_code(code, n_rows=3)
+    assert new_code == code and report['warnings']
+
+
+def test_no_rewrite_when_column_is_reassigned():
+    code = "df['a'] = df['a'].astype('int8')\nout = df['a'].apply(lambda v: v * 3)"
+    new_code, _ = optimize_code(code, n_rows=3, dtypes=_frame().dtypes)
+    assert 'apply' in new_code
+
+
+def test_to_datetime_not_hoisted_over_alias():
+    code = ("d2 = df\n"
+            "a = pd.to_datetime(df['d']).dt.year\n"
+            "d2['d'] = ['2021-01-01'] * 3\n"
+            "out = pd.to_datetime(df['d']).dt.year")
+    new_code, _ = optimize_code(code, n_rows=3, dtypes=_frame().dtypes)
+    assert _run(new_code) == _run(code) == [2021, 2021, 2021]
+
+
+def test_to_datetime_hoisted():
+    code = "a = pd.to_datetime(df['d']).dt.year\nout = pd.to_datetime(df['d']).dt.month"
+    new_code, report = optimize_code(code, n_rows=3, dtypes=_frame().dtypes)
+    assert new_code.count('pd.to_datetime') == 1 and report['rewrites']
+    assert _run(new_code) == _run(code)
@@ -0,0 +1,28 @@
+import io
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import read_csv_optimized
+
+
+def _csv(text: str):
+    return io.BytesIO(text.encode())
+
+
+def test_null_counts_match_read_csv():
+    text = 'a,b,n\nx,1,1.5\n,2,\nNA,3,2.5\nnull,,NaN\nN/A,5,3\ny,6,None\n'
+    expected = pd.read_csv(_csv(text)).isna().sum()
+    df, _ = read_csv_optimized(_csv(text), parse_dates=False)
+    assert df.isna().sum().to_dict() == expected.to_dict()
+
+
+def test_empty_string_is_not_a_category():
+    text = 'a,b\nx,1\n,2\nNA,3\nnull,4\nx,5\n'
+    df, _ = read_csv_optimized(_csv(text), parse_dates=False)
+    assert int(df['a'].isna().sum()) == int(pd.read_csv(_csv(text))['a'].isna().sum()) == 3
+    if isinstance(df['a'].dtype, pd.CategoricalDtype):
+        assert list(df['a'].cat.categories) == ['x']
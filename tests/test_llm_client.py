@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_client
+
+COMPLETION = {
+    'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': 0, 'model': 'stub',
+    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'ok'}, 'finish_reason': 'stop'}],
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            status, headers = server.script[min(server.requests, len(server.script) - 1)]
+            server.requests += 1
+        body = json.dumps(COMPLETION if status == 200 else {'error': {'message': 'stub'}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    """Servidor local que responde os status de server.script em ordem (o último se repete)."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.script = [(200, {})]
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Esperas pedidas pelo RetryTransport (sem dormir de fato)."""
+    delays = []
+    monkeypatch.setattr(llm_client, 'time', SimpleNamespace(sleep=delays.append))
+    return delays
+
+
+def _ask(server, max_retries: int = 3):
+    client = llm_client.make_client('test', base_url=f'http://127.0.0.1:{server.server_address[1]}/v1',
+                                    timeout=5, max_retries=max_retries)
+    try:
+        resp = client.chat.completions.create(model='stub', messages=[{'role': 'user', 'content': 'oi'}])
+        return resp.choices[0].message.content
+    finally:
+        client.close()
+
+
+def test_retries_429_and_503_then_succeeds(stub, sleeps):
+    stub.script = [(429, {'Retry-After': '0.25'}), (503, {}), (200, {})]
+    assert _ask(stub) == 'ok'
+    assert stub.requests == 3
+    assert sleeps[0] == 0.25  # Retry-After do servidor
+    assert 0 <= sleeps[1] <= llm_client.BACKOFF_BASE * 2  # full jitter sobre base*2^1
+
+
+def test_retry_after_ms_takes_precedence(stub, sleeps):
+    stub.script = [(429, {'retry-after-ms': '150', 'Retry-After': '3'}), (200, {})]
+    assert _ask(stub) == 'ok'
+    assert sleeps == [0.15]
+
+
+def test_gives_up_after_max_retries(stub, sleeps):
+    stub.script = [(503, {})]
+    with pytest.raises(openai.InternalServerError):
+        _ask(stub, max_retries=2)
+    assert stub.requests == 3
+    assert len(sleeps) == 2  # sem espera depois da última tentativa
+
+
+def test_no_retry_on_client_error_or_when_server_refuses(stub, sleeps):
+    stub.script = [(400, {})]
+    with pytest.raises(openai.BadRequestError):
+        _ask(stub)
+    stub.requests = 0
+    stub.script = [(503, {'x-should-retry': 'false'})]
+    with pytest.raises(openai.InternalServerError):
+        _ask(stub)
+    assert stub.requests == 1 and sleeps == []
+
+
+def test_backoff_delay_jitter_bounds():
+    delays = [llm_client.backoff_delay(3) for _ in range(200)]
+    assert all(0 <= d <= llm_client.BACKOFF_BASE * 2 ** 3 for d in delays)
+    assert len(set(delays)) > 1
+    assert all(llm_client.backoff_delay(10) <= llm_client.BACKOFF_MAX for _ in range(50))
+    # Retry-After fora do limite é ignorado em favor do jitter
+    assert llm_client.backoff_delay(0, retry_after=3600) <= llm_client.BACKOFF_BASE
@@ -0,0 +1,212 @@
+# timeseries.py
+"""
+Colunas de data preparadas uma única vez, na ingestão: texto com cara de data é
+convertido para datetime64 com o formato inferido de uma amostra (to_datetime com
+format explícito e cache de valores repetidos, em vez da inferência linha a linha
+que o código gerado faria a cada pergunta), o df fica ordenado pela coluna de data
+principal e são pré-calculados agregados diários e mensais dela (rollups).
+
+Os rollups cobrem o dataset completo e ficam disponíveis ao código gerado como
+rollups['D'] e rollups['M']: DataFrames indexados por 'periodo', com n_linhas e
+<coluna>_soma / <coluna>_media das primeiras colunas numéricas.
+"""
+
+import re
+import warnings
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# -------- pyarrow (opcional) --------
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+DATE_SAMPLE_ROWS = 1000
+DATE_MIN_PARSED = 0.95       # fração mínima dos valores não nulos que precisa virar data
+DATE_FORMAT_PROBES = 20      # valores distintos da amostra usados para sugerir formatos
+RAW_SUFFIX = '_texto'        # coluna com o texto original quando parte dos valores não vira data
+ROLLUP_FREQS = ('D', 'M')
+ROLLUP_MAX_COLUMNS = 20      # colunas numéricas agregadas nos rollups
+_DATE_LIKE = re.compile(r'\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|\d{4}-\d{2}')
+
+# ================= Detecção e conversão =================
+def _is_text(s: pd.Series) -> bool:
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return pd.api.types.is_string_dtype(s.cat.categories) or pd.api.types.is_object_dtype(s.cat.categories)
+    return pd.api.types.is_string_dtype(s) or pd.api.types.is_object_dtype(s)
+
+def _parsed_ratio(values: pd.Series, fmt: str) -> float:
+    parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+    return float(parsed.notna().mean()) if len(values) else 0.0
+
+def infer_date_format(s: pd.Series) -> str | None:
+    """
+    Formato strftime de uma coluna de texto com datas, inferido de uma amostra do
+    início da coluna; None se ela não parecer data. Os formatos candidatos vêm de
+    vários valores distintos da amostra (um valor atípico não invalida a coluna);
+    entre eles, inclusive dia/mês e mês/dia, vence o que converte mais valores
+    (empate: o sugerido por mais valores, depois dia primeiro).
+    """
+    if not _is_text(s):
+        return None
+    sample = s.iloc[:DATE_SAMPLE_ROWS * 5].dropna().astype(str).head(DATE_SAMPLE_ROWS)
+    if sample.empty or not sample.str.contains(_DATE_LIKE).mean() >= DATE_MIN_PARSED:
+        return None
+    distinct = sample.str.strip().drop_duplicates()
+    step = max(1, len(distinct) // DATE_FORMAT_PROBES)
+    votes = {}
+    with warnings.catch_warnings():
+        # aviso de formato incompatível com dayfirst: os dois são tentados de propósito
+        warnings.simplefilter('ignore', UserWarning)
+        for value in distinct.iloc[::step].head(DATE_FORMAT_PROBES):
+            for dayfirst in (True, False):
+                fmt = guess_datetime_format(value, dayfirst=dayfirst)
+                if fmt:
+                    votes[fmt] = votes.get(fmt, 0) + 1
+    best, best_ratio = None, 0.0
+    for fmt in sorted(votes, key=votes.get, reverse=True):
+        ratio = _parsed_ratio(sample, fmt)
+        if ratio > best_ratio:
+            best, best_ratio = fmt, ratio
+    return best if best_ratio >= DATE_MIN_PARSED else None
+
+def _to_datetime(values, fmt: str):
+    """
+    to_datetime com formato fixo; strptime do Arrow (vetorizado em C++) quando der.
+    O strptime do sistema aceita dias inexistentes (31/02 vira 03/03); como o resultado
+    desses cai nos dias 1 a 3, só esses valores são reconvertidos (e validados) pelo pandas.
+    """
+    if pc is not None and '%f' not in fmt and '%z' not in fmt:
+        try:
+            arr = pc.strptime(pa.array(values, type=pa.string()), format=fmt, unit='s', error_is_null=True)
+            out = pd.Series(arr.to_pandas(), index=getattr(values, 'index', None)).astype('datetime64[ns]')
+            recheck = (out.dt.day <= 3).to_numpy()
+            if recheck.any():
+                raw = pd.Series(values, index=out.index)[recheck].astype(str).str.strip()
+                out[recheck] = pd.to_datetime(raw, format=fmt, errors='coerce', cache=True)
+            return out
+        except Exception:
+            pass
+    return pd.to_datetime(values, format=fmt, errors='coerce', cache=True)
+
+def parse_dates(s: pd.Series, fmt: str) -> pd.Series | None:
+    """Converte com formato fixo (categorias: só os valores distintos); None se converter pouco."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        cats = pd.DatetimeIndex(_to_datetime(pd.Series(s.cat.categories.astype(str)), fmt))
+        parsed = pd.Series(cats.take(s.cat.codes.to_numpy(), allow_fill=True, fill_value=pd.NaT),
+                           index=s.index, name=s.name)
+    else:
+        parsed = _to_datetime(s, fmt).rename(s.name)
+    n_valid = int(s.notna().sum())
+    if n_valid and parsed.notna().sum() / n_valid < DATE_MIN_PARSED:
+        return None
+    return parsed
+
+def datetime_columns(df: pd.DataFrame) -> list:
+    return [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+
+def primary_datetime(df: pd.DataFrame):
+    """Coluna de data com menos nulos (a primeira, no empate), ou None."""
+    cols = datetime_columns(df)
+    if not cols:
+        return None
+    return min(cols, key=lambda c: int(df[c].isna().sum()))
+
+def is_sorted(s: pd.Series) -> bool:
+    """Crescente, com eventuais NaT só no final (como deixa sort_values(na_position='last'))."""
+    n_valid = int(s.notna().sum())
+    head = s.iloc[:n_valid]
+    return bool(head.notna().all() and head.is_monotonic_increasing)
+
+def prepare_datetimes(df: pd.DataFrame):
+    """
+    Converte as colunas de texto com datas, ordena o df pela coluna de data principal
+    (se ainda não estiver) e devolve (df, info) com info = {datetime_columns: [...],
+    parsed: [...], sorted_by: coluna ou None, parse_failures: {coluna: n},
+    raw_columns: {coluna: coluna com o texto}}.
+    Valores que não viram data ficam NaT; nesse caso o texto original é mantido em
+    <coluna>_texto, para que não se perca.
+    """
+    parsed, failures, raw_columns = [], {}, {}
+    for col in list(df.columns):
+        fmt = infer_date_format(df[col])
+        if fmt is None:
+            continue
+        values = parse_dates(df[col], fmt)
+        if values is None:
+            continue
+        n_failed = int((df[col].notna() & values.isna()).sum())
+        if n_failed:
+            raw = f'{col}{RAW_SUFFIX}'
+            while raw in df.columns:
+                raw += '_'
+            df.insert(df.columns.get_loc(col) + 1, raw, df[col])
+            failures[col] = n_failed
+            raw_columns[col] = raw
+        df[col] = values
+        parsed.append(col)
+
+    sorted_by = primary_datetime(df)
+    if sorted_by is not None:
+        if not is_sorted(df[sorted_by]):
+            df = df.sort_values(sorted_by, kind='stable', na_position='last', ignore_index=True)
+    return df, {'datetime_columns': datetime_columns(df), 'parsed': parsed, 'sorted_by': sorted_by,
+                'parse_failures': failures, 'raw_columns': raw_columns}
+
+# ================= Rollups =================
+def _period_start(key: pd.Series, freq: str) -> pd.Series:
+    if key.dt.tz is None and freq in ('D', 'M', 'Y'):
+        # truncamento vetorizado do numpy (bem mais rápido que to_period em dezenas de milhões de linhas)
+        values = key.to_numpy().astype(f'datetime64[{freq}]').astype('datetime64[ns]')
+        return pd.Series(values, index=key.index, name='periodo')
+    return key.dt.to_period(freq).dt.start_time.rename('periodo')
+
+def build_rollups(df: pd.DataFrame, col=None, freqs=ROLLUP_FREQS) -> dict:
+    """
+    Agregados por período da coluna de data `col` (padrão: a principal):
+    {freq: DataFrame indexado por 'periodo'}. Vazio se não houver coluna de data.
+    """
+    col = col if col is not None else primary_datetime(df)
+    if col is None:
+        return {}
+    numeric = [c for c in df.columns
+               if c != col and pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+    numeric = numeric[:ROLLUP_MAX_COLUMNS]
+    key = df[col]
+    out = {}
+    for freq in freqs:
+        periods = _period_start(key, freq)
+        grouped = df[numeric].groupby(periods, sort=True, observed=True)
+        parts = [grouped.size().rename('n_linhas')]
+        if numeric:
+            agg = grouped.agg(['sum', 'mean'])
+            agg.columns = [f"{c}_{'soma' if how == 'sum' else 'media'}" for c, how in agg.columns]
+            parts.append(agg)
+        out[freq] = pd.concat(parts, axis=1)
+    return out
+
+def rollups_to_frame(rollups: dict) -> pd.DataFrame:
+    """Rollups em formato longo (coluna 'freq'), para gravar num único arquivo."""
+    frames = [r.reset_index().assign(freq=freq) for freq, r in rollups.items()]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def rollups_from_frame(frame: pd.DataFrame) -> dict:
+    if frame is None or frame.empty or 'freq' not in frame.columns:
+        return {}
+    return {
+        freq: part.drop(columns='freq').set_index('periodo')
+        for freq, part in frame.groupby('freq', sort=False)
+    }
+
+def describe_rollups(rollups: dict) -> str:
+    """Linha para o prompt dizendo o que há em `rollups`."""
+    if not rollups:
+        return ''
+    names = {'D': 'diário', 'W': 'semanal', 'M': 'mensal', 'Y': 'anual'}
+    kinds = ', '.join(f"rollups['{f}'] ({names.get(f, f)}, {len(r):,} períodos)" for f, r in rollups.items())
+    cols = list(next(iter(rollups.values())).columns)
+    return (f"Agregados prontos do dataset completo: {kinds}; índice periodo, colunas "
+            f"{', '.join(cols[:8])}{' …' if len(cols) > 8 else ''}.")
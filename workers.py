@@ -0,0 +1,380 @@
+# workers.py
+"""
+Execução isolada do código gerado em processos pré-criados (forkserver com
+pandas, plotly, seaborn e matplotlib já importados).
+
+O dataset chega ao worker como caminho de um arquivo Feather/Arrow IPC (o mesmo
+do cache de datasets), aberto via memory-map: as páginas são compartilhadas entre
+processos sem cópia. Cada execução tem limite de tempo de parede e de RSS anônima;
+ao estourar, o worker é morto e substituído.
+
+Dentro do worker, `st` é um gravador: gráficos Plotly viram JSON, figuras
+Matplotlib viram PNG e demais chamadas são reproduzidas no processo do Streamlit
+por render_outputs().
+"""
+
+import io
+import os
+import sys
+import time
+import queue
+import types
+import pickle
+import threading
+import traceback
+import contextlib
+import multiprocessing as mp
+
+import telemetry
+from exec_capture import execution_scope
+
+EXEC_TIMEOUT = float(os.environ.get('EDA_EXEC_TIMEOUT', 60))
+EXEC_MAX_RSS_MB = int(os.environ.get('EDA_EXEC_MAX_RSS_MB', 4096))
+EXEC_WORKERS = int(os.environ.get('EDA_EXEC_WORKERS', max(1, min(4, (os.cpu_count() or 2) // 2))))
+PRELOAD = ['numpy', 'pandas', 'matplotlib.pyplot', 'plotly.express', 'seaborn', 'agent']
+POLL_INTERVAL = 0.1
+MAX_CACHED_FRAMES = 2  # datasets mantidos abertos por worker
+
+# ================= Lado do worker =================
+def _portable(obj):
+    """Mantém o objeto se ele puder ser serializado; senão, usa sua representação em texto."""
+    try:
+        pickle.dumps(obj)
+        return obj
+    except Exception:
+        return str(obj)
+
+class _Recorder:
+    """Substituto de `st` no worker: grava as chamadas para reprodução no processo do Streamlit."""
+
+    def __init__(self, ops: list):
+        self._ops = ops
+
+    def plotly_chart(self, fig, *args, **kwargs):
+        self._ops.append({'kind': 'plotly', 'json': fig.to_json(), 'kwargs': _portable(kwargs)})
+
+    def pyplot(self, fig=None, *args, **kwargs):
+        import matplotlib.pyplot as plt
+        fig = fig if fig is not None else plt.gcf()
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', bbox_inches='tight', dpi=110)
+        plt.close(fig)
+        self._ops.append({'kind': 'image', 'png': buf.getvalue()})
+
+    def columns(self, spec, *args, **kwargs):
+        n = spec if isinstance(spec, int) else len(spec)
+        return [_Recorder(self._ops) for _ in range(n)]
+
+    def tabs(self, labels, *args, **kwargs):
+        return [_Recorder(self._ops) for _ in labels]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self._ops.append({
+                'kind': 'call',
+                'name': name,
+                'args': tuple(_portable(a) for a in args),
+                'kwargs': {k: _portable(v) for k, v in kwargs.items()},
+            })
+            # containers de layout (expander, container, sidebar...) gravam no mesmo fluxo
+            return _Recorder(self._ops)
+        return call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+def _load_frame(path: str, frames: dict):
+    import pyarrow.feather as feather
+
+    df = frames.get(path)
+    if df is None:
+        df = feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+        if len(frames) >= MAX_CACHED_FRAMES:
+            frames.pop(next(iter(frames)))
+        frames[path] = df
+    return df
+
+def _load_engine(path: str, engines: dict):
+    from engine import DuckDBEngine
+
+    eng = engines.get(path)
+    if eng is None:
+        for old in engines.values():
+            old.close()
+        engines.clear()
+        eng = engines[path] = DuckDBEngine(path)
+    return eng
+
+def _reset_peak_rss():
+    """Zera o pico de RSS (VmHWM) do próprio processo; só no Linux."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+    except OSError:
+        pass
+
+def _peak_rss_mb() -> float | None:
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 2)
+    except OSError:
+        return None
+    return None
+
+def _load_rollups(path: str, rollups: dict) -> dict:
+    from dataset_cache import read_rollups
+
+    if path not in rollups:
+        if len(rollups) >= MAX_CACHED_FRAMES:
+            rollups.pop(next(iter(rollups)))
+        rollups[path] = read_rollups(path)
+    return rollups[path]
+
+def _load_sketch(path: str, sketches: dict):
+    from dataset_cache import read_sketch
+
+    if path not in sketches:
+        if len(sketches) >= MAX_CACHED_FRAMES:
+            sketches.pop(next(iter(sketches)))
+        sketches[path] = read_sketch(path)
+    return sketches[path]
+
+def _run_task(task: dict, frames: dict, engines: dict, rollups: dict, sketches: dict) -> dict:
+    from agent import make_exec_globals, snapshot, count_materialized
+    from sketches import SketchView
+
+    ops = []
+    stats = {}
+    stdout_buffer = io.StringIO()
+    error_text = ''
+    # figuras do pyplot fechadas ao fim de cada tarefa: o worker é reutilizado e não acumula memória
+    with execution_scope(stdout_buffer) as (_, figures):
+        try:
+            df = _load_frame(task['dataset'], frames)
+            sql = _load_engine(task['engine_path'], engines).sql if task.get('engine_path') else None
+            task_rollups = _load_rollups(task['rollups'], rollups) if task.get('rollups') else None
+            sketch = _load_sketch(task['sketch'], sketches) if task.get('sketch') else None
+            safe_globals = make_exec_globals(st_module=_Recorder(ops), sql=sql, rollups=task_rollups,
+                                             sketch=SketchView(sketch, df, exact=task.get('exact', False)))
+            # visão copy-on-write: mutações do código não alteram o frame em cache no worker
+            safe_locals = {'df': snapshot(df)}
+            _reset_peak_rss()
+            try:
+                exec(task['code'], safe_globals, safe_locals)
+            finally:
+                stats['peak_rss_mb'] = _peak_rss_mb()
+                stats['materialized_columns'] = count_materialized(df, safe_locals.get('df'))
+                stats['total_columns'] = df.shape[1]
+        except Exception:
+            error_text = traceback.format_exc()
+    stats['figures'] = figures.created
+    return {'stdout': stdout_buffer.getvalue(), 'error': error_text, 'ops': ops, 'stats': stats}
+
+def _worker_main(conn):
+    try:
+        import pandas as pd
+        pd.set_option('mode.copy_on_write', True)
+    except Exception:
+        pass
+    try:
+        # só o worker usa o backend sem janela; o processo do Streamlit fica como está
+        import matplotlib
+        matplotlib.use('Agg')
+    except Exception:
+        pass
+    frames, engines, rollups, sketches = {}, {}, {}, {}
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        try:
+            result = _run_task(task, frames, engines, rollups, sketches)
+        except BaseException:
+            result = {'stdout': '', 'error': traceback.format_exc(), 'ops': []}
+        conn.send(result)
+
+# ================= Lado do Streamlit =================
+def _anon_rss_mb(pid: int) -> float | None:
+    """RSS anônima (exclui páginas do dataset mapeado) via /proc; None fora do Linux."""
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            for line in fh:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) / 1024
+    except Exception:
+        return None
+    return None
+
+def _context():
+    if sys.platform.startswith('win'):
+        return mp.get_context('spawn')
+    ctx = mp.get_context('forkserver')
+    ctx.set_forkserver_preload(PRELOAD)
+    return ctx
+
+_main_lock = threading.Lock()
+
+@contextlib.contextmanager
+def _hidden_main():
+    """
+    Esconde o __main__ ao iniciar um worker. Sob o Streamlit, __main__ é o próprio
+    app.py: spawn/forkserver o reexecutariam no processo novo (que falha, ou roda o
+    app inteiro). O worker só precisa deste módulo.
+    """
+    with _main_lock:
+        main = sys.modules.get('__main__')
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        with _hidden_main():
+            self.proc.start()
+        child.close()
+
+    def alive(self) -> bool:
+        return self.proc.is_alive()
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.join(1)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+class WorkerPool:
+    """Pool de processos de execução com limites de tempo e memória por execução."""
+
+    def __init__(self, size: int = EXEC_WORKERS, timeout: float = EXEC_TIMEOUT,
+                 max_rss_mb: int = EXEC_MAX_RSS_MB):
+        self.size = size
+        self.timeout = timeout
+        self.max_rss_mb = max_rss_mb
+        self._ctx = _context()
+        self._idle = queue.Queue()
+        self._spawn_lock = threading.Lock()
+        self._missing = 0  # workers mortos cuja substituição falhou; recriados no próximo run
+        for _ in range(size):
+            self._idle.put(_Worker(self._ctx))
+
+    def _respawn(self, count: int = 0):
+        """Recria os workers que faltam (mais `count` novos); falhas ficam para a próxima tentativa."""
+        with self._spawn_lock:
+            self._missing += count
+            while self._missing:
+                try:
+                    worker = _Worker(self._ctx)
+                except Exception:
+                    return
+                self._missing -= 1
+                self._idle.put(worker)
+
+    def run(self, code: str, dataset_path: str, timeout: float | None = None, stats: dict | None = None,
+            engine_path: str | None = None, rollups_path: str | None = None, sketch_path: str | None = None,
+            exact_stats: bool = False):
+        """
+        Executa `code` em um worker livre, com df carregado de dataset_path
+        (e sql() sobre o Parquet em engine_path, no modo out-of-core; `rollups`
+        lidos de rollups_path, ver dataset_cache.store_rollups; `sketch` lido de
+        sketch_path, exato com exact_stats).
+        Retorna (stdout, error_text, ops); ops é reproduzido com render_outputs().
+        Se `stats` for passado, recebe as métricas da execução (ver agent.execute_code),
+        incluindo peak_rss_mb (pico de RSS do worker durante o exec, quando disponível).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with telemetry.span('exec.wait') as sp:
+            worker = None
+            while worker is None:
+                if self._missing:
+                    self._respawn()
+                try:
+                    worker = self._idle.get(timeout=1)
+                except queue.Empty:
+                    if self._missing >= self.size:
+                        sp['spawn_failed'] = True
+                        return '', 'Falha ao iniciar o processo de execução.', []
+            sp['idle_workers'] = self._idle.qsize()
+        healthy = False
+        with telemetry.span('exec', mode='worker') as sp:
+            try:
+                worker.conn.send({'code': code, 'dataset': dataset_path, 'engine_path': engine_path,
+                                  'rollups': rollups_path, 'sketch': sketch_path, 'exact': exact_stats})
+                start = time.monotonic()
+                while True:
+                    if worker.conn.poll(POLL_INTERVAL):
+                        result = worker.conn.recv()
+                        healthy = True
+                        result_stats = result.get('stats') or {}
+                        sp['peak_rss_mb'] = result_stats.get('peak_rss_mb')
+                        sp['ok'] = not result['error']
+                        if stats is not None:
+                            stats.update(result_stats)
+                        return result['stdout'], result['error'], result['ops']
+                    if time.monotonic() - start > timeout:
+                        sp['killed'] = 'timeout'
+                        return '', f'Execução interrompida: tempo limite de {timeout:.0f}s excedido.', []
+                    rss = _anon_rss_mb(worker.proc.pid)
+                    if rss is not None and rss > self.max_rss_mb:
+                        sp['killed'] = 'rss'
+                        return '', f'Execução interrompida: memória acima de {self.max_rss_mb} MB.', []
+                    if not worker.alive():
+                        sp['killed'] = 'crash'
+                        return '', 'Execução interrompida: o processo de execução terminou inesperadamente.', []
+            except (EOFError, OSError) as e:
+                return '', f'Falha de comunicação com o processo de execução: {e}', []
+            finally:
+                if healthy:
+                    self._idle.put(worker)
+                else:
+                    # se a substituição falhar, o pool não encolhe: ela é refeita no próximo run
+                    worker.kill()
+                    self._respawn(1)
+
+    def shutdown(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+            worker.kill()
+
+def render_outputs(ops: list):
+    """Reproduz no Streamlit as saídas gravadas pelo worker."""
+    import streamlit as st
+    import plotly.io as pio
+
+    for op in ops:
+        try:
+            if op['kind'] == 'plotly':
+                kwargs = op['kwargs'] if isinstance(op['kwargs'], dict) else {}
+                st.plotly_chart(pio.from_json(op['json']), **kwargs)
+            elif op['kind'] == 'image':
+                st.image(op['png'])
+            elif op['kind'] == 'call':
+                getattr(st, op['name'])(*op['args'], **op['kwargs'])
+        except Exception as e:
+            st.caption(f'⚠️ Não foi possível reproduzir uma saída ({op.get("name", op["kind"])}): {e}')